@@ -0,0 +1,71 @@
+'''
+Microbenchmark of the detection result types on frames with 1 to 200 boxes.
+
+The per-box path builds a `YOLOPrediction` (with its `TrafficSign` and `BBox`) for every box
+above the confidence threshold, like the detector did before `Detections` was introduced.
+The array path filters and serializes the boxes with `Detections`, without per-box objects.
+Sign metadata is read from the local store, so no network access is needed.
+
+Usage:
+    python -m benchmarks.detections [--boxes 1 10 50 200] [--repeat 50]
+'''
+
+from src.models.types.Detections import Detections
+from src.models.types.YOLOPrediction import YOLOPrediction
+from src.models.types.TrafficSign import load_category_mapping
+from benchmarks.utils import print_table
+import numpy as np
+import argparse
+import time
+
+
+def random_frame(n_boxes: int, rng: np.random.Generator):
+    class_ids = rng.choice(list(load_category_mapping()), size=n_boxes).astype(np.float32)
+    confidences = rng.uniform(0, 1, size=n_boxes).astype(np.float32)
+    xy = rng.uniform(50, 590, size=(n_boxes, 2))
+    wh = rng.uniform(10, 50, size=(n_boxes, 2))
+    return class_ids, confidences, np.hstack([xy, wh]).astype(np.float32)
+
+
+def per_box_path(class_ids, confidences, xywh, confidence_threshold: float) -> list:
+    predictions = []
+    for cls, conf, box in zip(class_ids, confidences, xywh):
+        if conf > confidence_threshold:
+            predictions.append(YOLOPrediction(class_id=int(cls), confidence=conf, x=box[0], y=box[1], w=box[2], h=box[3]))
+    return [prediction.to_dict() for prediction in predictions]
+
+
+def array_path(class_ids, confidences, xywh, confidence_threshold: float) -> list:
+    return Detections(class_ids, confidences, xywh).filter_confidence(confidence_threshold).to_list()
+
+
+def time_path(path, frame, confidence_threshold: float, repeat: int) -> float:
+    start = time.perf_counter()
+    for _ in range(repeat):
+        path(*frame, confidence_threshold)
+    return (time.perf_counter() - start) / repeat * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark per-box predictions against array-backed detections')
+    parser.add_argument('--boxes', type=int, nargs='+', default=[1, 5, 20, 50, 100, 200])
+    parser.add_argument('--confidence-threshold', type=float, default=0.25)
+    parser.add_argument('--repeat', type=int, default=50)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    # Load the category mapping and the sign metadata store before measuring
+    array_path(*random_frame(1, rng), args.confidence_threshold)
+    per_box_path(*random_frame(1, rng), args.confidence_threshold)
+
+    rows = []
+    for n_boxes in args.boxes:
+        frame = random_frame(n_boxes, rng)
+        per_box_ms = time_path(per_box_path, frame, args.confidence_threshold, args.repeat)
+        array_ms = time_path(array_path, frame, args.confidence_threshold, args.repeat)
+        rows.append({'boxes': n_boxes, 'per_box_ms': per_box_ms, 'array_ms': array_ms, 'speedup': per_box_ms / array_ms})
+    print_table(rows)
+
+
+if __name__ == '__main__':
+    main()
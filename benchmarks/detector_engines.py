@@ -0,0 +1,69 @@
+'''
+Benchmarks the latency, throughput and memory of the object detection engines on CPU.
+
+Every engine runs in its own subprocess so that its peak RSS is measured in isolation.
+The weights have to be exported first with `python -m src.models.export_detector`.
+
+Usage:
+    python -m benchmarks.detector_engines [--engines torch onnx openvino] [--requests 100]
+'''
+
+from benchmarks.utils import summarize_latencies, print_table
+from src.config.settings import settings
+import subprocess
+import resource
+import argparse
+import json
+import time
+import sys
+
+
+def run_engine(engine: str, image_path: str, requests: int, warmup: int) -> dict:
+    from src.models.YOLOModel import YOLOModel
+    from PIL import Image
+
+    image = Image.open(image_path).convert('RGB')
+    yolo_model = YOLOModel(engine=engine, parity_check=False)
+    for _ in range(warmup):
+        yolo_model.detect_traffic_signs(image)
+
+    latencies = []
+    start = time.perf_counter()
+    for _ in range(requests):
+        request_start = time.perf_counter()
+        yolo_model.detect_traffic_signs(image)
+        latencies.append(time.perf_counter() - request_start)
+    result = summarize_latencies(latencies, time.perf_counter() - start)
+    # ru_maxrss is in kilobytes on Linux
+    result['peak_rss_mb'] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the object detection engines')
+    parser.add_argument('--engines', nargs='+', default=['torch', 'onnx', 'openvino'])
+    parser.add_argument('--image', default='examples/example-1.jpg')
+    parser.add_argument('--requests', type=int, default=100)
+    parser.add_argument('--warmup', type=int, default=5)
+    parser.add_argument('--child', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        print(json.dumps(run_engine(args.child, args.image, args.requests, args.warmup)))
+        return
+
+    rows = []
+    for engine in args.engines:
+        process = subprocess.run([sys.executable, '-m', 'benchmarks.detector_engines', '--child', engine,
+                                  '--image', args.image, '--requests', str(args.requests), '--warmup', str(args.warmup)],
+                                 capture_output=True, text=True)
+        if process.returncode != 0:
+            print(f"Engine {engine} failed:\n{process.stderr.strip().splitlines()[-1] if process.stderr else ''}")
+            continue
+        result = json.loads(process.stdout.strip().splitlines()[-1])
+        rows.append({'engine': engine, 'image_size': f'{settings.image_width}x{settings.image_height}', **result})
+    print_table(rows)
+
+
+if __name__ == '__main__':
+    main()
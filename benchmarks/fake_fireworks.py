@@ -0,0 +1,133 @@
+'''
+Local stand-in for the Fireworks completions API, so that the LLM calls of the benchmarks never leave the machine.
+
+It answers `POST <base_url>/completions` with a fixed text after an artificial delay, as a single
+JSON completion or, with `"stream": true`, as server-sent events carrying one word each, like
+the real API. Point `FIREWORKS_BASE_URL` at it to benchmark the service with the Fireworks backend.
+
+Usage:
+    python -m benchmarks.fake_fireworks [--port 8100] [--first-token-delay 0.2] [--token-delay 0.02]
+'''
+
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import threading
+import argparse
+import json
+import time
+import re
+
+DEFAULT_RESPONSE = 'Slow down to 50 km/h and give way to the vehicles on the main road.'
+
+
+class FakeFireworksServer(ThreadingHTTPServer):
+    """
+    Class representing a local HTTP server answering completion requests like the Fireworks API.
+    """
+
+    daemon_threads = True
+
+    def __init__(self, port: int = 0, response: str = DEFAULT_RESPONSE, first_token_delay: float = 0.0, token_delay: float = 0.0):
+        """
+        Initializes the server, listening on localhost.
+
+        Parameters
+        ----------
+        port: int
+            The port to listen on, 0 for any free port.
+        response: str
+            The text of every completion.
+        first_token_delay: float
+            Seconds before the first token (or the whole completion when not streaming) is sent.
+        token_delay: float
+            Seconds between the streamed tokens. Added once per token to the delay of non-streamed completions.
+        """
+        super().__init__(('127.0.0.1', port), _CompletionHandler)
+        self.response = response
+        self.first_token_delay = first_token_delay
+        self.token_delay = token_delay
+        self.requests = 0
+        self._thread = None
+
+    @property
+    def base_url(self) -> str:
+        return f'http://127.0.0.1:{self.server_address[1]}/inference/v1'
+
+    def tokens(self):
+        return re.findall(r'\S+\s*', self.response)
+
+    def start(self) -> 'FakeFireworksServer':
+        '''
+        Serves the requests on a background thread.
+        '''
+        self._thread = threading.Thread(target=self.serve_forever, name='fake-fireworks', daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+
+class _CompletionHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    server: FakeFireworksServer
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_POST(self):
+        if not self.path.endswith('/completions'):
+            self.send_error(404)
+            return
+        request = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))) or b'{}')
+        self.server.requests += 1
+        tokens = self.server.tokens()
+        usage = {'prompt_tokens': len(request.get('prompt', '').split()), 'completion_tokens': len(tokens)}
+
+        if not request.get('stream'):
+            time.sleep(self.server.first_token_delay + self.server.token_delay * len(tokens))
+            body = json.dumps({'choices': [{'index': 0, 'text': self.server.response, 'finish_reason': 'stop'}],
+                               'usage': usage}).encode()
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+            return
+
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/event-stream')
+        self.send_header('Transfer-Encoding', 'chunked')
+        self.end_headers()
+        time.sleep(self.server.first_token_delay)
+        for i, token in enumerate(tokens):
+            if i:
+                time.sleep(self.server.token_delay)
+            self._write_chunk(f"data: {json.dumps({'choices': [{'index': 0, 'text': token}]})}\n\n".encode())
+        self._write_chunk(b'data: [DONE]\n\n')
+        self._write_chunk(b'')
+
+    def _write_chunk(self, data: bytes):
+        self.wfile.write(f'{len(data):x}\r\n'.encode() + data + b'\r\n')
+        self.wfile.flush()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Serve a fake Fireworks completions API')
+    parser.add_argument('--port', type=int, default=8100)
+    parser.add_argument('--response', default=DEFAULT_RESPONSE)
+    parser.add_argument('--first-token-delay', type=float, default=0.2)
+    parser.add_argument('--token-delay', type=float, default=0.02)
+    args = parser.parse_args()
+
+    server = FakeFireworksServer(port=args.port, response=args.response,
+                                 first_token_delay=args.first_token_delay, token_delay=args.token_delay)
+    print(f"Fake Fireworks API listening, set FIREWORKS_BASE_URL={server.base_url}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        server.server_close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,255 @@
+'''
+End-to-end benchmark suite of the prediction pipeline, runnable without network access.
+
+The cases cover the stages of a prediction, from the micro level up to the whole request:
+
+- `detect`: `YOLOModel.detect_traffic_signs` on a frame.
+- `traffic_sign`: building the `TrafficSign` of `--signs` sign codes.
+- `format_input`: `LLM._format_input` of `--signs` signs.
+- `api_predict_detect`, `api_predict_full`: `POST /api/predict` through an in-process ASGI client,
+  in `detect` mode and in `full` mode with the hint cache disabled, so that every request calls the LLM.
+
+The sign metadata store is built from a fixture page (`benchmarks/fixtures/sign_page.html`) and
+the LLM is a local fake Fireworks server (`benchmarks.fake_fireworks`). Every case runs in its own
+subprocess, so that its peak RSS is measured in isolation.
+
+The results (latency percentiles, throughput, peak RSS) are printed as a table and can be saved as
+JSON with `--output`. With `--baseline`, they are compared with a previously saved run, and the
+command exits with status 1 if a metric regressed by more than `--max-regression`.
+
+Usage:
+    python -m benchmarks.pipeline [--cases detect api_predict_full] [--requests 50] [--output results.json]
+    python -m benchmarks.pipeline --baseline results.json [--max-regression 0.2]
+'''
+
+from benchmarks.fake_fireworks import FakeFireworksServer
+from benchmarks.utils import summarize_latencies, print_table
+from src.config.settings import settings
+from typing import Callable, Dict, List
+from datetime import datetime, timezone
+import subprocess
+import tempfile
+import platform
+import resource
+import argparse
+import asyncio
+import json
+import time
+import sys
+import os
+
+CASES = ('detect', 'traffic_sign', 'format_input', 'api_predict_detect', 'api_predict_full')
+
+FIXTURE_PAGE = os.path.join(os.path.dirname(__file__), 'fixtures', 'sign_page.html')
+
+# Metrics compared with the baseline, and whether higher values are better
+COMPARED_METRICS = {'p50_ms': False, 'p99_ms': False, 'throughput_rps': True, 'peak_rss_mb': False}
+
+LLM_MODEL_NAME = 'llama-v3p1-405b-instruct'
+
+
+def build_fixture_store(directory: str) -> str:
+    '''
+    Writes a fixture page for every sign code of the category mapping and builds the sign metadata store from them.
+
+    Returns
+    -------
+    str
+        The path of the built store.
+    '''
+    from src.models.SignMetadataStore import SignMetadataStore, fixture_page_fetcher
+    from src.models.types.TrafficSign import load_category_mapping
+
+    with open(FIXTURE_PAGE, 'r', encoding='utf-8') as f:
+        template = f.read()
+
+    pages_dir = os.path.join(directory, 'sign_pages')
+    os.makedirs(pages_dir, exist_ok=True)
+    sign_codes = sorted(set(load_category_mapping().values()))
+    for sign_code in sign_codes:
+        category = sign_code.split('.')[0]
+        with open(os.path.join(pages_dir, f'{sign_code}.html'), 'w', encoding='utf-8') as f:
+            f.write(template.format(sign_code=sign_code, name=f'Benchmark sign {sign_code}', category=f'Category {category}',
+                                    description=f'Sign {sign_code} of category {category}. ' * 8))
+
+    path = os.path.join(directory, 'sign_metadata.json')
+    SignMetadataStore(path=path).build(sign_codes, fixture_page_fetcher(pages_dir)).save()
+    return path
+
+
+def time_requests(request: Callable[[], object], requests: int, warmup: int) -> dict:
+    for _ in range(warmup):
+        request()
+    latencies = []
+    start = time.perf_counter()
+    for _ in range(requests):
+        request_start = time.perf_counter()
+        request()
+        latencies.append(time.perf_counter() - request_start)
+    return summarize_latencies(latencies, time.perf_counter() - start)
+
+
+async def time_api_requests(mode: str, image_path: str, requests: int, warmup: int, concurrency: int) -> dict:
+    import httpx
+    from src.models import api
+
+    await api.start_service()
+    if api.service_state['status'] != 'ready':
+        raise RuntimeError(f"Service failed to start: {api.service_state['error']}")
+
+    with open(image_path, 'rb') as f:
+        image = f.read()
+
+    latencies = []
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=api.app), base_url='http://benchmark', timeout=None) as client:
+        async def request():
+            response = await client.post('/api/predict', params={'mode': mode, 'llm_model_name': LLM_MODEL_NAME},
+                                         files={'image': ('frame.jpg', image, 'image/jpeg')})
+            response.raise_for_status()
+
+        async def client_loop(count: int):
+            for _ in range(count):
+                request_start = time.perf_counter()
+                await request()
+                latencies.append(time.perf_counter() - request_start)
+
+        for _ in range(warmup):
+            await request()
+        start = time.perf_counter()
+        await asyncio.gather(*(client_loop(requests // concurrency + (i < requests % concurrency)) for i in range(concurrency)))
+        elapsed = time.perf_counter() - start
+
+    api.driving_assistant.close()
+    return summarize_latencies(latencies, elapsed)
+
+
+def run_case(case: str, image_path: str, requests: int, warmup: int, signs: int, concurrency: int) -> dict:
+    from src.models.types.TrafficSign import TrafficSign, load_category_mapping
+
+    sign_codes = sorted(set(load_category_mapping().values()))[:signs]
+
+    if case == 'detect':
+        from src.models.YOLOModel import YOLOModel
+        from PIL import Image
+
+        image = Image.open(image_path).convert('RGB')
+        yolo_model = YOLOModel(parity_check=False)
+        result = time_requests(lambda: yolo_model.detect_traffic_signs(image), requests, warmup)
+    elif case == 'traffic_sign':
+        result = time_requests(lambda: [TrafficSign(sign_code=sign_code) for sign_code in sign_codes], requests, warmup)
+    elif case == 'format_input':
+        from src.models.LLM import LLM
+
+        llm = LLM(llm_model_name=LLM_MODEL_NAME)
+        road_signs = [TrafficSign(sign_code=sign_code) for sign_code in sign_codes]
+        result = time_requests(lambda: llm._format_input(road_signs), requests, warmup)
+    elif case in ('api_predict_detect', 'api_predict_full'):
+        mode = case.rsplit('_', 1)[-1]
+        result = asyncio.run(time_api_requests(mode, image_path, requests, warmup, concurrency))
+    else:
+        raise ValueError(f"Unknown case {case}, expected one of {CASES}")
+
+    # ru_maxrss is in kilobytes on Linux
+    result['peak_rss_mb'] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    return result
+
+
+def compare(results: Dict[str, dict], baseline: Dict[str, dict], max_regression: float) -> List[dict]:
+    '''
+    Compares the results with a baseline run.
+
+    Returns
+    -------
+    List[dict]
+        A row per case and compared metric, with the relative change and whether it is a regression.
+    '''
+    rows = []
+    for case, result in results.items():
+        if case not in baseline:
+            continue
+        for metric, higher_is_better in COMPARED_METRICS.items():
+            current, previous = result.get(metric), baseline[case].get(metric)
+            if current is None or not previous:
+                continue
+            change = (current - previous) / previous
+            regression = -change > max_regression if higher_is_better else change > max_regression
+            rows.append({'case': case, 'metric': metric, 'baseline': float(previous), 'current': float(current),
+                         'change_pct': change * 100, 'status': 'REGRESSION' if regression else 'ok'})
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the prediction pipeline end to end, without network access')
+    parser.add_argument('--cases', nargs='+', default=list(CASES), choices=CASES)
+    parser.add_argument('--image', default='examples/example-1.jpg')
+    parser.add_argument('--requests', type=int, default=50)
+    parser.add_argument('--warmup', type=int, default=3)
+    parser.add_argument('--signs', type=int, default=10, help='Number of signs of the traffic_sign and format_input cases')
+    parser.add_argument('--concurrency', type=int, default=1, help='Number of concurrent clients of the API cases')
+    parser.add_argument('--llm-first-token-delay', type=float, default=0.2, help='Latency of the fake Fireworks server')
+    parser.add_argument('--llm-token-delay', type=float, default=0.0)
+    parser.add_argument('--output', help='Save the results as JSON, e.g. to use them as a baseline later')
+    parser.add_argument('--baseline', help='JSON results of a previous run to compare with')
+    parser.add_argument('--max-regression', type=float, default=0.2, help='Relative change of a metric reported as a regression')
+    parser.add_argument('--child', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        print(json.dumps(run_case(args.child, args.image, args.requests, args.warmup, args.signs, args.concurrency)))
+        return
+
+    results = {}
+    with tempfile.TemporaryDirectory() as directory:
+        server = FakeFireworksServer(first_token_delay=args.llm_first_token_delay, token_delay=args.llm_token_delay).start()
+        env = {
+            **os.environ,
+            'SIGN_METADATA_PATH': build_fixture_store(directory),
+            'LLM_BACKEND': 'fireworks',
+            'FIREWORKS_BASE_URL': server.base_url,
+            'FIREWORKS_API_KEY': 'benchmark',
+            'HINT_CACHE_SIZE': '0',
+            'HINT_CACHE_PATH': '',
+            'DETECTOR_PARITY_CHECK': 'false',
+            'INFERENCE_PROCESSES': '0',
+        }
+        try:
+            for case in args.cases:
+                llm_requests = server.requests
+                process = subprocess.run([sys.executable, '-m', 'benchmarks.pipeline', '--child', case, '--image', args.image,
+                                          '--requests', str(args.requests), '--warmup', str(args.warmup),
+                                          '--signs', str(args.signs), '--concurrency', str(args.concurrency)],
+                                         capture_output=True, text=True, env=env)
+                if process.returncode != 0:
+                    print(f"Case {case} failed:\n{process.stderr.strip().splitlines()[-1] if process.stderr else ''}")
+                    continue
+                results[case] = json.loads(process.stdout.strip().splitlines()[-1])
+                results[case]['llm_requests'] = server.requests - llm_requests
+        finally:
+            server.stop()
+
+    print_table([{'case': case, **result} for case, result in results.items()])
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump({
+                'created_at': datetime.now(timezone.utc).isoformat(),
+                'python': platform.python_version(),
+                'platform': platform.platform(),
+                'config': {**{key: value for key, value in vars(args).items() if key not in ('child', 'output', 'baseline')},
+                           'image_size': [settings.image_width, settings.image_height], 'detector_engine': settings.detector_engine},
+                'results': results,
+            }, f, indent=1)
+        print(f"Results saved to {args.output}")
+
+    if args.baseline:
+        with open(args.baseline, 'r', encoding='utf-8') as f:
+            baseline = json.load(f)['results']
+        rows = compare(results, baseline, args.max_regression)
+        print()
+        print_table(rows)
+        if any(row['status'] == 'REGRESSION' for row in rows):
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,128 @@
+'''
+Simulates the scheduling of the detection and LLM stages under a mixed interactive and batch load.
+
+The stages are `EDFScheduler`s of `--detect-slots` and `--llm-slots` slots, as in the server, whose
+work is simulated by sleeping for exponentially distributed service times, so that the benchmark runs
+without the model weights nor the LLM. Interactive requests arrive at `--interactive-rps` and batch
+requests (e.g. the re-processing of an archive) at `--batch-rps`, both as Poisson processes. A
+`--safety-fraction` of the interactive frames contain a priority sign, and are raised to the safety
+class after detection, like in `DrivingAssistant.adetect`.
+
+The same arrivals and service times are replayed with every policy (`fifo`, `edf`), and the latency
+percentiles and the number of dropped requests are reported per policy and priority class.
+
+Usage:
+    python -m benchmarks.scheduling [--duration 10] [--interactive-rps 5] [--batch-rps 36] [--policies fifo edf]
+'''
+
+from src.models.RequestScheduler import DeadlineExceededError, EDFScheduler, RequestDeadline, start_request
+from benchmarks.utils import summarize_latencies, print_table
+from typing import Dict, List, NamedTuple, Optional
+import argparse
+import asyncio
+import random
+import time
+
+
+class SimulatedRequest(NamedTuple):
+    arrival: float
+    priority: str
+    safety: bool
+    detect_s: float
+    llm_s: float
+
+
+def generate_requests(duration: float, interactive_rps: float, batch_rps: float, safety_fraction: float,
+                      detect_ms: float, llm_ms: float, seed: int) -> List[SimulatedRequest]:
+    '''
+    Generates the arrivals and the service times of the requests of a run.
+    '''
+    rng = random.Random(seed)
+    requests = []
+    for priority, rps in (('interactive', interactive_rps), ('batch', batch_rps)):
+        arrival = rng.expovariate(rps) if rps > 0 else duration
+        while arrival < duration:
+            requests.append(SimulatedRequest(arrival, priority, priority == 'interactive' and rng.random() < safety_fraction,
+                                             rng.expovariate(1000 / detect_ms), rng.expovariate(1000 / llm_ms)))
+            arrival += rng.expovariate(rps)
+    return sorted(requests)
+
+
+async def simulate(requests: List[SimulatedRequest], policy: str, detect_slots: int, llm_slots: int) -> Dict[str, dict]:
+    '''
+    Replays the requests through the two stages with the given policy.
+
+    Returns
+    -------
+    Dict[str, dict]
+        The latencies in seconds of the completed requests, the number of dropped ones and the duration of the run, by priority class.
+    '''
+    detect = EDFScheduler('detect', detect_slots, policy=policy)
+    llm = EDFScheduler('llm', llm_slots, policy=policy)
+    results = {priority: {'latencies': [], 'dropped': 0} for priority in ('safety', 'interactive', 'batch')}
+
+    async def run(request: SimulatedRequest):
+        # The class a request is reported in is the one it finishes in
+        deadline = start_request(RequestDeadline.create(request.priority if request.priority == 'batch' else None))
+        try:
+            async with detect:
+                await asyncio.sleep(request.detect_s)
+            if request.safety:
+                deadline.escalate(['2.1'])
+            async with llm:
+                await asyncio.sleep(request.llm_s)
+        except DeadlineExceededError:
+            results[deadline.priority]['dropped'] += 1
+            return
+        results[deadline.priority]['latencies'].append(time.monotonic() - deadline.arrived_at)
+
+    start = time.monotonic()
+    tasks = []
+    for request in requests:
+        await asyncio.sleep(max(0.0, start + request.arrival - time.monotonic()))
+        tasks.append(asyncio.create_task(run(request)))
+    await asyncio.gather(*tasks)
+    elapsed = time.monotonic() - start
+    return {priority: {**result, 'elapsed': elapsed} for priority, result in results.items()}
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Simulate the scheduling of a mixed interactive and batch load')
+    parser.add_argument('--duration', type=float, default=10, help='Seconds of arrivals of each run')
+    parser.add_argument('--interactive-rps', type=float, default=5)
+    parser.add_argument('--batch-rps', type=float, default=36)
+    parser.add_argument('--safety-fraction', type=float, default=0.2, help='Fraction of the interactive frames containing a priority sign')
+    parser.add_argument('--detect-slots', type=int, default=2, help='Number of inference workers')
+    parser.add_argument('--detect-ms', type=float, default=40, help='Mean detection time')
+    parser.add_argument('--llm-slots', type=int, default=8, help='Number of concurrent LLM calls')
+    parser.add_argument('--llm-ms', type=float, default=400, help='Mean LLM call time')
+    parser.add_argument('--policies', nargs='+', default=['fifo', 'edf'], choices=['fifo', 'edf'])
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    requests = generate_requests(args.duration, args.interactive_rps, args.batch_rps, args.safety_fraction,
+                                 args.detect_ms, args.llm_ms, args.seed)
+    utilization = {
+        'detect': sum(request.detect_s for request in requests) / (args.duration * args.detect_slots),
+        'llm': sum(request.llm_s for request in requests) / (args.duration * args.llm_slots),
+    }
+    print(f"{len(requests)} requests, utilization: " + ', '.join(f'{stage} {load:.0%}' for stage, load in utilization.items()))
+
+    rows = []
+    p99: Dict[str, Optional[float]] = {}
+    for policy in args.policies:
+        results = asyncio.run(simulate(requests, policy, args.detect_slots, args.llm_slots))
+        for priority, result in results.items():
+            summary = summarize_latencies(result['latencies'], result['elapsed'])
+            rows.append({'policy': policy, 'class': priority, 'completed': summary['requests'], 'dropped': result['dropped'],
+                         'p50_ms': summary['p50_ms'], 'p99_ms': summary['p99_ms']})
+            if priority == 'interactive':
+                p99[policy] = summary['p99_ms'] if summary['requests'] else None
+    print_table(rows)
+
+    if p99.get('fifo') and p99.get('edf'):
+        print(f"\nInteractive p99: {p99['fifo']:.0f} ms with fifo, {p99['edf']:.0f} ms with edf ({p99['fifo'] / p99['edf']:.1f}x)")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,60 @@
+'''
+Compares whole-frame object detection with tiled inference on CPU: latency per frame and number of detected signs.
+
+Every configuration runs on the same frames, so more detections at the same confidence threshold
+mostly means small signs that the whole downscaled frame loses.
+
+Usage:
+    python -m benchmarks.tiled_inference [--images examples] [--grids 1x1 2x1 2x2 3x2] [--roi 0.4 0 1 0.7]
+'''
+
+from benchmarks.utils import summarize_latencies, print_table
+from src.models.FrameTiler import FrameTiler
+from src.config.settings import settings
+from PIL import Image
+import argparse
+import time
+import os
+
+
+def run_config(yolo_model, images, confidence_threshold: float) -> dict:
+    detections = 0
+    latencies = []
+    start = time.perf_counter()
+    for image in images:
+        request_start = time.perf_counter()
+        detections += len(yolo_model.detect_traffic_signs(image, confidence_threshold=confidence_threshold))
+        latencies.append(time.perf_counter() - request_start)
+    result = summarize_latencies(latencies, time.perf_counter() - start)
+    result['detections_per_frame'] = detections / len(images)
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark tiled object detection')
+    parser.add_argument('--images', default='examples', help='Directory of frames, ideally high-resolution dashcam frames')
+    parser.add_argument('--grids', nargs='+', default=['2x1', '2x2', '3x2'], help='Tile grids as <columns>x<rows>')
+    parser.add_argument('--roi', type=float, nargs=4, default=list(settings.tiling_roi), help='Region of interest: left top right bottom')
+    parser.add_argument('--overlap', type=float, default=settings.tiling_overlap)
+    parser.add_argument('--confidence-threshold', type=float, default=settings.confidence_threshold)
+    args = parser.parse_args()
+
+    from src.models.YOLOModel import YOLOModel
+
+    images = [Image.open(os.path.join(args.images, name)).convert('RGB') for name in sorted(os.listdir(args.images))
+              if name.lower().endswith(('.jpg', '.jpeg', '.png'))]
+    yolo_model = YOLOModel(parity_check=False)
+    yolo_model.tiler = None
+    yolo_model.detect_traffic_signs(images[0])
+
+    rows = [{'grid': 'whole frame', 'tiles': 1, **run_config(yolo_model, images, args.confidence_threshold)}]
+    for grid in args.grids:
+        columns, tile_rows = (int(v) for v in grid.split('x'))
+        yolo_model.tiler = FrameTiler(roi=tuple(args.roi), grid=(columns, tile_rows), overlap=args.overlap)
+        rows.append({'grid': grid, 'tiles': yolo_model.tiler.tiles_per_frame,
+                     **run_config(yolo_model, images, args.confidence_threshold)})
+    print_table(rows)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,45 @@
+'''
+Helpers shared by the benchmarks
+'''
+
+from typing import Dict, List
+import numpy as np
+
+
+def summarize_latencies(latencies: List[float], elapsed: float) -> Dict[str, float]:
+    '''
+    Summarizes request latencies measured over a run.
+
+    Parameters
+    ----------
+    latencies: List[float]
+        The latency of each request in seconds.
+    elapsed: float
+        The wall-clock duration of the run in seconds.
+
+    Returns
+    -------
+    Dict[str, float]
+        The throughput in requests per second and the p50/p99 latencies in milliseconds.
+    '''
+    latencies_ms = np.asarray(latencies) * 1000
+    return {
+        'requests': len(latencies),
+        'throughput_rps': len(latencies) / elapsed if elapsed else 0.0,
+        'p50_ms': float(np.percentile(latencies_ms, 50)) if len(latencies) else 0.0,
+        'p99_ms': float(np.percentile(latencies_ms, 99)) if len(latencies) else 0.0,
+    }
+
+
+def print_table(rows: List[Dict[str, object]]):
+    '''
+    Prints a list of result rows as an aligned text table.
+    '''
+    if not rows:
+        return
+    columns = list(rows[0].keys())
+    cells = [[f'{row[c]:.2f}' if isinstance(row[c], float) else str(row[c]) for c in columns] for row in rows]
+    widths = [max(len(c), *(len(r[i]) for r in cells)) for i, c in enumerate(columns)]
+    print('  '.join(c.rjust(w) for c, w in zip(columns, widths)))
+    for r in cells:
+        print('  '.join(v.rjust(w) for v, w in zip(r, widths)))
@@ -0,0 +1,98 @@
+'''
+Load test of the inference processes, showing how the throughput scales from 1 to N processes.
+
+Every configuration runs in its own subprocess, which loads the model once and forks the
+inference processes, driven by `2 * processes` client threads. The proportional set size (PSS)
+of the processes shows how much memory they really use, with the shared weights split between them.
+
+Usage:
+    python -m benchmarks.worker_pool [--processes 1 2 4 8] [--requests 50]
+'''
+
+from benchmarks.utils import summarize_latencies, print_table
+from concurrent.futures import ThreadPoolExecutor
+from src.config.settings import settings
+from typing import Optional
+import subprocess
+import argparse
+import json
+import time
+import sys
+import os
+
+
+def _pss_mb(pid: int) -> Optional[float]:
+    try:
+        with open(f'/proc/{pid}/smaps_rollup') as f:
+            for line in f:
+                if line.startswith('Pss:'):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        return None
+    return None
+
+
+def run_pool(processes: int, image_path: str, requests: int) -> dict:
+    from src.models.YOLOModel import YOLOModel
+    from src.models.WorkerPool import DetectionWorkerPool
+    from PIL import Image
+    import torch
+
+    torch.set_num_threads(1)
+    image = Image.open(image_path).convert('RGB')
+    pool = DetectionWorkerPool(YOLOModel(parity_check=False), processes=processes)
+    concurrency = 2 * processes
+
+    # Wait for the processes to warm up before measuring
+    with ThreadPoolExecutor(max_workers=concurrency) as clients:
+        list(clients.map(lambda _: pool.detect_traffic_signs(image), range(concurrency)))
+
+    def client():
+        latencies = []
+        for _ in range(requests):
+            start = time.perf_counter()
+            pool.detect_traffic_signs(image)
+            latencies.append(time.perf_counter() - start)
+        return latencies
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as clients:
+        latencies = [latency for result in [clients.submit(client) for _ in range(concurrency)] for latency in result.result()]
+    result = summarize_latencies(latencies, time.perf_counter() - start)
+
+    pss = [_pss_mb(pid) for pid in [os.getpid()] + [worker.pid for worker in pool._workers]]
+    result['pss_mb'] = sum(pss) if None not in pss else None
+    pool.close()
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Load test the inference processes')
+    parser.add_argument('--image', default='examples/example-1.jpg', help='Image sent with every request')
+    parser.add_argument('--processes', type=int, nargs='+', default=[n for n in (1, 2, 4, 8) if n <= (os.cpu_count() or 1)])
+    parser.add_argument('--requests', type=int, default=50, help='Number of requests sent by each client')
+    parser.add_argument('--child', type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        print(json.dumps(run_pool(args.child, args.image, args.requests)))
+        return
+
+    rows = []
+    for processes in args.processes:
+        process = subprocess.run([sys.executable, '-m', 'benchmarks.worker_pool', '--child', str(processes),
+                                  '--image', args.image, '--requests', str(args.requests)],
+                                 capture_output=True, text=True)
+        if process.returncode != 0:
+            print(f"{processes} processes failed:\n{process.stderr.strip().splitlines()[-1] if process.stderr else ''}")
+            continue
+        result = json.loads(process.stdout.strip().splitlines()[-1])
+        rows.append({'processes': processes, 'image_size': f'{settings.image_width}x{settings.image_height}', **result})
+
+    for row in rows:
+        row['speedup'] = row['throughput_rps'] / rows[0]['throughput_rps'] if rows[0]['throughput_rps'] else 0.0
+    print_table(rows)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,75 @@
+'''
+Benchmarks the throughput and latency of micro-batched YOLO inference on CPU.
+
+Every configuration is driven by `--concurrency` client threads, each sending `--requests`
+detection requests back to back. The unbatched baseline calls the model directly, serialized
+by a lock like a single inference worker.
+
+Usage:
+    python -m benchmarks.yolo_batching [--batch-sizes 1 2 4 8] [--wait-ms 0 5 10] [--concurrency 8]
+'''
+
+from concurrent.futures import ThreadPoolExecutor
+from src.models.YOLOModel import YOLOModel
+from src.models.BatchScheduler import BatchScheduler
+from src.config.settings import settings
+from benchmarks.utils import summarize_latencies, print_table
+from PIL import Image
+import threading
+import argparse
+import time
+
+
+def run_clients(detect, image: Image, concurrency: int, requests: int) -> dict:
+    def client():
+        latencies = []
+        for _ in range(requests):
+            start = time.perf_counter()
+            detect(image)
+            latencies.append(time.perf_counter() - start)
+        return latencies
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        latencies = [latency for result in [pool.submit(client) for _ in range(concurrency)] for latency in result.result()]
+    return summarize_latencies(latencies, time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark micro-batched YOLO inference')
+    parser.add_argument('--image', default='examples/example-1.jpg', help='Image sent with every request')
+    parser.add_argument('--batch-sizes', type=int, nargs='+', default=[1, 2, 4, 8])
+    parser.add_argument('--wait-ms', type=float, nargs='+', default=[0, 5, 10])
+    parser.add_argument('--concurrency', type=int, default=8, help='Number of concurrent clients')
+    parser.add_argument('--requests', type=int, default=10, help='Number of requests sent by each client')
+    args = parser.parse_args()
+
+    image = Image.open(args.image).convert('RGB').resize((settings.image_width, settings.image_height))
+    yolo_model = YOLOModel()
+
+    # Warm up the model before measuring
+    for _ in range(3):
+        yolo_model.detect_traffic_signs(image)
+
+    lock = threading.Lock()
+
+    def detect_unbatched(image):
+        with lock:
+            return yolo_model.detect_traffic_signs(image)
+
+    rows = [{'batch_size': '-', 'wait_ms': '-', **run_clients(detect_unbatched, image, args.concurrency, args.requests)}]
+
+    for batch_size in args.batch_sizes:
+        for wait_ms in args.wait_ms:
+            scheduler = BatchScheduler(yolo_model, max_batch_size=batch_size, max_wait_ms=wait_ms)
+            result = run_clients(scheduler.detect_traffic_signs, image, args.concurrency, args.requests)
+            result['avg_batch'] = scheduler.stats()['avg_batch_size']
+            scheduler.close()
+            rows.append({'batch_size': batch_size, 'wait_ms': wait_ms, **result})
+
+    rows[0]['avg_batch'] = 1.0
+    print_table(rows)
+
+
+if __name__ == '__main__':
+    main()
@@ -4,8 +4,8 @@ Configurations for the Object Detection Model
 
 from pydantic_settings import BaseSettings, SettingsConfigDict
 from pydantic import Field
+from typing import Dict, List, Literal, Optional, Tuple
 import os
-import gdown
 
 
 class Settings(BaseSettings):
@@ -17,20 +17,99 @@ class Settings(BaseSettings):
     # Model Parameters
     obj_detect_weights_path: str = Field('src/weights/traffic_signs_detection.pt', alias='OBJ_DETECT_WEIGHTS_PATH', description='Path to the model weights')
     category_mapping_path: str = Field('src/config/class_to_sign.json', alias='CATEGORY_MAPPING_PATH', description='Path to the category mapping json file')
+    sign_metadata_path: str = Field('src/config/sign_metadata.json', alias='SIGN_METADATA_PATH', description='Path to the sign metadata store built by `python -m src.models.SignMetadataStore`')
+    detector_engine: Literal['torch', 'onnx', 'openvino'] = Field('torch', alias='DETECTOR_ENGINE', description='Inference engine running the object detection model')
+    detector_parity_check: bool = Field(True, alias='DETECTOR_PARITY_CHECK', description='Check at startup that an exported model gives the same detections as the PyTorch one')
+    detector_parity_image: str = Field('examples/example-1.jpg', alias='DETECTOR_PARITY_IMAGE', description='Image used for the detector parity check')
     confidence_threshold: float = Field(0.5, alias='CONFIDENCE_THRESHOLD', description='Confidence threshold for detections')
+    iou_threshold: float = Field(0.7, alias='IOU_THRESHOLD', description='IoU above which overlapping detections are suppressed by NMS')
+    max_detections: int = Field(300, alias='MAX_DETECTIONS', description='Maximum number of detections per image')
+    detection_categories: Optional[List[str]] = Field(None, alias='DETECTION_CATEGORIES', description='Sign categories detected by default (e.g. ["3"] for the prohibitory signs), all of them if not set')
     max_tokens: int = Field(100, alias='MAX_TOKENS', description='Maximum number of tokens to generate')
     temperature: float = Field(0, alias='TEMPERATURE', description='Temperature for completition generation')
+    prompt_max_tokens: int = Field(400, alias='PROMPT_MAX_TOKENS', description='Estimated number of tokens the road signs may take in the prompt, the least important signs are shortened or dropped above it')
+    prompt_description_chars: int = Field(300, alias='PROMPT_DESCRIPTION_CHARS', description='Number of characters the sign descriptions are truncated to in the prompt')
+    prompt_category_priority: List[str] = Field(['2', '3', '4', '1', '5', '7', '6'], alias='PROMPT_CATEGORY_PRIORITY', description='Sign categories from the most to the least important, the order of the signs in the prompt')
+    log_prompt_tokens: bool = Field(False, alias='LOG_PROMPT_TOKENS', description='Print the estimated number of prompt tokens of every LLM request')
+
+    # LLM Client Parameters
+    llm_backend: Literal['fireworks', 'fake'] = Field('fireworks', alias='LLM_BACKEND', description='Backend generating the hints, `fake` answers locally with FAKE_LLM_RESPONSE')
+    fake_llm_response: str = Field('Drive carefully and follow the road signs.', alias='FAKE_LLM_RESPONSE', description='Text streamed by the fake LLM backend')
+    fake_llm_first_token_delay: float = Field(0.2, alias='FAKE_LLM_FIRST_TOKEN_DELAY', description='Seconds the fake LLM backend waits before its first token')
+    fake_llm_token_delay: float = Field(0.05, alias='FAKE_LLM_TOKEN_DELAY', description='Seconds the fake LLM backend waits between tokens')
+    fireworks_base_url: str = Field('https://api.fireworks.ai/inference/v1', alias='FIREWORKS_BASE_URL', description='Base URL of the Fireworks inference API')
+    llm_warm_up: bool = Field(False, alias='LLM_WARM_UP', description='Build the clients of all the available LLMs at startup')
+    llm_max_connections: int = Field(32, alias='LLM_MAX_CONNECTIONS', description='Maximum number of pooled connections to the Fireworks API')
+    llm_keepalive_expiry: float = Field(60, alias='LLM_KEEPALIVE_EXPIRY', description='Seconds an idle connection to the Fireworks API is kept alive')
+    llm_http_timeout: float = Field(60, alias='LLM_HTTP_TIMEOUT', description='Timeout in seconds of the requests to the Fireworks API')
+
+    # LLM Resilience Parameters
+    llm_timeout: float = Field(8, alias='LLM_TIMEOUT', description='Seconds an LLM call may take before it is abandoned and retried')
+    llm_model_timeouts: Dict[str, float] = Field({}, alias='LLM_MODEL_TIMEOUTS', description='Per-model LLM_TIMEOUT overrides, e.g. {"llama-v3p1-405b-instruct": 10}')
+    llm_retries: int = Field(1, alias='LLM_RETRIES', description='Number of retries of an LLM call that timed out or failed with a transient error')
+    llm_retry_backoff: float = Field(0.2, alias='LLM_RETRY_BACKOFF', description='Base of the exponential backoff in seconds between retries, jittered')
+    llm_hedge_model: Optional[str] = Field(None, alias='LLM_HEDGE_MODEL', description='Smaller model the prompt is also sent to when the requested one is slow, e.g. llama-v3p1-8b-instruct')
+    llm_hedge_delay: float = Field(1.5, alias='LLM_HEDGE_DELAY', description='Seconds without an answer after which the prompt is also sent to LLM_HEDGE_MODEL')
+    llm_deadline: float = Field(12, alias='LLM_DEADLINE', description='Seconds after which the hints are generated from the sign descriptions instead of the LLM')
+    llm_fallback: bool = Field(True, alias='LLM_FALLBACK', description='Answer with hints generated from the sign descriptions when every LLM call failed')
+
+    # Hint Cache Parameters
+    hint_cache_size: int = Field(1024, alias='HINT_CACHE_SIZE', description='Maximum number of generated hints cached in memory')
+    hint_cache_ttl: Optional[float] = Field(86400, alias='HINT_CACHE_TTL', description='Seconds a cached hint stays valid')
+    hint_cache_path: Optional[str] = Field(None, alias='HINT_CACHE_PATH', description='Path to an SQLite database persisting the cached hints')
+    hint_cache_disk_size: int = Field(100000, alias='HINT_CACHE_DISK_SIZE', description='Maximum number of cached hints persisted to the SQLite database')
+    frame_cache_size: int = Field(256, alias='FRAME_CACHE_SIZE', description='Maximum number of prediction results cached by frame content, 0 disables the frame cache')
+    frame_cache_ttl: Optional[float] = Field(300, alias='FRAME_CACHE_TTL', description='Seconds a prediction result stays in the frame cache')
+    frame_cache_max_distance: Optional[int] = Field(None, alias='FRAME_CACHE_MAX_DISTANCE', description='Maximum Hamming distance between the 64-bit difference hashes of near-identical frames sharing a cached result, identical frames only if not set')
+    hint_library: bool = Field(True, alias='HINT_LIBRARY', description='Answer the sign sets covered by the pregenerated hint library without calling the LLM')
+    hint_library_path: str = Field('src/weights/hint_library.json', alias='HINT_LIBRARY_PATH', description='Path to the hint library generated by `python -m src.models.HintLibrary`')
 
     # Image Parameters
     image_width: int = Field(640, alias='IMAGE_WIDTH', description='Width of the input image')
     image_height: int = Field(640, alias='IMAGE_HEIGHT', description='Height of the input image')
 
+    # Inference Parameters
+    inference_workers: int = Field(1, alias='INFERENCE_WORKERS', description='Number of worker threads running object detection, the calls to the model of the server process run one at a time whatever their number')
+    inference_queue_size: int = Field(16, alias='INFERENCE_QUEUE_SIZE', description='Maximum number of requests waiting for a free inference worker')
+    inference_retry_after: int = Field(1, alias='INFERENCE_RETRY_AFTER', description='Seconds clients are asked to wait when the inference queue is full')
+    yolo_batching: bool = Field(False, alias='YOLO_BATCHING', description='Batch object detection across concurrent requests')
+    yolo_max_batch_size: int = Field(8, alias='YOLO_MAX_BATCH_SIZE', description='Maximum number of images in a detection batch')
+    yolo_max_wait_ms: float = Field(5, alias='YOLO_MAX_WAIT_MS', description='Maximum time in milliseconds to wait for a detection batch to fill up')
+    inference_processes: int = Field(0, alias='INFERENCE_PROCESSES', description='Number of processes running object detection, forked after the model weights are loaded. 0 runs it in the server process')
+    inference_process_threads: int = Field(1, alias='INFERENCE_PROCESS_THREADS', description='Number of PyTorch threads of each inference process')
+    inference_process_timeout: float = Field(30, alias='INFERENCE_PROCESS_TIMEOUT', description='Seconds an inference process may take to answer a frame, if the deadline of the request is not earlier')
+    inference_process_max_timeouts: int = Field(2, alias='INFERENCE_PROCESS_MAX_TIMEOUTS', description='Number of INFERENCE_PROCESS_TIMEOUT periods in a row an inference process may spend on its frames without answering before it is killed and replaced')
+    inference_slot_bytes: int = Field(1920 * 1080 * 3, alias='INFERENCE_SLOT_BYTES', description='Size of the shared memory buffers handing frames to the inference processes, larger frames are downscaled')
+
+    # Scheduling Parameters
+    scheduling_policy: Literal['edf', 'fifo'] = Field('edf', alias='SCHEDULING_POLICY', description='Order the requests waiting for an inference worker or an LLM slot are served in, earliest deadline first or arrival order')
+    default_priority: Literal['safety', 'interactive', 'batch'] = Field('interactive', alias='DEFAULT_PRIORITY', description='Priority class of the requests that do not supply one')
+    priority_deadlines_ms: Dict[str, float] = Field({'safety': 1500, 'interactive': 5000, 'batch': 600000}, alias='PRIORITY_DEADLINES_MS', description='Default deadline in milliseconds of each priority class, after which a request is dropped instead of computed. The classes not listed have no deadline')
+    safety_sign_categories: List[str] = Field(['2'], alias='SAFETY_SIGN_CATEGORIES', description='Sign categories (e.g. "2" for the priority signs: stop, give way) raising the requests they are detected in to the safety class')
+    llm_concurrency: int = Field(16, alias='LLM_CONCURRENCY', description='Maximum number of concurrent LLM calls of the asynchronous endpoints, 0 for no limit and no scheduling of the LLM stage')
+
+    # Tiled Inference Parameters
+    detector_tiling: bool = Field(False, alias='DETECTOR_TILING', description='Run object detection on tiles of a region of interest of the frame instead of the whole downscaled frame')
+    tiling_roi: Tuple[float, float, float, float] = Field((0.0, 0.0, 1.0, 1.0), alias='TILING_ROI', description='Region of interest (left, top, right, bottom) normalized by the frame size, e.g. [0.4, 0.0, 1.0, 0.7] for the right and upper parts')
+    tiling_grid: Tuple[int, int] = Field((2, 2), alias='TILING_GRID', description='Number of tile columns and rows covering the region of interest')
+    tiling_overlap: float = Field(0.2, alias='TILING_OVERLAP', description='Fraction of a tile overlapping its neighbours')
+    tiling_full_frame: bool = Field(True, alias='TILING_FULL_FRAME', description='Also run object detection on the whole frame, for the signs larger than a tile')
+    tiling_merge_threshold: float = Field(0.5, alias='TILING_MERGE_THRESHOLD', description='Intersection over the smaller box above which detections from different tiles are merged')
+
+    # Tracking Parameters
+    tracker_iou_threshold: float = Field(0.3, alias='TRACKER_IOU_THRESHOLD', description='Minimum IoU for a detection to be matched to a tracked sign')
+    tracker_min_hits: int = Field(3, alias='TRACKER_MIN_HITS', description='Number of frames a sign has to be detected in before it is confirmed')
+    tracker_max_missed: int = Field(5, alias='TRACKER_MAX_MISSED', description='Number of consecutive frames a tracked sign survives without being detected')
+
     # Server Parameters
     host: str = Field('0.0.0.0', alias='API_HOST', description='Host for the FastAPI server')
     port: int = Field(8000, alias='API_PORT', description='Port for the FastAPI server')
+    workers: int = Field(1, alias='API_WORKERS', description='Number of server processes, forked after the model weights are loaded')
+    warm_up_iterations: int = Field(1, alias='WARM_UP_ITERATIONS', description='Number of object detection runs on a dummy frame before the server reports ready')
+    trace_requests: bool = Field(False, alias='TRACE_REQUESTS', description='Return the stage durations of every request in a Server-Timing header, not only of the requests with an X-Trace header')
 
     # API Credentials
-    fireworks_api_key: str = Field(alias='FIREWORKS_API_KEY', description='API key for the Fireworks LLM API')
+    fireworks_api_key: Optional[str] = Field(None, alias='FIREWORKS_API_KEY', description='API key for the Fireworks LLM API, required by the fireworks LLM backend only')
 
     # Available LLMs
     available_llms: tuple = Field(
@@ -53,7 +132,16 @@ class Settings(BaseSettings):
 
 settings = Settings()
 
-if not os.path.exists(settings.obj_detect_weights_path):
-    print(f"Downloading object detection weights to {settings.obj_detect_weights_path}")
-    os.makedirs(os.path.dirname(settings.obj_detect_weights_path), exist_ok=True)
-    gdown.download('https://drive.google.com/file/d/1q9M9w4r16Bp7T6wh-lHXJPnCcA1rSNF-/view?usp=sharing', settings.obj_detect_weights_path, quiet=False, fuzzy=True)
+WEIGHTS_URL = 'https://drive.google.com/file/d/1q9M9w4r16Bp7T6wh-lHXJPnCcA1rSNF-/view?usp=sharing'
+
+
+def ensure_weights(path: str = settings.obj_detect_weights_path):
+    '''
+    Downloads the object detection weights if they are not found at the given path.
+    '''
+    if not os.path.exists(path):
+        import gdown
+
+        print(f"Downloading object detection weights to {path}")
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        gdown.download(WEIGHTS_URL, path, quiet=False, fuzzy=True)
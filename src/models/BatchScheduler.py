@@ -0,0 +1,165 @@
+from concurrent.futures import Future
+from typing import Callable, Dict, List, NamedTuple, Optional
+from src.models.YOLOModel import YOLOModel
+from src.models.types.Detections import Detections
+from src.models.types.DetectionFilter import DetectionFilter
+from src.config.settings import settings
+from PIL import Image
+import threading
+import queue
+import time
+
+
+class _BatchItem(NamedTuple):
+    image: Image
+    confidence_threshold: float
+    detection_filter: DetectionFilter
+    future: Future
+    on_start: Optional[Callable[[], None]]
+
+
+class BatchScheduler:
+    """
+    Class representing a micro-batching scheduler in front of the YOLO model.
+
+    Concurrent detection requests are collected for up to `max_wait_ms` milliseconds or until
+    `max_batch_size` of them are queued, then run through a single batched forward pass.
+    Each caller receives its own predictions through a future.
+    """
+
+    def __init__(self, yolo_model: YOLOModel,
+                 max_batch_size: int = settings.yolo_max_batch_size,
+                 max_wait_ms: float = settings.yolo_max_wait_ms):
+        """
+        Initializes the scheduler and starts its worker thread.
+
+        Parameters
+        ----------
+        yolo_model: YOLOModel
+            The model running the batched predictions.
+        max_batch_size: int
+            The maximum number of images in a batch.
+        max_wait_ms: float
+            The maximum time to wait for a batch to fill up after its first request arrived.
+        """
+        self.yolo_model = yolo_model
+        self.max_batch_size = max_batch_size
+        self.max_wait_ms = max_wait_ms
+
+        self._queue: 'queue.Queue[Optional[_BatchItem]]' = queue.Queue()
+        self._lock = threading.Lock()
+        self._batches = 0
+        self._images = 0
+
+        self._worker = threading.Thread(target=self._run, name='yolo-batch-scheduler', daemon=True)
+        self._worker.start()
+
+    def submit(self, image: Image, confidence_threshold: float = 0.5,
+               detection_filter: Optional[DetectionFilter] = None,
+               on_start: Optional[Callable[[], None]] = None) -> Future:
+        '''
+        Queues an image for detection.
+
+        Parameters
+        ----------
+        image: Image
+            The image to predict the traffic signs in.
+        confidence_threshold: float
+            The confidence threshold for the predictions.
+        detection_filter: Optional[DetectionFilter]
+            The NMS parameters and the classes to detect. Defaults to the filter configured by the settings.
+        on_start: Optional[Callable[[], None]]
+            Callback invoked when the batch containing the image starts running.
+
+        Returns
+        -------
+        Future
+            Future resolving to the predicted traffic signs.
+        '''
+        future = Future()
+        self._queue.put(_BatchItem(image, confidence_threshold, detection_filter or self.yolo_model.default_filter,
+                                   future, on_start))
+        return future
+
+    def detect_traffic_signs(self, image: Image, confidence_threshold: float = 0.5,
+                             detection_filter: Optional[DetectionFilter] = None) -> Detections:
+        '''
+        Blocking counterpart of `submit` with the same interface as `YOLOModel.detect_traffic_signs`.
+        '''
+        return self.submit(image, confidence_threshold, detection_filter).result()
+
+    def _collect_batch(self, first: _BatchItem) -> List[Optional[_BatchItem]]:
+        batch = [first]
+        deadline = time.perf_counter() + self.max_wait_ms / 1000
+        while len(batch) < self.max_batch_size:
+            timeout = deadline - time.perf_counter()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=timeout))
+            except queue.Empty:
+                break
+            if batch[-1] is None:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            first = self._queue.get()
+            if first is None:
+                return
+
+            batch = self._collect_batch(first)
+            stop = batch[-1] is None
+            # Skip the requests whose callers gave up while waiting
+            batch = [item for item in batch if item is not None and item.future.set_running_or_notify_cancel()]
+
+            if batch:
+                for item in batch:
+                    if item.on_start is not None:
+                        item.on_start()
+                # NMS parameters and classes apply to a whole forward pass, requests with different filters run separately
+                groups: Dict[DetectionFilter, List[_BatchItem]] = {}
+                for item in batch:
+                    groups.setdefault(item.detection_filter, []).append(item)
+                for detection_filter, items in groups.items():
+                    self._run_batch(items, detection_filter)
+
+                with self._lock:
+                    self._batches += 1
+                    self._images += len(batch)
+
+            if stop:
+                return
+
+    def _run_batch(self, batch: List[_BatchItem], detection_filter: DetectionFilter):
+        try:
+            results = self.yolo_model.detect_traffic_signs_batch([item.image for item in batch],
+                                                                 [item.confidence_threshold for item in batch],
+                                                                 detection_filter)
+        except Exception as e:
+            for item in batch:
+                item.future.set_exception(e)
+        else:
+            for item, result in zip(batch, results):
+                item.future.set_result(result)
+
+    def stats(self) -> dict:
+        '''
+        Returns the batching statistics of the scheduler.
+        '''
+        with self._lock:
+            return {
+                'max_batch_size': self.max_batch_size,
+                'max_wait_ms': self.max_wait_ms,
+                'batches': self._batches,
+                'avg_batch_size': self._images / self._batches if self._batches else 0.0,
+                'queue_depth': self._queue.qsize(),
+            }
+
+    def close(self):
+        '''
+        Stops the worker thread once the already queued requests have been processed.
+        '''
+        self._queue.put(None)
+        self._worker.join()
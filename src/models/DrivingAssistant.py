@@ -1,6 +1,18 @@
 from src.models.LLM import LLM
+from src.models.FireworksLLM import close_http_clients
 from src.models.YOLOModel import YOLOModel
+from src.models.InferenceExecutor import InferenceExecutor
+from src.models.RequestScheduler import EDFScheduler, current_request
+from src.models.BatchScheduler import BatchScheduler
+from src.models.WorkerPool import DetectionWorkerPool
+from src.models.types.Detections import Detections
+from src.models.types.Prediction import Prediction, PredictionMode
+from src.models.types.DetectionFilter import DetectionFilter
+from src.models.metrics import count_detections, stage
+from src.config.settings import settings
+from typing import List, Optional
 from PIL import Image
+import asyncio
 
 
 class DrivingAssistant:
@@ -8,21 +20,64 @@ class DrivingAssistant:
     Class representing the Driving Assistant.
     """
 
-    def __init__(self, llm_model_name: str = 'llama-v3p1-405b-instruct'):
+    def __init__(self, llm_model_name: str = 'llama-v3p1-405b-instruct', yolo_model: Optional[YOLOModel] = None,
+                 worker_pool: Optional[DetectionWorkerPool] = None):
         """
         Initializes the Driving Assistant.
 
         Parameters
         ----------
-        obj_detect_weights_path: str
-            The path to the object detection model weights.
-        use_gpu: bool
-            Flag indicating whether to use GPU for inference.
+        llm_model_name: str
+            The name of the default LLM.
+        yolo_model: Optional[YOLOModel]
+            An already loaded object detection model, e.g. shared by the prefork server workers.
+            Defaults to a new model configured from the settings.
+        worker_pool: Optional[DetectionWorkerPool]
+            A pool of inference processes running object detection instead of the current process.
         """
-        self.yolo_model = YOLOModel()
+        self.yolo_model = yolo_model if yolo_model is not None else YOLOModel()
         self.llm = LLM(llm_model_name=llm_model_name)
+        self.worker_pool = worker_pool
+        if worker_pool is not None:
+            # Every executor thread waits on one frame, two of them per process keep the processes busy
+            self.executor = InferenceExecutor(max_workers=max(settings.inference_workers, 2 * worker_pool.processes))
+            self.batch_scheduler = None
+        else:
+            self.batch_scheduler = BatchScheduler(self.yolo_model) if settings.yolo_batching else None
+            # A full batch is scheduled at once, the later requests wait for the next one in the order of their deadline
+            self.executor = InferenceExecutor(scheduler=EDFScheduler('detect', settings.yolo_max_batch_size)
+                                              if self.batch_scheduler is not None else None)
 
-    def predict(self, image: Image, confidence_threshold: float = 0.5, llm_model_name: str = 'llama-v3p1-405b-instruct') -> str:
+    def warm_up(self, iterations: int = settings.warm_up_iterations):
+        """
+        Runs object detection on a dummy frame, so that the first requests do not pay for the lazy model initialization.
+
+        Parameters
+        ----------
+        iterations: int
+            The number of object detection runs.
+        """
+        if self.worker_pool is not None:
+            # The inference processes warm themselves up when they start
+            return
+        dummy_frame = Image.new('RGB', (settings.image_width, settings.image_height))
+        for _ in range(iterations):
+            self.yolo_model.detect_traffic_signs(dummy_frame)
+
+    def close(self):
+        """
+        Stops the inference workers and closes the synchronous HTTP client of the LLMs.
+        The asynchronous one is closed by `aclose_http_clients` on its event loop.
+        """
+        self.executor.shutdown()
+        close_http_clients()
+        if self.batch_scheduler is not None:
+            self.batch_scheduler.close()
+        if self.worker_pool is not None:
+            self.worker_pool.close()
+
+    def predict(self, image: Image, confidence_threshold: float = 0.5, llm_model_name: str = 'llama-v3p1-405b-instruct',
+                mode: PredictionMode = 'full', detection_filter: Optional[DetectionFilter] = None) -> Prediction:
         """
         Predicts the traffic signs in the given image and generates text based on the detected road signs.
 
@@ -30,11 +85,149 @@ class DrivingAssistant:
         ----------
         image: str
             The image to predict the traffic signs in.
+        confidence_threshold: float
+            The confidence threshold for the predictions.
+        llm_model_name: str
+            The name of the LLM generating the hints.
+        mode: PredictionMode
+            `detect` only runs object detection, `describe` also returns the metadata of the detected signs,
+            `full` also generates the hints with the LLM.
+        detection_filter: Optional[DetectionFilter]
+            The NMS parameters and the classes to detect. Defaults to the filter configured by the settings.
+
+        Returns
+        -------
+        Prediction
+            The detected traffic signs, and the generated text in `full` mode.
+        """
+        with stage('detect'):
+            road_signs = self.yolo_model.detect_traffic_signs(image, confidence_threshold=confidence_threshold,
+                                                              detection_filter=detection_filter)
+        count_detections(road_signs.sign_codes)
+        if mode != 'full':
+            return Prediction(mode, road_signs)
+        return Prediction(mode, road_signs, self.llm.get_driving_hints(road_signs, llm_model_name=llm_model_name))
+
+    async def adetect(self, image: Image, confidence_threshold: float = 0.5,
+                      detection_filter: Optional[DetectionFilter] = None) -> Detections:
+        """
+        Asynchronously predicts the traffic signs in the given image on the inference executor.
+        A request whose priority was not supplied is raised to the safety class for the next stages
+        if a sign of SAFETY_SIGN_CATEGORIES is detected.
+
+        Parameters
+        ----------
+        image: Image
+            The image to predict the traffic signs in.
+        confidence_threshold: float
+            The confidence threshold for the predictions.
+        detection_filter: Optional[DetectionFilter]
+            The NMS parameters and the classes to detect. Defaults to the filter configured by the settings.
 
         Returns
         -------
-        str
-            The generated text.
+        Detections
+            The predicted traffic signs.
+
+        Raises
+        ------
+        QueueFullError
+            If the inference queue is full.
+        DeadlineExceededError
+            If the deadline of the request passed before it was scheduled.
+        """
+        road_signs = await self._detect(image, confidence_threshold, detection_filter)
+        count_detections(road_signs.sign_codes)
+        if (request := current_request()) is not None:
+            request.escalate(road_signs.sign_codes)
+        return road_signs
+
+    async def _detect(self, image: Image, confidence_threshold: float,
+                      detection_filter: Optional[DetectionFilter]) -> Detections:
+        if self.worker_pool is not None:
+            return await self.executor.run(self.worker_pool.detect_traffic_signs, image, confidence_threshold=confidence_threshold,
+                                           detection_filter=detection_filter)
+        if self.batch_scheduler is not None:
+            return await self.executor.run_batched(self.batch_scheduler, image, confidence_threshold=confidence_threshold,
+                                                   detection_filter=detection_filter)
+        return await self.executor.run(self.yolo_model.detect_traffic_signs, image, confidence_threshold=confidence_threshold,
+                                       detection_filter=detection_filter)
+
+    async def adetect_batch(self, images: List[Image], confidence_threshold: float = 0.5,
+                            detection_filter: Optional[DetectionFilter] = None) -> List[Detections]:
+        """
+        Asynchronously predicts the traffic signs in several images on the inference executor.
+        In the server process they are detected as a single job running one batched forward pass,
+        with inference processes or micro-batching they are detected like as many concurrent requests.
+
+        Parameters
+        ----------
+        images: List[Image]
+            The images to predict the traffic signs in.
+        confidence_threshold: float
+            The confidence threshold for the predictions.
+        detection_filter: Optional[DetectionFilter]
+            The NMS parameters and the classes to detect. Defaults to the filter configured by the settings.
+
+        Returns
+        -------
+        List[Detections]
+            The predicted traffic signs of each image.
+
+        Raises
+        ------
+        QueueFullError
+            If the inference queue is full.
+        DeadlineExceededError
+            If the deadline of the request passed before it was scheduled.
+        """
+        if self.worker_pool is None and self.batch_scheduler is None:
+            road_signs = await self.executor.run(self.yolo_model.detect_traffic_signs_batch, images,
+                                                 [confidence_threshold] * len(images), detection_filter)
+        else:
+            # No more images at once than the executor has slots, so that a batch does not fill its queue
+            road_signs = []
+            for start in range(0, len(images), self.executor.scheduler.slots):
+                road_signs += await asyncio.gather(*(self._detect(image, confidence_threshold, detection_filter)
+                                                     for image in images[start:start + self.executor.scheduler.slots]))
+        for image_road_signs in road_signs:
+            count_detections(image_road_signs.sign_codes)
+        return road_signs
+
+    async def apredict(self, image: Image, confidence_threshold: float = 0.5, llm_model_name: str = 'llama-v3p1-405b-instruct',
+                       mode: PredictionMode = 'full', detection_filter: Optional[DetectionFilter] = None) -> Prediction:
+        """
+        Asynchronously predicts the traffic signs in the given image and generates text based on the detected road signs.
+        Object detection runs on the inference executor, the LLM is called asynchronously.
+
+        Parameters
+        ----------
+        image: str
+            The image to predict the traffic signs in.
+        confidence_threshold: float
+            The confidence threshold for the predictions.
+        llm_model_name: str
+            The name of the LLM generating the hints.
+        mode: PredictionMode
+            `detect` only runs object detection, `describe` also returns the metadata of the detected signs,
+            `full` also generates the hints with the LLM.
+        detection_filter: Optional[DetectionFilter]
+            The NMS parameters and the classes to detect. Defaults to the filter configured by the settings.
+
+        Returns
+        -------
+        Prediction
+            The detected traffic signs, and the generated text in `full` mode.
+
+        Raises
+        ------
+        QueueFullError
+            If the inference queue is full.
+        DeadlineExceededError
+            If the deadline of the request passed before a stage was scheduled.
         """
-        road_signs = self.yolo_model.detect_traffic_signs(image, confidence_threshold=confidence_threshold)
-        return self.llm.get_driving_hints(road_signs, llm_model_name=llm_model_name)
+        road_signs = await self.adetect(image, confidence_threshold=confidence_threshold, detection_filter=detection_filter)
+        if mode != 'full':
+            return Prediction(mode, road_signs)
+        hints, cacheable = await self.llm.agenerate_driving_hints(road_signs, llm_model_name=llm_model_name)
+        return Prediction(mode, road_signs, hints, cacheable=cacheable)
@@ -0,0 +1,58 @@
+from typing import Any, AsyncIterator, Dict, Iterator, List, Optional
+from langchain_core.language_models.llms import LLM as BaseLLM
+from langchain_core.callbacks import CallbackManagerForLLMRun, AsyncCallbackManagerForLLMRun
+from langchain_core.outputs import GenerationChunk
+from src.models.metrics import count_llm_tokens
+import asyncio
+import time
+import re
+
+
+class FakeLLM(BaseLLM):
+    """
+    Class representing a local stand-in for the Fireworks models, answering with a fixed text.
+
+    The text is streamed word by word with artificial delays, so that the streaming and latency
+    behaviour of the service can be tested without network access.
+    """
+
+    response: str
+    first_token_delay: float = 0.0
+    token_delay: float = 0.0
+
+    @property
+    def _llm_type(self) -> str:
+        return 'fake'
+
+    @property
+    def _identifying_params(self) -> Dict[str, Any]:
+        return {'response': self.response}
+
+    def _tokens(self) -> List[str]:
+        return re.findall(r'\S+\s*', self.response)
+
+    def _call(self, prompt: str, stop: Optional[List[str]] = None,
+              run_manager: Optional[CallbackManagerForLLMRun] = None, **kwargs: Any) -> str:
+        return ''.join(chunk.text for chunk in self._stream(prompt, stop, run_manager, **kwargs))
+
+    async def _acall(self, prompt: str, stop: Optional[List[str]] = None,
+                     run_manager: Optional[AsyncCallbackManagerForLLMRun] = None, **kwargs: Any) -> str:
+        return ''.join([chunk.text async for chunk in self._astream(prompt, stop, run_manager, **kwargs)])
+
+    def _stream(self, prompt: str, stop: Optional[List[str]] = None,
+                run_manager: Optional[CallbackManagerForLLMRun] = None, **kwargs: Any) -> Iterator[GenerationChunk]:
+        time.sleep(self.first_token_delay)
+        for i, token in enumerate(self._tokens()):
+            if i:
+                time.sleep(self.token_delay)
+            yield GenerationChunk(text=token)
+        count_llm_tokens(self._llm_type, len(self._tokens()))
+
+    async def _astream(self, prompt: str, stop: Optional[List[str]] = None,
+                       run_manager: Optional[AsyncCallbackManagerForLLMRun] = None, **kwargs: Any) -> AsyncIterator[GenerationChunk]:
+        await asyncio.sleep(self.first_token_delay)
+        for i, token in enumerate(self._tokens()):
+            if i:
+                await asyncio.sleep(self.token_delay)
+            yield GenerationChunk(text=token)
+        count_llm_tokens(self._llm_type, len(self._tokens()))
@@ -0,0 +1,172 @@
+from typing import Any, AsyncIterator, Dict, Iterator, List, Optional
+from langchain_core.language_models.llms import LLM as BaseLLM
+from langchain_core.callbacks import CallbackManagerForLLMRun, AsyncCallbackManagerForLLMRun
+from langchain_core.outputs import GenerationChunk
+from pydantic import Field, SecretStr
+from src.config.settings import settings
+from src.models.metrics import count_llm_tokens
+import threading
+import httpx
+import json
+
+_client: Optional[httpx.Client] = None
+_async_client: Optional[httpx.AsyncClient] = None
+_client_lock = threading.Lock()
+
+
+def _limits() -> httpx.Limits:
+    return httpx.Limits(max_connections=settings.llm_max_connections,
+                        max_keepalive_connections=settings.llm_max_connections,
+                        keepalive_expiry=settings.llm_keepalive_expiry)
+
+
+def get_http_client() -> httpx.Client:
+    '''
+    Returns the HTTP client shared by all the Fireworks models, keeping connections alive between requests.
+    '''
+    global _client
+    with _client_lock:
+        if _client is None:
+            _client = httpx.Client(limits=_limits(), timeout=settings.llm_http_timeout)
+        return _client
+
+
+def get_async_http_client() -> httpx.AsyncClient:
+    '''
+    Returns the asynchronous HTTP client shared by all the Fireworks models, keeping connections alive between requests.
+    '''
+    global _async_client
+    with _client_lock:
+        if _async_client is None:
+            _async_client = httpx.AsyncClient(limits=_limits(), timeout=settings.llm_http_timeout)
+        return _async_client
+
+
+def close_http_clients():
+    '''
+    Closes the synchronous HTTP client shared by the Fireworks models, the next call opens a new one.
+    '''
+    global _client
+    with _client_lock:
+        client, _client = _client, None
+    if client is not None:
+        client.close()
+
+
+async def aclose_http_clients():
+    '''
+    Closes both HTTP clients shared by the Fireworks models. The asynchronous client is closed on the
+    event loop it is used on, e.g. when the server shuts down.
+    '''
+    global _async_client
+    close_http_clients()
+    with _client_lock:
+        client, _async_client = _async_client, None
+    if client is not None:
+        await client.aclose()
+
+
+class FireworksLLM(BaseLLM):
+    """
+    Class representing a Fireworks completion model.
+
+    Unlike `langchain_fireworks.Fireworks`, which opens a new connection for every call, all the
+    instances share pooled keep-alive HTTP clients, and completions can be streamed token by token.
+    """
+
+    model: str
+    fireworks_api_key: SecretStr
+    base_url: str = Field(default_factory=lambda: settings.fireworks_base_url)
+    temperature: float = 0
+    max_tokens: int = 100
+    # Per-request timeout in seconds, the timeout of the shared clients if None
+    timeout: Optional[float] = None
+
+    @property
+    def _llm_type(self) -> str:
+        return 'fireworks'
+
+    @property
+    def _identifying_params(self) -> Dict[str, Any]:
+        return {'model': self.model, 'temperature': self.temperature, 'max_tokens': self.max_tokens}
+
+    def _request(self, prompt: str, stop: Optional[List[str]], stream: bool) -> Dict[str, Any]:
+        payload = {
+            'model': self.model,
+            'prompt': prompt,
+            'temperature': self.temperature,
+            'max_tokens': self.max_tokens,
+            'stream': stream,
+        }
+        if stop:
+            payload['stop'] = stop
+        request = {
+            'url': f'{self.base_url}/completions',
+            'json': payload,
+            'headers': {'Authorization': f'Bearer {self.fireworks_api_key.get_secret_value()}'},
+        }
+        if self.timeout is not None:
+            request['timeout'] = self.timeout
+        return request
+
+    @staticmethod
+    def _parse_event(line: str) -> Optional[str]:
+        '''
+        Returns the text of a server-sent completion event, or None if the line carries no text.
+        '''
+        if not line.startswith('data:'):
+            return None
+        data = line[len('data:'):].strip()
+        if data == '[DONE]':
+            return None
+        return json.loads(data)['choices'][0].get('text') or None
+
+    def _completion_text(self, completion: Dict[str, Any]) -> str:
+        usage = completion.get('usage') or {}
+        if 'completion_tokens' in usage:
+            count_llm_tokens(self.model.rsplit('/', 1)[-1], usage['completion_tokens'], usage.get('prompt_tokens'))
+        return completion['choices'][0]['text']
+
+    def _call(self, prompt: str, stop: Optional[List[str]] = None,
+              run_manager: Optional[CallbackManagerForLLMRun] = None, **kwargs: Any) -> str:
+        response = get_http_client().post(**self._request(prompt, stop, stream=False))
+        response.raise_for_status()
+        return self._completion_text(response.json())
+
+    async def _acall(self, prompt: str, stop: Optional[List[str]] = None,
+                     run_manager: Optional[AsyncCallbackManagerForLLMRun] = None, **kwargs: Any) -> str:
+        response = await get_async_http_client().post(**self._request(prompt, stop, stream=False))
+        response.raise_for_status()
+        return self._completion_text(response.json())
+
+    def _stream(self, prompt: str, stop: Optional[List[str]] = None,
+                run_manager: Optional[CallbackManagerForLLMRun] = None, **kwargs: Any) -> Iterator[GenerationChunk]:
+        tokens = 0
+        with get_http_client().stream('POST', **self._request(prompt, stop, stream=True)) as response:
+            response.raise_for_status()
+            for line in response.iter_lines():
+                text = self._parse_event(line)
+                if text is None:
+                    continue
+                tokens += 1
+                if run_manager:
+                    run_manager.on_llm_new_token(text)
+                yield GenerationChunk(text=text)
+        # Every streamed event carries one token
+        count_llm_tokens(self.model.rsplit('/', 1)[-1], tokens)
+
+    async def _astream(self, prompt: str, stop: Optional[List[str]] = None,
+                       run_manager: Optional[AsyncCallbackManagerForLLMRun] = None, **kwargs: Any) -> AsyncIterator[GenerationChunk]:
+        tokens = 0
+        async with get_async_http_client().stream('POST', **self._request(prompt, stop, stream=True)) as response:
+            response.raise_for_status()
+            async for line in response.aiter_lines():
+                text = self._parse_event(line)
+                if text is None:
+                    continue
+                tokens += 1
+                if run_manager:
+                    await run_manager.on_llm_new_token(text)
+                yield GenerationChunk(text=text)
+        # Every streamed event carries one token
+        count_llm_tokens(self.model.rsplit('/', 1)[-1], tokens)
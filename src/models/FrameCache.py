@@ -0,0 +1,200 @@
+from collections import OrderedDict
+from typing import Awaitable, Callable, Dict, Hashable, Optional, Tuple
+from src.config.settings import settings
+from PIL import Image
+import threading
+import asyncio
+import hashlib
+import time
+
+FrameCacheKey = Tuple[str, Tuple[Hashable, ...]]
+
+# The result of a prediction, the perceptual hash of its frame, if computed, and the time it was cached at
+FrameCacheEntry = Tuple[dict, Optional[int], float]
+
+# The result of a prediction, the perceptual hash of its frame, if computed, and whether the result may be cached
+FrameCacheResult = Tuple[dict, Optional[int], bool]
+
+
+def dhash(image: Image.Image, hash_size: int = 8) -> int:
+    '''
+    Computes the difference hash of an image: whether each pixel of a `hash_size + 1` x `hash_size`
+    grayscale thumbnail is brighter than its right neighbour, as a `hash_size ** 2` bit integer.
+    Near-identical frames (sensor noise, re-encoding) have hashes a few bits apart.
+    '''
+    thumbnail = image.convert('L').resize((hash_size + 1, hash_size), Image.BILINEAR)
+    pixels = list(thumbnail.getdata())
+    bits = 0
+    for row in range(hash_size):
+        for column in range(hash_size):
+            left = pixels[row * (hash_size + 1) + column]
+            bits = (bits << 1) | (left > pixels[row * (hash_size + 1) + column + 1])
+    return bits
+
+
+class FrameCache:
+    """
+    Class representing an LRU cache of prediction results with a time to live, keyed by the content of the frame and the request parameters.
+
+    Frames are matched by the SHA-256 of their bytes and, if `max_distance` is set, by the difference
+    hash of the decoded frame, so that the near-identical frames a stopped dashcam sends are answered
+    from the cache too. Concurrent requests for the same frame are coalesced: one computes the
+    result while the others wait for it.
+    """
+
+    def __init__(self, max_size: int = settings.frame_cache_size,
+                 max_distance: Optional[int] = settings.frame_cache_max_distance,
+                 ttl: Optional[float] = settings.frame_cache_ttl):
+        """
+        Initializes the cache.
+
+        Parameters
+        ----------
+        max_size: int
+            The maximum number of cached results.
+        max_distance: Optional[int]
+            The maximum Hamming distance between the difference hashes of two frames considered the same,
+            None to only match identical frames.
+        ttl: Optional[float]
+            The number of seconds a result stays valid, None to never expire results.
+        """
+        self.max_size = max_size
+        self.max_distance = max_distance
+        self.ttl = ttl
+
+        self._entries: 'OrderedDict[FrameCacheKey, FrameCacheEntry]' = OrderedDict()
+        self._in_flight: Dict[FrameCacheKey, asyncio.Future] = {}
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._near_hits = 0
+        self._coalesced = 0
+        self._misses = 0
+
+    @staticmethod
+    def key(data: bytes, *params: Hashable) -> FrameCacheKey:
+        '''
+        Builds the cache key of a frame: the SHA-256 of its bytes and the parameters the result depends on.
+        '''
+        return hashlib.sha256(data).hexdigest(), params
+
+    def _expired(self, created_at: float) -> bool:
+        return self.ttl is not None and time.monotonic() - created_at > self.ttl
+
+    def get(self, key: FrameCacheKey) -> Optional[dict]:
+        '''
+        Returns the cached result of an identical frame, or None if there is none or it expired.
+        '''
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and self._expired(entry[2]):
+                del self._entries[key]
+                entry = None
+            if entry is None:
+                return None
+            self._entries.move_to_end(key)
+            self._hits += 1
+            return entry[0]
+
+    def get_similar(self, key: FrameCacheKey, image_hash: int) -> Optional[dict]:
+        '''
+        Returns the cached result of the most similar frame with the same request parameters, or None if
+        near-duplicate matching is disabled or no frame is within `max_distance`.
+        '''
+        if self.max_distance is None:
+            return None
+        with self._lock:
+            best_key, best_distance = None, self.max_distance + 1
+            for entry_key, (_, entry_hash, created_at) in self._entries.items():
+                if entry_hash is None or entry_key[1] != key[1] or self._expired(created_at):
+                    continue
+                distance = (entry_hash ^ image_hash).bit_count()
+                if distance < best_distance:
+                    best_key, best_distance = entry_key, distance
+            if best_key is None:
+                return None
+            self._entries.move_to_end(best_key)
+            self._near_hits += 1
+            return self._entries[best_key][0]
+
+    def set(self, key: FrameCacheKey, result: dict, image_hash: Optional[int] = None):
+        with self._lock:
+            self._entries[key] = (result, image_hash, time.monotonic())
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    async def get_or_compute(self, key: FrameCacheKey, compute: Callable[[], Awaitable[FrameCacheResult]]) -> dict:
+        '''
+        Returns the cached result of the frame, waits for the request computing it, or computes it.
+
+        Parameters
+        ----------
+        key: FrameCacheKey
+            The cache key of the frame.
+        compute: Callable[[], Awaitable[FrameCacheResult]]
+            Coroutine function computing the result, the perceptual hash of the frame (or None) and whether the
+            result may be cached, e.g. decoding the frame, looking up a similar one with `get_similar` and predicting otherwise.
+            The requests coalesced with this one get the result even if it is not cached.
+
+        Raises
+        ------
+        Exception
+            The exception raised by `compute`, also in the coalesced requests.
+        '''
+        while True:
+            cached = self.get(key)
+            if cached is not None:
+                return cached
+
+            future = self._in_flight.get(key)
+            if future is None:
+                break
+            with self._lock:
+                self._coalesced += 1
+            try:
+                # Shielded, so that a waiting request going away does not cancel the computation
+                return await asyncio.shield(future)
+            except asyncio.CancelledError:
+                if not future.cancelled():
+                    raise
+                # The computing request went away, compute the result in this one
+
+        future = asyncio.get_running_loop().create_future()
+        self._in_flight[key] = future
+        with self._lock:
+            self._misses += 1
+        try:
+            result, image_hash, cacheable = await compute()
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception as e:
+            future.set_exception(e)
+            # Retrieved, so that the exception is not reported as never retrieved when nobody waits
+            future.exception()
+            raise
+        finally:
+            del self._in_flight[key]
+        if cacheable:
+            self.set(key, result, image_hash)
+        future.set_result(result)
+        return result
+
+    def stats(self) -> dict:
+        '''
+        Returns the size and hit/miss counters of the cache. The misses are the requests that were neither
+        answered from an identical frame nor coalesced, the near hits are the misses answered from a similar frame.
+        '''
+        with self._lock:
+            lookups = self._hits + self._coalesced + self._misses
+            return {
+                'size': len(self._entries),
+                'max_size': self.max_size,
+                'max_distance': self.max_distance,
+                'ttl': self.ttl,
+                'hits': self._hits,
+                'near_hits': self._near_hits,
+                'coalesced': self._coalesced,
+                'misses': self._misses,
+                'hit_rate': (self._hits + self._near_hits + self._coalesced) / lookups if lookups else 0.0,
+            }
@@ -0,0 +1,106 @@
+from src.config.settings import settings
+from typing import List, Tuple, Union
+from PIL import Image
+import numpy as np
+
+TileBox = Tuple[int, int, int, int]
+
+
+def image_size(image: Union[Image.Image, np.ndarray]) -> Tuple[int, int]:
+    '''
+    Returns the width and height of a PIL image or of a NumPy frame.
+    '''
+    if isinstance(image, np.ndarray):
+        return image.shape[1], image.shape[0]
+    return image.size
+
+
+def crop(image: Union[Image.Image, np.ndarray], box: TileBox) -> Union[Image.Image, np.ndarray]:
+    '''
+    Crops a PIL image or a NumPy frame (as a view, without copying) to the given box.
+    '''
+    x0, y0, x1, y1 = box
+    if isinstance(image, np.ndarray):
+        return image[y0:y1, x0:x1]
+    return image.crop(box)
+
+
+class FrameTiler:
+    """
+    Class splitting a frame into the overlapping tiles object detection runs on.
+
+    The tiles cover a region of interest of the frame (e.g. its right and upper parts, where the
+    signs usually are) with a fixed grid, so that the number of tiles, and therefore the cost of
+    a frame, does not depend on its resolution. Each tile is letterboxed to the model input size
+    on its own, so small signs keep more pixels than when the whole frame is downscaled at once.
+    """
+
+    def __init__(self,
+                 roi: Tuple[float, float, float, float] = settings.tiling_roi,
+                 grid: Tuple[int, int] = settings.tiling_grid,
+                 overlap: float = settings.tiling_overlap,
+                 include_full_frame: bool = settings.tiling_full_frame):
+        """
+        Initializes the tiler.
+
+        Parameters
+        ----------
+        roi: Tuple[float, float, float, float]
+            The region of interest (left, top, right, bottom) normalized by the frame width and height.
+        grid: Tuple[int, int]
+            The number of tile columns and rows covering the region of interest.
+        overlap: float
+            The fraction of a tile overlapping its neighbours, so that signs cut by a tile border are whole in another tile.
+        include_full_frame: bool
+            Also run detection on the whole frame, for the large signs that do not fit in a tile.
+
+        Raises
+        ------
+        ValueError
+            If the region of interest, the grid or the overlap are invalid.
+        """
+        left, top, right, bottom = roi
+        if not (0 <= left < right <= 1 and 0 <= top < bottom <= 1):
+            raise ValueError(f"Invalid region of interest {roi}, expected 0 <= left < right <= 1 and 0 <= top < bottom <= 1")
+        if grid[0] < 1 or grid[1] < 1:
+            raise ValueError(f"Invalid tile grid {grid}")
+        if not 0 <= overlap < 1:
+            raise ValueError(f"Invalid tile overlap {overlap}, expected 0 <= overlap < 1")
+
+        self.roi = roi
+        self.grid = grid
+        self.overlap = overlap
+        self.include_full_frame = include_full_frame
+
+    @property
+    def tiles_per_frame(self) -> int:
+        return self.grid[0] * self.grid[1] + self.include_full_frame
+
+    @staticmethod
+    def _spans(start: float, end: float, count: int, overlap: float) -> List[Tuple[int, int]]:
+        # `count` spans of equal length, each overlapping the next by `overlap` of its length
+        length = (end - start) / (count - (count - 1) * overlap)
+        step = length * (1 - overlap)
+        return [(int(round(start + i * step)), int(round(min(end, start + i * step + length)))) for i in range(count)]
+
+    def tiles(self, width: int, height: int) -> List[TileBox]:
+        '''
+        Returns the boxes (left, top, right, bottom) of the tiles of a frame, in pixels.
+        '''
+        left, top, right, bottom = self.roi
+        columns = self._spans(left * width, right * width, self.grid[0], self.overlap)
+        rows = self._spans(top * height, bottom * height, self.grid[1], self.overlap)
+        boxes = [(x0, y0, x1, y1) for y0, y1 in rows for x0, x1 in columns]
+        if self.include_full_frame and boxes != [(0, 0, width, height)]:
+            boxes.append((0, 0, width, height))
+        return boxes
+
+    def min_frame_size(self, input_size: Tuple[int, int]) -> Tuple[int, int]:
+        '''
+        Returns the smallest frame width and height whose tiles are still at least the given model input size,
+        i.e. the size below which decoding a frame loses detail.
+        '''
+        left, top, right, bottom = self.roi
+        columns, rows = self.grid
+        return (int(np.ceil(input_size[0] * (columns - (columns - 1) * self.overlap) / (right - left))),
+                int(np.ceil(input_size[1] * (rows - (rows - 1) * self.overlap) / (bottom - top))))
@@ -0,0 +1,145 @@
+from collections import OrderedDict
+from typing import Iterable, Optional, Tuple
+from src.config.settings import settings
+import threading
+import sqlite3
+import time
+import json
+
+SignSet = Tuple[str, ...]
+
+HintCacheKey = Tuple[SignSet, str, float, int]
+
+
+def sign_set(sign_codes: Iterable[str]) -> SignSet:
+    '''
+    Returns the distinct sign codes in sorted order: the prompt lists every sign once, so the hints only depend on them.
+    '''
+    return tuple(sorted(set(sign_codes)))
+
+
+class HintCache:
+    """
+    Class representing an LRU cache of generated driving hints with a time to live.
+
+    Entries are kept in memory and, if a path is given, persisted to an SQLite database so that
+    they survive restarts.
+    """
+
+    def __init__(self, max_size: int = settings.hint_cache_size,
+                 ttl: Optional[float] = settings.hint_cache_ttl,
+                 path: Optional[str] = settings.hint_cache_path,
+                 max_disk_size: int = settings.hint_cache_disk_size):
+        """
+        Initializes the cache.
+
+        Parameters
+        ----------
+        max_size: int
+            The maximum number of entries kept in memory.
+        ttl: Optional[float]
+            The number of seconds an entry stays valid, None to never expire entries.
+        path: Optional[str]
+            The path to the SQLite database persisting the entries, None to only keep them in memory.
+        max_disk_size: int
+            The maximum number of entries kept in the SQLite database.
+        """
+        self.max_size = max_size
+        self.ttl = ttl
+        self.path = path
+        self.max_disk_size = max_disk_size
+
+        self._entries: 'OrderedDict[HintCacheKey, Tuple[str, float]]' = OrderedDict()
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._misses = 0
+        # The database is trimmed every few inserts rather than on each of them, it may exceed
+        # `max_disk_size` by that many entries meanwhile
+        self._evict_every = max(1, min(1000, max_disk_size // 100))
+        self._inserts = 0
+
+        self._db: Optional[sqlite3.Connection] = None
+        if path:
+            self._db = sqlite3.connect(path, check_same_thread=False)
+            self._db.execute('CREATE TABLE IF NOT EXISTS hints (key TEXT PRIMARY KEY, hints TEXT NOT NULL, created_at REAL NOT NULL)')
+            self._db.execute('CREATE INDEX IF NOT EXISTS hints_created_at ON hints (created_at)')
+            self._db.commit()
+
+    @staticmethod
+    def key(sign_codes: Iterable[str], llm_model_name: str, temperature: float, max_tokens: int) -> HintCacheKey:
+        '''
+        Builds the canonical cache key of a completion: the sign set and the generation parameters.
+        '''
+        return sign_set(sign_codes), llm_model_name, float(temperature), int(max_tokens)
+
+    def _expired(self, created_at: float) -> bool:
+        return self.ttl is not None and time.time() - created_at > self.ttl
+
+    def get(self, key: HintCacheKey) -> Optional[str]:
+        '''
+        Returns the cached hints for the given key, or None if there are none or they expired.
+        '''
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and self._expired(entry[1]):
+                del self._entries[key]
+                entry = None
+
+            if entry is None and self._db is not None:
+                row = self._db.execute('SELECT hints, created_at FROM hints WHERE key = ?', (json.dumps(key),)).fetchone()
+                if row is not None and not self._expired(row[1]):
+                    entry = (row[0], row[1])
+                    self._insert(key, entry)
+
+            if entry is None:
+                self._misses += 1
+                return None
+
+            self._entries.move_to_end(key)
+            self._hits += 1
+            return entry[0]
+
+    def _insert(self, key: HintCacheKey, entry: Tuple[str, float]):
+        self._entries[key] = entry
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    def set(self, key: HintCacheKey, hints: str):
+        '''
+        Stores the hints generated for the given key.
+        '''
+        created_at = time.time()
+        with self._lock:
+            self._insert(key, (hints, created_at))
+            if self._db is not None:
+                self._db.execute('INSERT OR REPLACE INTO hints (key, hints, created_at) VALUES (?, ?, ?)',
+                                 (json.dumps(key), hints, created_at))
+                self._inserts += 1
+                if self._inserts % self._evict_every == 0:
+                    self._evict()
+                self._db.commit()
+
+    def _evict(self):
+        '''
+        Deletes the expired entries from the database, then the oldest ones above `max_disk_size`, walking the `created_at` index.
+        '''
+        if self.ttl is not None:
+            self._db.execute('DELETE FROM hints WHERE created_at < ?', (time.time() - self.ttl,))
+        excess = self._db.execute('SELECT COUNT(*) FROM hints').fetchone()[0] - self.max_disk_size
+        if excess > 0:
+            self._db.execute('DELETE FROM hints WHERE key IN (SELECT key FROM hints ORDER BY created_at LIMIT ?)', (excess,))
+
+    def stats(self) -> dict:
+        '''
+        Returns the size and hit/miss counters of the cache.
+        '''
+        with self._lock:
+            lookups = self._hits + self._misses
+            return {
+                'size': len(self._entries),
+                'max_size': self.max_size,
+                'hits': self._hits,
+                'misses': self._misses,
+                'hit_rate': self._hits / lookups if lookups else 0.0,
+            }
@@ -0,0 +1,249 @@
+'''
+Library of driving hints generated offline for single signs and the most frequent sign combinations.
+
+Most frames contain one or two signs of a closed catalog, so the hints of every sign code and of
+the sign sets most often seen in the prediction logs are generated once, with the LLM, and
+shipped next to the weights as a versioned JSON table indexed by sign set. At serving time, the
+hints of a covered sign set are read from memory instead of calling the LLM.
+
+The logs are JSON lines with a `sign_codes` list, like the output of `src.models.batch_predict`.
+With `LLM_BACKEND=fake`, the library is generated offline by the stub LLM. The backend and a hash of
+the prompt and generation settings are recorded in the library, which is only served by the same
+backend with the same prompt and settings.
+
+Usage:
+    python -m src.models.HintLibrary [--logs results.jsonl ...] [--max-combinations 200] [--min-count 2]
+'''
+
+from src.models.prompts.templates import MAIN_PROMPT_TEMPLATE, SIGN_FRAGMENT_TEMPLATE
+from src.models.HintCache import SignSet, sign_set
+from src.config.settings import settings
+from collections import Counter
+from datetime import datetime, timezone
+from typing import Callable, Dict, Iterable, List, Optional, Sequence
+import threading
+import argparse
+import hashlib
+import json
+import os
+
+HINT_LIBRARY_VERSION = 1
+
+def prompt_hash(prompt_template: str = MAIN_PROMPT_TEMPLATE, temperature: float = settings.temperature,
+                max_tokens: int = settings.max_tokens, prompt_max_tokens: int = settings.prompt_max_tokens,
+                prompt_description_chars: int = settings.prompt_description_chars,
+                prompt_category_priority: Sequence[str] = settings.prompt_category_priority) -> str:
+    '''
+    Returns a hash of what the hints depend on besides the model and the signs, to detect libraries generated
+    with another prompt: the prompt templates, the token budget, truncation and order of the signs in the
+    prompt (see `PromptBuilder`), the temperature and the maximum number of generated tokens.
+    '''
+    generation = {
+        'prompt_template': prompt_template,
+        'sign_fragment_template': SIGN_FRAGMENT_TEMPLATE,
+        'temperature': float(temperature),
+        'max_tokens': int(max_tokens),
+        'prompt_max_tokens': int(prompt_max_tokens),
+        'prompt_description_chars': int(prompt_description_chars),
+        'prompt_category_priority': list(prompt_category_priority),
+    }
+    return hashlib.sha256(json.dumps(generation, sort_keys=True).encode('utf-8')).hexdigest()[:16]
+
+
+def count_sign_sets(log_paths: Iterable[str], sizes: Iterable[int] = (2, 3)) -> Counter:
+    '''
+    Counts the sign sets of the given sizes detected in the prediction logs.
+
+    Parameters
+    ----------
+    log_paths: Iterable[str]
+        JSONL files whose records have a `sign_codes` list. Records without it (e.g. errors) are skipped.
+    sizes: Iterable[int]
+        The numbers of distinct signs of the counted sets.
+    '''
+    sizes = set(sizes)
+    counts = Counter()
+    for path in log_paths:
+        with open(path, 'r', encoding='utf-8') as f:
+            for line in f:
+                try:
+                    codes = sign_set(json.loads(line)['sign_codes'])
+                except (ValueError, KeyError, TypeError):
+                    continue
+                if len(codes) in sizes:
+                    counts[codes] += 1
+    return counts
+
+
+class HintLibrary:
+    """
+    Class representing the on-disk table of pregenerated hints, keyed by sign set.
+    """
+
+    def __init__(self, path: str = settings.hint_library_path):
+        """
+        Initializes the library.
+
+        Parameters
+        ----------
+        path: str
+            The path to the JSON file backing the library.
+        """
+        self.path = path
+        self.version: Optional[int] = None
+        self.built_at: Optional[str] = None
+        self.llm_model_name: Optional[str] = None
+        self.llm_backend: Optional[str] = None
+        self.prompt_hash: Optional[str] = None
+        self.hints: Dict[SignSet, str] = {}
+
+    def __len__(self) -> int:
+        return len(self.hints)
+
+    def get(self, sign_codes: Iterable[str], llm_model_name: str, generation_hash: Optional[str] = None) -> Optional[str]:
+        '''
+        Returns the hints of the given sign codes, or None if the sign set is not covered
+        or the library was generated by another model, or with another prompt if `generation_hash` is given.
+        '''
+        if llm_model_name != self.llm_model_name:
+            return None
+        if generation_hash is not None and generation_hash != self.prompt_hash:
+            return None
+        return self.hints.get(sign_set(sign_codes))
+
+    def load(self, llm_backend: str = settings.llm_backend) -> 'HintLibrary':
+        '''
+        Loads the library from disk. A missing library is treated as empty, and so is a library generated
+        by another LLM backend (e.g. the stub LLM of `LLM_BACKEND=fake`) or with another prompt or
+        generation settings than the current ones.
+
+        Parameters
+        ----------
+        llm_backend: str
+            The LLM backend answering the requests that are not covered by the library.
+
+        Raises
+        ------
+        ValueError
+            If the library on disk was built with an incompatible version.
+        '''
+        if not os.path.exists(self.path):
+            return self
+
+        with open(self.path, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+
+        if data.get('version') != HINT_LIBRARY_VERSION:
+            raise ValueError(f"Unsupported hint library version {data.get('version')}, expected {HINT_LIBRARY_VERSION}. Please regenerate the library")
+        if data.get('llm_backend') != llm_backend:
+            print(f"Ignoring the hint library at {self.path}, it was generated by the {data.get('llm_backend')} LLM backend "
+                  f"instead of {llm_backend}")
+            return self
+        if data.get('prompt_hash') != prompt_hash():
+            print(f"Ignoring the hint library at {self.path}, it was generated with another prompt or other generation settings "
+                  f"(TEMPERATURE, MAX_TOKENS, PROMPT_MAX_TOKENS, PROMPT_DESCRIPTION_CHARS, PROMPT_CATEGORY_PRIORITY). "
+                  f"Run `python -m src.models.HintLibrary --refresh` to regenerate it")
+            return self
+
+        self.version = data['version']
+        self.built_at = data.get('built_at')
+        self.llm_model_name = data['llm_model_name']
+        self.llm_backend = data['llm_backend']
+        self.prompt_hash = data['prompt_hash']
+        self.hints = {tuple(key.split('|')): hints for key, hints in data['hints'].items()}
+        return self
+
+    def save(self) -> 'HintLibrary':
+        '''
+        Atomically writes the library to disk.
+        '''
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        tmp_path = f'{self.path}.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({'version': self.version, 'built_at': self.built_at, 'llm_model_name': self.llm_model_name,
+                       'llm_backend': self.llm_backend, 'prompt_hash': self.prompt_hash, 'hints': {'|'.join(key): hints for key, hints in self.hints.items()}},
+                      f, ensure_ascii=False, indent=1, sort_keys=True)
+        os.replace(tmp_path, self.path)
+        return self
+
+    def build(self, sign_sets: Iterable[SignSet], generate: Callable[[SignSet], str], llm_model_name: str,
+              llm_backend: str = settings.llm_backend) -> 'HintLibrary':
+        '''
+        Generates the hints of every given sign set.
+
+        Parameters
+        ----------
+        sign_sets: Iterable[SignSet]
+            The sign sets to generate the hints of.
+        generate: Callable[[SignSet], str]
+            Callable returning the hints of a sign set.
+        llm_model_name: str
+            The name of the LLM generating the hints.
+        llm_backend: str
+            The LLM backend generating the hints.
+        '''
+        hints = {}
+        for i, key in enumerate(sign_sets):
+            hints[sign_set(key)] = generate(key)
+            print(f"{i + 1} sign sets generated", end='\r')
+
+        self.version = HINT_LIBRARY_VERSION
+        self.built_at = datetime.now(timezone.utc).isoformat()
+        self.llm_model_name = llm_model_name
+        self.llm_backend = llm_backend
+        self.prompt_hash = prompt_hash()
+        self.hints = hints
+        return self
+
+
+_library: Optional[HintLibrary] = None
+_library_lock = threading.Lock()
+
+
+def get_hint_library() -> HintLibrary:
+    '''
+    Returns the process-wide hint library, loading it from disk on first use.
+    '''
+    global _library
+    if _library is None:
+        with _library_lock:
+            if _library is None:
+                _library = HintLibrary().load()
+    return _library
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Generate the library of hints of single signs and frequent sign combinations')
+    parser.add_argument('--output', default=settings.hint_library_path, help='Path of the library file')
+    parser.add_argument('--refresh', action='store_true', help='Regenerate the library even if it already exists')
+    parser.add_argument('--llm-model-name', default='llama-v3p1-405b-instruct')
+    parser.add_argument('--logs', nargs='*', default=[], help='JSONL prediction logs the frequent sign combinations are counted in')
+    parser.add_argument('--max-combinations', type=int, default=200, help='Maximum number of pairs and triples of signs')
+    parser.add_argument('--min-count', type=int, default=2, help='Minimum number of occurrences of a pair or triple in the logs')
+    args = parser.parse_args()
+
+    from src.models.types.TrafficSign import TrafficSign, load_category_mapping
+    from src.models.LLM import LLM
+
+    if os.path.exists(args.output) and not args.refresh:
+        print(f"Hint library already exists at {args.output}, use --refresh to regenerate it")
+        return
+
+    combinations = [key for key, count in count_sign_sets(args.logs).most_common(args.max_combinations) if count >= args.min_count]
+    sign_sets: List[SignSet] = [(sign_code,) for sign_code in sorted(set(load_category_mapping().values()))] + combinations
+
+    # An empty library, so that the hints are generated instead of read from the existing one,
+    # and no fallback, so that failed generations are reported instead of stored
+    llm = LLM(llm_model_name=args.llm_model_name, hint_library=HintLibrary(path=args.output))
+
+    def generate(key: SignSet) -> str:
+        return llm.get_driving_hints([TrafficSign(sign_code=sign_code) for sign_code in key], fallback=False)
+
+    library = HintLibrary(path=args.output).build(sign_sets, generate, args.llm_model_name, settings.llm_backend).save()
+    counts = Counter(len(key) for key in library.hints)
+    print(f"\nSaved the hints of {len(library)} sign sets generated by the {library.llm_backend} LLM backend to {library.path}: "
+          + ', '.join(f"{count} of {size} sign{'s' if size > 1 else ''}" for size, count in sorted(counts.items())))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,191 @@
+'''
+Decoding of the uploaded frames straight to the size the object detection model needs.
+
+ultralytics letterboxes every image (or every tile, with tiled inference) to `settings.image_width`
+x `settings.image_height`, so decoding a large dashcam frame at full resolution is mostly wasted. JPEG frames are decoded with
+DCT scaling (`Image.draft`) to the smallest size that is still at least the model input size,
+and raw NV12 frames are converted at half resolution when that is enough. The detections are
+then scaled back to the coordinates of the original frame with `DecodedFrame.restore`.
+'''
+
+from src.models.types.Detections import Detections
+from src.models.FrameTiler import FrameTiler
+from src.config.settings import settings
+from typing import Literal, Optional, Tuple, Union
+from PIL import Image, ImageMode
+import numpy as np
+import time
+import io
+
+PixelFormat = Literal['rgb', 'nv12']
+
+Buffer = Union[bytes, bytearray, memoryview]
+
+
+def decode_size() -> Tuple[int, int]:
+    '''
+    Returns the smallest size frames can be decoded at without losing detail for object detection:
+    the model input size, or larger with tiled inference so that every tile is still at least the model input size.
+    '''
+    input_size = (settings.image_width, settings.image_height)
+    if settings.detector_tiling:
+        return FrameTiler().min_frame_size(input_size)
+    return input_size
+
+
+def _stored_bytes(image: Image.Image) -> int:
+    '''
+    Returns the number of bytes PIL wrote to store the pixels of an image: none if the image wraps the buffer it was
+    created from, which `Image.frombuffer` only does for the modes stored as is, otherwise its whole pixel storage,
+    where the pixels of 3-band modes such as RGB are padded to 4 bytes.
+    '''
+    if image.readonly:
+        return 0
+    bands = len(image.getbands())
+    return image.width * image.height * (4 if bands == 3 else bands) * int(ImageMode.getmode(image.mode).typestr[-1])
+
+
+class DecodedFrame:
+    """
+    Class representing a frame decoded for object detection, with the cost of decoding it.
+
+    Parameters
+    ----------
+    image: Image
+        The decoded frame, possibly smaller than the original one.
+    original_size: Tuple[int, int]
+        The width and height of the original frame.
+    bytes_copied: int
+        The number of bytes of the buffers written while ingesting the frame: the received body and the decoded pixels,
+        not counting the buffers that were wrapped instead of copied.
+    decode_ms: float
+        The decoding time in milliseconds.
+    """
+
+    def __init__(self, image: Image, original_size: Tuple[int, int], bytes_copied: int, decode_ms: float):
+        self.image = image
+        self.original_size = original_size
+        self.bytes_copied = bytes_copied
+        self.decode_ms = decode_ms
+
+    def restore(self, detections: Detections) -> Detections:
+        '''
+        Scales the detections made on the decoded frame back to the coordinates of the original frame.
+        '''
+        return detections.scale(self.original_size[0] / self.image.width, self.original_size[1] / self.image.height)
+
+    def stats(self) -> dict:
+        return {
+            'original_size': list(self.original_size),
+            'decoded_size': [self.image.width, self.image.height],
+            'bytes_copied': self.bytes_copied,
+            'decode_ms': self.decode_ms,
+        }
+
+
+def decode_image(data: Buffer, target_size: Optional[Tuple[int, int]] = None) -> DecodedFrame:
+    '''
+    Decodes an encoded image (JPEG, PNG, ...) from an in-memory buffer.
+    JPEG images are decoded directly at a reduced size that is still at least `target_size`.
+
+    Parameters
+    ----------
+    data: Buffer
+        The encoded image.
+    target_size: Optional[Tuple[int, int]]
+        The minimum width and height of the decoded frame. Defaults to `decode_size()`.
+
+    Returns
+    -------
+    DecodedFrame
+        The decoded RGB frame.
+
+    Raises
+    ------
+    PIL.UnidentifiedImageError
+        If the image format is not recognized.
+    '''
+    start = time.perf_counter()
+    # BytesIO shares the memory of an immutable bytes object instead of copying it
+    image = Image.open(io.BytesIO(data))
+    original_size = image.size
+    if image.format == 'JPEG':
+        # Only sets the DCT scale, the decoding itself happens on `load`
+        image.draft('RGB', target_size or decode_size())
+    image.load()
+    bytes_copied = _stored_bytes(image)
+    if image.mode != 'RGB':
+        image = image.convert('RGB')
+        bytes_copied += _stored_bytes(image)
+    return DecodedFrame(image, original_size, bytes_copied, (time.perf_counter() - start) * 1000)
+
+
+def _nv12_to_rgb(y: np.ndarray, uv: np.ndarray) -> np.ndarray:
+    '''
+    Converts full range BT.601 luma and interleaved chroma planes of the same size to RGB.
+    '''
+    y = y.astype(np.float32)
+    u = uv[..., 0].astype(np.float32) - 128
+    v = uv[..., 1].astype(np.float32) - 128
+    rgb = np.stack([y + 1.402 * v, y - 0.344136 * u - 0.714136 * v, y + 1.772 * u], axis=-1)
+    return np.clip(rgb, 0, 255).astype(np.uint8)
+
+
+def decode_raw(data: Buffer, width: int, height: int, pixel_format: PixelFormat = 'rgb',
+               target_size: Optional[Tuple[int, int]] = None) -> DecodedFrame:
+    '''
+    Converts a raw frame with explicit dimensions to an image, without decoding.
+
+    RGB frames are used at their original size, PIL copies them to its own pixel layout. NV12 frames are converted to RGB at half
+    resolution, by subsampling the luma plane to the size of the chroma plane, when that is
+    still at least `target_size`, and at full resolution otherwise.
+
+    Parameters
+    ----------
+    data: Buffer
+        The raw pixels: `height` rows of `width` RGB triplets, or an NV12 luma plane followed by the interleaved chroma plane.
+    width: int
+        The width of the frame.
+    height: int
+        The height of the frame.
+    pixel_format: PixelFormat
+        The pixel format of the frame.
+    target_size: Optional[Tuple[int, int]]
+        The minimum width and height of the converted frame. Defaults to `decode_size()`.
+
+    Returns
+    -------
+    DecodedFrame
+        The RGB frame.
+
+    Raises
+    ------
+    ValueError
+        If the buffer size does not match the dimensions and the pixel format.
+    '''
+    start = time.perf_counter()
+    if pixel_format == 'rgb':
+        if len(data) != width * height * 3:
+            raise ValueError(f"Expected {width * height * 3} bytes for a {width}x{height} RGB frame, got {len(data)}")
+        image = Image.frombuffer('RGB', (width, height), data, 'raw', 'RGB', 0, 1)
+        bytes_copied = _stored_bytes(image)
+    elif pixel_format == 'nv12':
+        if width % 2 or height % 2:
+            raise ValueError("NV12 frames must have an even width and height")
+        if len(data) != width * height * 3 // 2:
+            raise ValueError(f"Expected {width * height * 3 // 2} bytes for a {width}x{height} NV12 frame, got {len(data)}")
+        # Views of the request buffer, no copy until the conversion
+        pixels = np.frombuffer(data, dtype=np.uint8)
+        y = pixels[:width * height].reshape(height, width)
+        uv = pixels[width * height:].reshape(height // 2, width // 2, 2)
+        target_size = target_size or decode_size()
+        if width // 2 >= target_size[0] and height // 2 >= target_size[1]:
+            rgb = _nv12_to_rgb(y[::2, ::2], uv)
+        else:
+            rgb = _nv12_to_rgb(y, uv.repeat(2, axis=0).repeat(2, axis=1))
+        image = Image.fromarray(rgb)
+        # The converted array and its copy into the image
+        bytes_copied = rgb.nbytes + _stored_bytes(image)
+    else:
+        raise ValueError(f"Unsupported pixel format {pixel_format}")
+    return DecodedFrame(image, (width, height), bytes_copied, (time.perf_counter() - start) * 1000)
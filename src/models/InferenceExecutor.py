@@ -0,0 +1,195 @@
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Callable, Optional, TYPE_CHECKING
+from src.config.settings import settings
+from src.models.metrics import observe_stage, stage
+from src.models.RequestScheduler import EDFScheduler
+import contextvars
+import threading
+import asyncio
+import time
+
+if TYPE_CHECKING:
+    from src.models.BatchScheduler import BatchScheduler
+
+
+class QueueFullError(Exception):
+    def __init__(self, retry_after: int):
+        super().__init__(f"Inference queue is full, retry in {retry_after} seconds")
+        self.retry_after = retry_after
+
+
+class InferenceExecutor:
+    """
+    Class representing a bounded worker pool for the CPU-bound object detection work.
+
+    Jobs are admitted until `max_workers + max_queue_size` of them are pending, after which
+    `QueueFullError` is raised instead of queueing more work. The admitted jobs wait for a worker
+    in the order of their deadline, and the jobs whose deadline passed while waiting are dropped.
+
+    The calls to the model of the server process run one at a time whatever the number of workers,
+    object detection runs in parallel on the inference processes of `DetectionWorkerPool` or in the
+    batches of `BatchScheduler`.
+    """
+
+    def __init__(self, max_workers: int = settings.inference_workers,
+                 max_queue_size: int = settings.inference_queue_size,
+                 retry_after: int = settings.inference_retry_after,
+                 scheduler: Optional[EDFScheduler] = None):
+        """
+        Initializes the executor.
+
+        Parameters
+        ----------
+        max_workers: int
+            The number of worker threads running the jobs.
+        max_queue_size: int
+            The maximum number of jobs waiting for a free worker.
+        retry_after: int
+            The number of seconds clients are asked to wait when the queue is full.
+        scheduler: Optional[EDFScheduler]
+            The scheduler ordering the jobs waiting for a worker. Defaults to one slot per worker.
+        """
+        self.max_workers = max_workers
+        self.max_queue_size = max_queue_size
+        self.retry_after = retry_after
+        self.scheduler = scheduler if scheduler is not None else EDFScheduler('detect', max_workers)
+
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='inference')
+        self._lock = threading.Lock()
+        self._pending = 0
+        self._running = 0
+        self._completed = 0
+        self._rejected = 0
+        self._wait_time_total = 0.0
+        self._wait_time_max = 0.0
+
+    @property
+    def queue_depth(self) -> int:
+        '''
+        The number of admitted jobs waiting for a free worker.
+        '''
+        return self._pending - self._running
+
+    def _admit(self):
+        with self._lock:
+            if self._pending >= self.max_workers + self.max_queue_size:
+                self._rejected += 1
+                raise QueueFullError(self.retry_after)
+            self._pending += 1
+
+    def _start(self, submitted_at: float):
+        wait_time = time.perf_counter() - submitted_at
+        with self._lock:
+            self._running += 1
+            self._wait_time_total += wait_time
+            self._wait_time_max = max(self._wait_time_max, wait_time)
+        observe_stage('queue_wait', wait_time)
+
+    def _release(self, future: Optional[Future] = None):
+        # Also called for jobs cancelled or dropped before they started, so the slot is never leaked
+        with self._lock:
+            self._pending -= 1
+            if future is not None and not future.cancelled():
+                self._running -= 1
+                self._completed += 1
+
+    async def _schedule(self) -> Callable[[Future], None]:
+        '''
+        Waits for the turn of the current request, and returns a callback handing its slot over to the next one.
+
+        Raises
+        ------
+        DeadlineExceededError
+            If the deadline of the request passed while waiting.
+        '''
+        try:
+            await self.scheduler.acquire()
+        except BaseException:
+            self._release()
+            raise
+        loop = asyncio.get_running_loop()
+
+        def release_slot(future: Future):
+            # The scheduler belongs to the event loop, the job finishes on a worker thread
+            if not loop.is_closed():
+                loop.call_soon_threadsafe(self.scheduler.release)
+
+        return release_slot
+
+    async def run(self, fn: Callable, *args, **kwargs) -> Any:
+        '''
+        Runs the given function on the worker pool without blocking the event loop.
+
+        Raises
+        ------
+        QueueFullError
+            If the queue is full.
+        DeadlineExceededError
+            If the deadline of the request passed before a worker was free.
+        '''
+        self._admit()
+        submitted_at = time.perf_counter()
+        release_slot = await self._schedule()
+
+        def job():
+            self._start(submitted_at)
+            with stage('detect'):
+                return fn(*args, **kwargs)
+
+        # Run the job in the context of the caller, so that its stages are recorded in the caller's trace
+        future = self._pool.submit(contextvars.copy_context().run, job)
+        future.add_done_callback(release_slot)
+        future.add_done_callback(self._release)
+        return await asyncio.wrap_future(future)
+
+    async def run_batched(self, scheduler: 'BatchScheduler', *args, **kwargs) -> Any:
+        '''
+        Runs a job through the given batch scheduler instead of the worker pool, under the same admission control and scheduling.
+
+        Raises
+        ------
+        QueueFullError
+            If the queue is full.
+        DeadlineExceededError
+            If the deadline of the request passed before it was scheduled.
+        '''
+        self._admit()
+        submitted_at = time.perf_counter()
+        release_slot = await self._schedule()
+        context = contextvars.copy_context()
+        started_at = []
+
+        def on_start():
+            started_at.append(time.perf_counter())
+            context.run(self._start, submitted_at)
+
+        def on_done(future: Future):
+            # The batch runs on the scheduler thread, the job is timed from its start to its result
+            if started_at:
+                context.run(observe_stage, 'detect', time.perf_counter() - started_at[0])
+            self._release(future)
+
+        future = scheduler.submit(*args, on_start=on_start, **kwargs)
+        future.add_done_callback(release_slot)
+        future.add_done_callback(on_done)
+        return await asyncio.wrap_future(future)
+
+    def stats(self) -> dict:
+        '''
+        Returns the queue depth and wait time statistics of the executor.
+        '''
+        with self._lock:
+            started = self._completed + self._running
+            return {
+                'workers': self.max_workers,
+                'max_queue_size': self.max_queue_size,
+                'running': self._running,
+                'queue_depth': self._pending - self._running,
+                'completed': self._completed,
+                'rejected': self._rejected,
+                'wait_time_avg_ms': self._wait_time_total / started * 1000 if started else 0.0,
+                'wait_time_max_ms': self._wait_time_max * 1000,
+            }
+
+    def shutdown(self):
+        self._pool.shutdown(wait=False, cancel_futures=True)
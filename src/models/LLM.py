@@ -1,11 +1,25 @@
-from typing import List, Optional
+from typing import AsyncIterator, Dict, List, Optional, Tuple
 from pydantic import BaseModel, Field, PrivateAttr, SecretStr
 from langchain_core.prompts.prompt import PromptTemplate
-from src.models.prompts.templates import MAIN_PROMPT_TEMPLATE
+from src.models.prompts.templates import MAIN_PROMPT_TEMPLATE, NO_SIGNS_RESPONSE, FALLBACK_HINTS_TEMPLATE
 from langchain_core.runnables.base import RunnableSequence
-from langchain_fireworks import Fireworks
+from src.models.FireworksLLM import FireworksLLM
+from src.models.FakeLLM import FakeLLM
 from src.models.types.TrafficSign import TrafficSign
+from src.models.types.Detections import Detections
+from src.models.HintCache import HintCache, HintCacheKey
+from src.models.PromptBuilder import PromptBuilder, SHORT
+from src.models.HintLibrary import HintLibrary, get_hint_library, prompt_hash
+from src.models.RequestScheduler import EDFScheduler
+from src.models.metrics import HINT_LIBRARY_HITS, LLM_FALLBACKS, LLM_HEDGES, LLM_RETRIES, PROMPT_TOKENS, observe_stage, stage
 from src.config.settings import settings
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from contextlib import nullcontext
+import threading
+import asyncio
+import random
+import httpx
+import time
 
 
 class ModelNotAvailableError(Exception):
@@ -17,9 +31,14 @@ class LLM(BaseModel):
     Class representing a Language Model (LLM) for generating text.
     """
 
-    _llm: Optional[Fireworks] = PrivateAttr(None)
-    _llm_chain: Optional[RunnableSequence] = PrivateAttr(None)
+    _llm_chains: Dict[str, RunnableSequence] = PrivateAttr(default_factory=dict)
+    _llm_chains_lock: threading.Lock = PrivateAttr(default_factory=threading.Lock)
     _api_key: SecretStr = PrivateAttr(None)
+    _hint_cache: Optional[HintCache] = PrivateAttr(None)
+    _prompt_builder: PromptBuilder = PrivateAttr(None)
+    _hint_library: HintLibrary = PrivateAttr(None)
+    _prompt_hash: str = PrivateAttr(None)
+    _scheduler: Optional[EDFScheduler] = PrivateAttr(None)
 
     llm_model_name: str = Field(None)
     prompt: PromptTemplate = Field(None)
@@ -27,10 +46,12 @@ class LLM(BaseModel):
     available_llms: List[str] = Field(None)
     temperature: float = Field(None)
 
-    def __init__(self, llm_model_name: str, api_key: str = settings.fireworks_api_key,
+    def __init__(self, llm_model_name: str, api_key: Optional[str] = settings.fireworks_api_key,
                  prompt_template: str = MAIN_PROMPT_TEMPLATE,
                  available_llms: List[str] = settings.available_llms,
-                 max_tokens: int = settings.max_tokens, temperature: float = settings.temperature):
+                 max_tokens: int = settings.max_tokens, temperature: float = settings.temperature,
+                 hint_cache: Optional[HintCache] = None, prompt_builder: Optional[PromptBuilder] = None,
+                 hint_library: Optional[HintLibrary] = None, warm_up: bool = settings.llm_warm_up):
         """
         Initializes the Language Model (LLM) with the specified name.
 
@@ -48,6 +69,14 @@ class LLM(BaseModel):
             The maximum number of tokens to generate.
         temperature: float
             The temperature for completition generation.
+        hint_cache: Optional[HintCache]
+            The cache of generated hints. Defaults to a new cache configured from the settings.
+        prompt_builder: Optional[PromptBuilder]
+            The builder of the road signs section of the prompt. Defaults to a new builder configured from the settings.
+        hint_library: Optional[HintLibrary]
+            The pregenerated hints answered without calling the LLM. Defaults to the process-wide library if HINT_LIBRARY is set.
+        warm_up: bool
+            Flag indicating whether to build the chains of all the available LLMs upfront instead of on first use.
         """
         prompt = PromptTemplate(template=prompt_template, input_variables=['road_signs'])
         super().__init__(llm_model_name=llm_model_name,
@@ -55,33 +84,64 @@ class LLM(BaseModel):
                          max_tokens=max_tokens, temperature=temperature)
 
         self._api_key = api_key
+        self._hint_cache = hint_cache if hint_cache is not None else HintCache()
+        self._prompt_builder = prompt_builder if prompt_builder is not None else PromptBuilder()
+        if hint_library is None:
+            hint_library = get_hint_library() if settings.hint_library else HintLibrary()
+        self._hint_library = hint_library
+        # The library is only answered from when it was generated with the same prompt and generation settings
+        self._prompt_hash = prompt_hash(prompt_template, temperature, max_tokens, self._prompt_builder.max_tokens,
+                                        self._prompt_builder.max_description_chars, list(self._prompt_builder.category_priority))
+        if settings.llm_concurrency > 0:
+            self._scheduler = EDFScheduler('llm', settings.llm_concurrency)
 
-        self._init_llm(llm_model_name=llm_model_name)
+        self._get_llm_chain(llm_model_name)
+        if settings.llm_hedge_model:
+            self._get_llm_chain(settings.llm_hedge_model)
+        if warm_up:
+            for available_llm in self.available_llms:
+                self._get_llm_chain(available_llm)
 
-    def _init_llm(self, llm_model_name: str):
+    def _get_llm_chain(self, llm_model_name: str) -> RunnableSequence:
         """
-        Initializes the Language Model (LLM) with the specified name.
+        Returns the chain of the Language Model (LLM) with the specified name, building it on first use.
+        Chains are never mutated once built, so they can be shared by concurrent requests.
 
         Parameters
         ----------
         llm_model_name: str
             The name of the Language Model (LLM).
+
+        Raises
+        ------
+        ModelNotAvailableError
+            If the model is not in the list of available LLMs.
         """
+        llm_chain = self._llm_chains.get(llm_model_name)
+        if llm_chain is not None:
+            return llm_chain
+
         if llm_model_name not in self.available_llms:
             raise ModelNotAvailableError(f"Provided model name {llm_model_name} is not supported. Please choose from {self.available_llms}")
 
-        llm = Fireworks(model=f"accounts/fireworks/models/{llm_model_name}", fireworks_api_key=self._api_key,
-                        temperature=self.temperature, max_tokens=self.max_tokens)
-
-        llm_chain = self.prompt | llm
-
-        self._llm = llm
-        self._llm_chain = llm_chain
-        self.llm_model_name = llm_model_name
+        with self._llm_chains_lock:
+            if llm_model_name not in self._llm_chains:
+                if settings.llm_backend == 'fake':
+                    llm = FakeLLM(response=settings.fake_llm_response, first_token_delay=settings.fake_llm_first_token_delay,
+                                  token_delay=settings.fake_llm_token_delay)
+                else:
+                    if not self._api_key:
+                        raise ValueError("FIREWORKS_API_KEY is not set, it is required by the fireworks LLM backend")
+                    llm = FireworksLLM(model=f"accounts/fireworks/models/{llm_model_name}", fireworks_api_key=self._api_key,
+                                       temperature=self.temperature, max_tokens=self.max_tokens,
+                                       timeout=self._timeout(llm_model_name))
+                self._llm_chains[llm_model_name] = self.prompt | llm
+            return self._llm_chains[llm_model_name]
 
     def _format_input(self, road_signs: List[TrafficSign]) -> str:
         """
-        Formats the input for the Language Model (LLM).
+        Formats the input for the Language Model (LLM): one compact line per distinct sign, the most important first,
+        within the PROMPT_MAX_TOKENS budget.
 
         Parameters
         ----------
@@ -93,36 +153,377 @@ class LLM(BaseModel):
         str
             The formatted input for the Language Model (LLM).
         """
-        road_sign_template = """Road sign {sign_code}:
-                                    SIGN_NAME: {name}
-                                    SIGN_CATEGORY: {category}
-                                    SIGN_DESCRIPTION: {description}\n"""
-        input_str = ""
-        for road_sign in road_signs:
-            input_str += road_sign_template.format(sign_code=road_sign.sign_code,
-                                                   name=road_sign.name,
-                                                   category=road_sign.category,
-                                                   description=road_sign.description)
+        input_str, tokens = self._prompt_builder.build(road_signs)
+        PROMPT_TOKENS.observe(tokens)
+        if settings.log_prompt_tokens:
+            print(f"Prompt of {len(road_signs)} detections: {len(input_str.splitlines())} signs, ~{tokens} tokens")
         return input_str
 
-    def get_driving_hints(self, road_signs: List[TrafficSign], llm_model_name: Optional[str] = None) -> str:
+    @property
+    def hint_cache(self) -> HintCache:
+        return self._hint_cache
+
+    @property
+    def scheduler(self) -> Optional[EDFScheduler]:
+        return self._scheduler
+
+    def _llm_slot(self):
+        '''
+        Returns the context waiting for one of the LLM_CONCURRENCY slots of the asynchronous LLM calls, earliest deadline first.
+        '''
+        return self._scheduler if self._scheduler is not None else nullcontext()
+
+    @staticmethod
+    def _sign_codes(road_signs: List[TrafficSign]) -> List[str]:
+        return road_signs.sign_codes if isinstance(road_signs, Detections) else [road_sign.sign_code for road_sign in road_signs]
+
+    def _cache_key(self, road_signs: List[TrafficSign], llm_model_name: str) -> Optional[HintCacheKey]:
+        """
+        Returns the hint cache key of the given road signs, or None if the completition is not deterministic and must not be cached.
+        """
+        if self.temperature != 0:
+            return None
+        return HintCache.key(self._sign_codes(road_signs), llm_model_name, self.temperature, self.max_tokens)
+
+    def _library_hints(self, road_signs: List[TrafficSign], llm_model_name: str) -> Optional[str]:
+        """
+        Returns the pregenerated hints of the given road signs, or None if their sign set is not in the hint library
+        or the library was generated with another prompt or other generation settings than this LLM's.
+        """
+        hints = self._hint_library.get(self._sign_codes(road_signs), llm_model_name, self._prompt_hash)
+        if hints is not None:
+            HINT_LIBRARY_HITS.inc()
+        return hints
+
+    def _timeout(self, llm_model_name: str) -> float:
+        return settings.llm_model_timeouts.get(llm_model_name, settings.llm_timeout)
+
+    def _hedge_model(self, llm_model_name: str) -> Optional[str]:
+        hedge_model = settings.llm_hedge_model
+        return hedge_model if hedge_model and hedge_model != llm_model_name else None
+
+    @staticmethod
+    def _retryable(error: Exception) -> bool:
+        """
+        Returns whether a failed LLM call may succeed when retried: timeouts, connection errors, rate limiting and server errors.
+        """
+        if isinstance(error, httpx.HTTPStatusError):
+            return error.response.status_code == 429 or error.response.status_code >= 500
+        return isinstance(error, (httpx.TransportError, TimeoutError, asyncio.TimeoutError))
+
+    @staticmethod
+    def _backoff(attempt: int) -> float:
+        # Full jitter, so that the retries of requests that failed together are spread out
+        return random.uniform(0, settings.llm_retry_backoff * 2 ** attempt)
+
+    def _fallback_hints(self, road_signs: List[TrafficSign]) -> str:
+        """
+        Builds hints from the names and the first sentence of the descriptions of the road signs, without the LLM.
+        """
+        signs = ' '.join(self._prompt_builder.fragment(sign_code, SHORT)[0] for sign_code in self._prompt_builder.rank(road_signs))
+        return FALLBACK_HINTS_TEMPLATE.format(signs=signs)
+
+    def _invoke(self, llm_model_name: str, prompt_input: dict) -> str:
+        """
+        Calls the LLM, retrying timeouts and transient errors with a jittered exponential backoff.
+        Every call is bounded by the timeout of the model.
+        """
+        llm_chain = self._get_llm_chain(llm_model_name)
+        for attempt in range(settings.llm_retries + 1):
+            try:
+                return llm_chain.invoke(prompt_input)
+            except Exception as e:
+                if attempt == settings.llm_retries or not self._retryable(e):
+                    raise
+            LLM_RETRIES.labels(llm_model_name).inc()
+            time.sleep(self._backoff(attempt))
+
+    async def _ainvoke(self, llm_model_name: str, prompt_input: dict) -> str:
+        """
+        Asynchronously calls the LLM, retrying timeouts and transient errors with a jittered exponential backoff.
+        Every call is bounded by the timeout of the model.
+        """
+        llm_chain = self._get_llm_chain(llm_model_name)
+        for attempt in range(settings.llm_retries + 1):
+            try:
+                return await asyncio.wait_for(llm_chain.ainvoke(prompt_input), self._timeout(llm_model_name))
+            except Exception as e:
+                if attempt == settings.llm_retries or not self._retryable(e):
+                    raise
+            LLM_RETRIES.labels(llm_model_name).inc()
+            await asyncio.sleep(self._backoff(attempt))
+
+    def _generate(self, llm_model_name: str, prompt_input: dict) -> str:
+        """
+        Generates the hints with the requested model, also sending the prompt to the hedge model if it is slow or fails,
+        and returns the first answer within LLM_DEADLINE, like `_agenerate`.
+
+        Raises
+        ------
+        TimeoutError
+            If no model answered before the deadline.
+        """
+        hedge_model = self._hedge_model(llm_model_name)
+        deadline = time.perf_counter() + settings.llm_deadline
+        # On a thread even without hedging, so that the retries of the call are bounded by the deadline too
+        primary = _hedge_executor.submit(self._invoke, llm_model_name, prompt_input)
+        pending = {primary}
+        if hedge_model is not None:
+            done, _ = wait(pending, timeout=settings.llm_hedge_delay)
+            if not done or primary.exception() is not None:
+                LLM_HEDGES.labels(llm_model_name).inc()
+                pending.add(_hedge_executor.submit(self._invoke, hedge_model, prompt_input))
+
+        errors = []
+        while pending:
+            done, pending = wait(pending, timeout=max(0.0, deadline - time.perf_counter()), return_when=FIRST_COMPLETED)
+            if not done:
+                # The abandoned calls finish on their own, bounded by the timeout of their model
+                raise TimeoutError(f"No LLM answered within {settings.llm_deadline}s")
+            for future in done:
+                if future.exception() is None:
+                    return future.result()
+                errors.append(future.exception())
+        raise errors[0]
+
+    async def _agenerate(self, llm_model_name: str, prompt_input: dict) -> str:
+        """
+        Asynchronously generates the hints with the requested model, also sending the prompt to the hedge model
+        if it is slow or fails, and returns the first answer.
+
+        Raises
+        ------
+        TimeoutError
+            If no model answered before the deadline.
+        """
+        hedge_model = self._hedge_model(llm_model_name)
+        primary = asyncio.create_task(self._ainvoke(llm_model_name, prompt_input))
+        pending = {primary}
+        try:
+            async with asyncio.timeout(settings.llm_deadline):
+                if hedge_model is not None:
+                    done, _ = await asyncio.wait(pending, timeout=settings.llm_hedge_delay)
+                    if not done or primary.exception() is not None:
+                        LLM_HEDGES.labels(llm_model_name).inc()
+                        pending.add(asyncio.create_task(self._ainvoke(hedge_model, prompt_input)))
+
+                errors = []
+                while pending:
+                    done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                    for task in done:
+                        if task.exception() is None:
+                            return task.result()
+                        errors.append(task.exception())
+                raise errors[0]
+        finally:
+            for task in pending:
+                task.cancel()
+
+    def _answer_or_fallback(self, road_signs: List[TrafficSign], llm_model_name: str, error: Exception,
+                            fallback: Optional[bool] = None) -> str:
+        if not (settings.llm_fallback if fallback is None else fallback):
+            raise error
+        print(f"LLM {llm_model_name} failed ({error!r}), answering with the fallback hints")
+        LLM_FALLBACKS.labels(llm_model_name).inc()
+        return self._fallback_hints(road_signs)
+
+    def get_driving_hints(self, road_signs: List[TrafficSign], llm_model_name: Optional[str] = None,
+                          fallback: Optional[bool] = None) -> str:
         """
         Generates text completition for the given prompt.
 
+        The hints of the sign sets covered by the hint library are returned without calling the LLM.
+        Timed out and failed calls are retried, and the prompt is also sent to LLM_HEDGE_MODEL if the
+        model is slow. If every call fails, the hints are built from the sign descriptions instead.
+
         Parameters
         ----------
         road_signs: List[TrafficSign]
             The list of road signs to generate completition for.
         llm_model_name: Optional[str]
-            The name of the Language Model (LLM) to use.
+            The name of the Language Model (LLM) to use. Defaults to the model the LLM was initialized with.
+        fallback: Optional[bool]
+            Answer with the hints built from the sign descriptions if the LLM fails, instead of raising. Defaults to LLM_FALLBACK.
 
         Returns
         -------
         str
             The generated completition.
         """
-        if llm_model_name and llm_model_name != self.llm_model_name:
-            self._init_llm(llm_model_name=llm_model_name)
+        llm_model_name = llm_model_name or self.llm_model_name
+        self._get_llm_chain(llm_model_name)
 
-        completition = self._llm_chain.invoke({'road_signs': self._format_input(road_signs)})
+        if not road_signs:
+            return NO_SIGNS_RESPONSE
+
+        if (hints := self._library_hints(road_signs, llm_model_name)) is not None:
+            return hints
+
+        cache_key = self._cache_key(road_signs, llm_model_name)
+        if cache_key is not None and (cached := self._hint_cache.get(cache_key)) is not None:
+            return cached
+
+        with stage('prompt'):
+            prompt_input = {'road_signs': self._format_input(road_signs)}
+        try:
+            with stage('llm'):
+                completition = self._generate(llm_model_name, prompt_input)
+        except Exception as e:
+            # The fallback hints are not cached, the next request asks the LLM again
+            return self._answer_or_fallback(road_signs, llm_model_name, e, fallback)
+
+        if cache_key is not None:
+            self._hint_cache.set(cache_key, completition)
         return completition
+
+    async def aget_driving_hints(self, road_signs: List[TrafficSign], llm_model_name: Optional[str] = None,
+                                 fallback: Optional[bool] = None) -> str:
+        """
+        Asynchronously generates text completition for the given prompt.
+
+        Timed out and failed calls are retried, and the prompt is also sent to LLM_HEDGE_MODEL if the
+        model is slow. If every call fails or LLM_DEADLINE passes, the hints are built from the sign descriptions instead.
+        The calls wait for one of the LLM_CONCURRENCY slots in the order of the deadlines of their requests.
+
+        Parameters
+        ----------
+        road_signs: List[TrafficSign]
+            The list of road signs to generate completition for.
+        llm_model_name: Optional[str]
+            The name of the Language Model (LLM) to use. Defaults to the model the LLM was initialized with.
+        fallback: Optional[bool]
+            Answer with the hints built from the sign descriptions if the LLM fails, instead of raising. Defaults to LLM_FALLBACK.
+
+        Returns
+        -------
+        str
+            The generated completition.
+
+        Raises
+        ------
+        DeadlineExceededError
+            If the deadline of the request passed before a slot was free.
+        """
+        hints, _ = await self.agenerate_driving_hints(road_signs, llm_model_name=llm_model_name, fallback=fallback)
+        return hints
+
+    async def agenerate_driving_hints(self, road_signs: List[TrafficSign], llm_model_name: Optional[str] = None,
+                                      fallback: Optional[bool] = None) -> Tuple[str, bool]:
+        """
+        Asynchronously generates text completition for the given prompt like `aget_driving_hints`, and tells whether
+        it may be reused for the same road signs: the fallback hints and the completitions generated with a non-zero
+        temperature must not be, so that the next request asks the LLM again.
+
+        Returns
+        -------
+        Tuple[str, bool]
+            The generated completition, and whether it may be cached.
+
+        Raises
+        ------
+        DeadlineExceededError
+            If the deadline of the request passed before a slot was free.
+        """
+        llm_model_name = llm_model_name or self.llm_model_name
+        self._get_llm_chain(llm_model_name)
+
+        if not road_signs:
+            return NO_SIGNS_RESPONSE, True
+
+        if (hints := self._library_hints(road_signs, llm_model_name)) is not None:
+            return hints, True
+
+        cache_key = self._cache_key(road_signs, llm_model_name)
+        if cache_key is not None and (cached := self._hint_cache.get(cache_key)) is not None:
+            return cached, True
+
+        # Dropped instead of answered with the fallback hints if the deadline of the request passed while waiting
+        async with self._llm_slot():
+            with stage('prompt'):
+                prompt_input = {'road_signs': self._format_input(road_signs)}
+            try:
+                with stage('llm'):
+                    completition = await self._agenerate(llm_model_name, prompt_input)
+            except Exception as e:
+                # The fallback hints are not cached, the next request asks the LLM again
+                return self._answer_or_fallback(road_signs, llm_model_name, e, fallback), False
+
+        if cache_key is None:
+            return completition, False
+        self._hint_cache.set(cache_key, completition)
+        return completition, True
+
+    async def astream_driving_hints(self, road_signs: List[TrafficSign], llm_model_name: Optional[str] = None) -> AsyncIterator[str]:
+        """
+        Asynchronously generates text completition for the given prompt, yielding the tokens as they are generated.
+        Cached completitions are yielded at once.
+
+        If the first token does not arrive within the timeout of the model, the stream is abandoned and
+        the completition is generated like `aget_driving_hints`, with retries, hedging and the fallback hints,
+        and yielded at once. A stream failing after its first token is not retried.
+
+        Parameters
+        ----------
+        road_signs: List[TrafficSign]
+            The list of road signs to generate completition for.
+        llm_model_name: Optional[str]
+            The name of the Language Model (LLM) to use. Defaults to the model the LLM was initialized with.
+
+        Yields
+        ------
+        str
+            The generated tokens.
+        """
+        llm_model_name = llm_model_name or self.llm_model_name
+        llm_chain = self._get_llm_chain(llm_model_name)
+
+        if not road_signs:
+            yield NO_SIGNS_RESPONSE
+            return
+
+        if (hints := self._library_hints(road_signs, llm_model_name)) is not None:
+            yield hints
+            return
+
+        cache_key = self._cache_key(road_signs, llm_model_name)
+        if cache_key is not None and (cached := self._hint_cache.get(cache_key)) is not None:
+            yield cached
+            return
+
+        # The slot is held while the tokens are streamed, the connection is busy until the last one
+        async with self._llm_slot():
+            with stage('prompt'):
+                prompt_input = {'road_signs': self._format_input(road_signs)}
+            start = time.perf_counter()
+            stream = llm_chain.astream(prompt_input)
+            try:
+                # In this task, the HTTP stream must not be iterated from another one
+                async with asyncio.timeout(self._timeout(llm_model_name)):
+                    first_token = await anext(stream, '')
+            except Exception as e:
+                await stream.aclose()
+                error = e
+            else:
+                error = None
+                tokens = [first_token]
+                yield first_token
+                async for token in stream:
+                    tokens.append(token)
+                    yield token
+                # Not a context manager around the loop, the consumer's time between tokens would be counted too
+                observe_stage('llm', time.perf_counter() - start)
+
+                if cache_key is not None:
+                    self._hint_cache.set(cache_key, ''.join(tokens))
+
+        if error is None:
+            return
+        if not self._retryable(error):
+            yield self._answer_or_fallback(road_signs, llm_model_name, error)
+            return
+        LLM_RETRIES.labels(llm_model_name).inc()
+        yield await self.aget_driving_hints(road_signs, llm_model_name=llm_model_name)
+
+
+# Threads of the calls of `get_driving_hints`, bounded by LLM_DEADLINE and hedged if LLM_HEDGE_MODEL is set
+_hedge_executor = ThreadPoolExecutor(thread_name_prefix='llm-hedge')
@@ -0,0 +1,151 @@
+from src.models.SignMetadataStore import SignMetadataStore, get_sign_metadata_store
+from src.models.types.Detections import Detections
+from src.models.prompts.templates import SIGN_FRAGMENT_TEMPLATE
+from src.config.settings import settings
+from typing import Dict, List, Optional, Sequence, Tuple
+import math
+
+# Levels of detail of a sign fragment, from the most to the least detailed
+FULL, SHORT, NAME = 0, 1, 2
+
+
+def estimate_tokens(text: str) -> int:
+    '''
+    Estimates the number of tokens of a text as one per 4 bytes of UTF-8.
+    This overestimates non-Latin text, which keeps the prompts within the budget;
+    the exact counts reported by the Fireworks API are exported by `/metrics`.
+    '''
+    return math.ceil(len(text.encode('utf-8')) / 4)
+
+
+def truncate(text: str, max_chars: int) -> str:
+    '''
+    Truncates a text to at most `max_chars` characters, at a word boundary.
+    '''
+    if len(text) <= max_chars:
+        return text
+    cut = text[:max_chars - 1].rsplit(' ', 1)[0].rstrip(' ,;:')
+    return f'{cut}…'
+
+
+def first_sentence(text: str) -> str:
+    sentence, separator, _ = text.partition('. ')
+    return sentence + '.' if separator else sentence
+
+
+class PromptBuilder:
+    """
+    Class building the road signs section of the LLM prompt within a token budget.
+
+    Each sign code appears once, whatever the number of boxes and class IDs it was detected as, and
+    the signs are ordered by the priority of their category, then by confidence. The fragment of
+    each sign is rendered once per level of detail and cached. When the fragments exceed the
+    budget, the least important signs are shortened to the first sentence of their description,
+    then to their name, and finally dropped.
+    """
+
+    def __init__(self, max_tokens: int = settings.prompt_max_tokens,
+                 max_description_chars: int = settings.prompt_description_chars,
+                 category_priority: Sequence[str] = settings.prompt_category_priority,
+                 sign_metadata: Optional[SignMetadataStore] = None):
+        """
+        Initializes the builder.
+
+        Parameters
+        ----------
+        max_tokens: int
+            The estimated number of tokens the road signs section may take.
+        max_description_chars: int
+            The number of characters the description of a sign is truncated to.
+        category_priority: Sequence[str]
+            The sign categories (the first part of the sign code) from the most to the least important.
+        sign_metadata: Optional[SignMetadataStore]
+            The store to read the sign metadata from. Defaults to the process-wide store.
+        """
+        self.max_tokens = max_tokens
+        self.max_description_chars = max_description_chars
+        self.category_priority = {category: rank for rank, category in enumerate(category_priority)}
+        self._sign_metadata = sign_metadata
+        self._fragments: Dict[Tuple[str, int], Tuple[str, int]] = {}
+
+    @property
+    def sign_metadata(self) -> SignMetadataStore:
+        return self._sign_metadata if self._sign_metadata is not None else get_sign_metadata_store()
+
+    @staticmethod
+    def _detected_signs(road_signs) -> List[Tuple[str, float]]:
+        if isinstance(road_signs, Detections):
+            return list(zip(road_signs.sign_codes, road_signs.confidences.tolist()))
+        # Traffic signs have no confidence, they keep their order
+        return [(road_sign.sign_code, getattr(road_sign, 'confidence', None) or 0.0) for road_sign in road_signs]
+
+    def rank(self, road_signs) -> List[str]:
+        '''
+        Returns the distinct sign codes of the detections, the most important first:
+        by category priority, then by highest confidence, then in detection order.
+        '''
+        confidences: Dict[str, float] = {}
+        for sign_code, confidence in self._detected_signs(road_signs):
+            confidences[sign_code] = max(confidence, confidences.get(sign_code, confidence))
+        unranked = len(self.category_priority)
+        return sorted(confidences, key=lambda sign_code: (self.category_priority.get(sign_code.split('.')[0], unranked),
+                                                          -confidences[sign_code]))
+
+    def fragment(self, sign_code: str, level: int = FULL) -> Tuple[str, int]:
+        '''
+        Returns the fragment of a sign at the given level of detail and its estimated number of tokens.
+        '''
+        key = (sign_code, level)
+        cached = self._fragments.get(key)
+        if cached is not None:
+            return cached
+
+        metadata = self.sign_metadata.get(sign_code) or {}
+        description = (metadata.get('description') or '').strip()
+        if level == FULL:
+            description = truncate(description, self.max_description_chars)
+        elif level == SHORT:
+            description = truncate(first_sentence(description), self.max_description_chars)
+        else:
+            description = ''
+        text = SIGN_FRAGMENT_TEMPLATE.format(sign_code=sign_code, name=metadata.get('name') or 'Unknown sign',
+                                             category=metadata.get('category') or 'Unknown category',
+                                             description=description).rstrip(': ')
+        # One more token for the line break
+        fragment = (text, estimate_tokens(text) + 1)
+        self._fragments[key] = fragment
+        return fragment
+
+    def build(self, road_signs) -> Tuple[str, int]:
+        '''
+        Builds the road signs section of the prompt.
+
+        Parameters
+        ----------
+        road_signs: Union[Detections, List[TrafficSign]]
+            The detected road signs.
+
+        Returns
+        -------
+        Tuple[str, int]
+            The road signs section and its estimated number of tokens.
+        '''
+        sign_codes = self.rank(road_signs)
+        levels = [FULL] * len(sign_codes)
+        fragments = [self.fragment(sign_code) for sign_code in sign_codes]
+        tokens = sum(fragment_tokens for _, fragment_tokens in fragments)
+
+        # Shorten the least important signs first, then drop them, always keeping the most important one
+        for level in (SHORT, NAME):
+            for i in reversed(range(len(sign_codes))):
+                if tokens <= self.max_tokens:
+                    break
+                if levels[i] < level:
+                    tokens -= fragments[i][1]
+                    levels[i] = level
+                    fragments[i] = self.fragment(sign_codes[i], level)
+                    tokens += fragments[i][1]
+        while tokens > self.max_tokens and len(fragments) > 1:
+            tokens -= fragments.pop()[1]
+
+        return '\n'.join(text for text, _ in fragments), tokens
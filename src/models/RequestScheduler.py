@@ -0,0 +1,230 @@
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from typing import Iterable, List, Literal, Optional, Tuple
+from src.config.settings import settings
+from src.models.metrics import REQUESTS_DROPPED
+import asyncio
+import heapq
+import itertools
+import math
+import time
+
+PriorityClass = Literal['safety', 'interactive', 'batch']
+
+# From the most to the least urgent, breaking the ties between equal deadlines
+PRIORITY_CLASSES: Tuple[PriorityClass, ...] = ('safety', 'interactive', 'batch')
+
+
+class DeadlineExceededError(Exception):
+    def __init__(self, stage: str, priority: PriorityClass, late_ms: float):
+        super().__init__(f"Deadline of the {priority} request exceeded by {late_ms:.0f} ms before the {stage} stage, the request was dropped")
+        self.stage = stage
+        self.priority = priority
+        self.late_ms = late_ms
+
+
+def default_deadline_ms(priority: PriorityClass) -> float:
+    '''
+    Returns the deadline of a priority class in PRIORITY_DEADLINES_MS, the classes not listed have no deadline.
+    '''
+    return settings.priority_deadlines_ms.get(priority, math.inf)
+
+
+def safety_priority(sign_codes: Iterable[str]) -> bool:
+    '''
+    Returns whether any of the sign codes belongs to a category of SAFETY_SIGN_CATEGORIES, e.g. a stop or give way sign.
+    '''
+    return any(sign_code.split('.')[0] in settings.safety_sign_categories for sign_code in sign_codes)
+
+
+@dataclass
+class RequestDeadline:
+    """
+    Class representing the priority class and the deadline of a request, on the `time.monotonic()` clock.
+
+    Parameters
+    ----------
+    priority: PriorityClass
+        The priority class of the request.
+    deadline: float
+        The time after which the request is dropped instead of computed.
+    arrived_at: float
+        The time the request arrived at.
+    explicit: bool
+        Whether the client supplied the priority, which is then never escalated.
+    """
+
+    priority: PriorityClass
+    deadline: float
+    arrived_at: float = field(default_factory=time.monotonic)
+    explicit: bool = False
+
+    @classmethod
+    def create(cls, priority: Optional[PriorityClass] = None, deadline_ms: Optional[float] = None) -> 'RequestDeadline':
+        '''
+        Creates the deadline of a request arriving now. The priority defaults to DEFAULT_PRIORITY,
+        and the deadline to the budget of the priority class in PRIORITY_DEADLINES_MS.
+        '''
+        arrived_at = time.monotonic()
+        explicit = priority is not None
+        priority = priority or settings.default_priority
+        if deadline_ms is None:
+            deadline_ms = default_deadline_ms(priority)
+        return cls(priority, arrived_at + deadline_ms / 1000, arrived_at, explicit)
+
+    def remaining(self) -> float:
+        return self.deadline - time.monotonic()
+
+    def escalate(self, sign_codes: Iterable[str]) -> bool:
+        '''
+        Raises the request to the safety class if a safety sign was detected and the client did not supply the priority,
+        tightening the deadline to the budget of the safety class.
+
+        Returns
+        -------
+        bool
+            Whether the request was escalated.
+        '''
+        if self.explicit or self.priority == 'safety' or not safety_priority(sign_codes):
+            return False
+        self.priority = 'safety'
+        self.deadline = min(self.deadline, self.arrived_at + default_deadline_ms('safety') / 1000)
+        return True
+
+
+_current_request: ContextVar[Optional[RequestDeadline]] = ContextVar('current_request', default=None)
+
+
+def start_request(request: RequestDeadline) -> RequestDeadline:
+    '''
+    Schedules the stages of the current request (or task) with the given deadline.
+    '''
+    _current_request.set(request)
+    return request
+
+
+def current_request() -> Optional[RequestDeadline]:
+    return _current_request.get()
+
+
+class EDFScheduler:
+    """
+    Class representing the slots of a stage of the pipeline (the inference workers, the concurrent LLM calls),
+    handed out to the waiting requests earliest deadline first.
+
+    The deadline of a request is read from the context of the waiting task (see `start_request`),
+    requests without one get the default deadline when they start waiting. A request whose deadline
+    passes before it gets a slot is dropped with `DeadlineExceededError`, so that no work is spent on
+    an answer nobody waits for anymore. With the `fifo` policy the slots are handed out in arrival order,
+    the expired requests are still dropped.
+    """
+
+    def __init__(self, name: str, slots: int, policy: Literal['edf', 'fifo'] = settings.scheduling_policy):
+        """
+        Initializes the scheduler.
+
+        Parameters
+        ----------
+        name: str
+            The name of the stage, reported in the errors and the metrics.
+        slots: int
+            The number of requests running the stage at once.
+        policy: Literal['edf', 'fifo']
+            The order the waiting requests get a slot in.
+        """
+        self.name = name
+        self.slots = slots
+        self.policy = policy
+
+        self._free = slots
+        self._waiting: List[Tuple[tuple, asyncio.Future, RequestDeadline]] = []
+        self._sequence = itertools.count()
+        self._scheduled = 0
+        self._dropped = {priority: 0 for priority in PRIORITY_CLASSES}
+
+    @property
+    def queue_depth(self) -> int:
+        return sum(1 for _, future, _ in self._waiting if not future.done())
+
+    def _drop(self, request: RequestDeadline) -> DeadlineExceededError:
+        self._dropped[request.priority] += 1
+        REQUESTS_DROPPED.labels(self.name, request.priority).inc()
+        return DeadlineExceededError(self.name, request.priority, -request.remaining() * 1000)
+
+    def _order(self, request: RequestDeadline) -> tuple:
+        sequence = next(self._sequence)
+        if self.policy == 'fifo':
+            return (sequence,)
+        return (request.deadline, PRIORITY_CLASSES.index(request.priority), sequence)
+
+    async def acquire(self, request: Optional[RequestDeadline] = None) -> RequestDeadline:
+        '''
+        Waits for a free slot of the stage.
+
+        Parameters
+        ----------
+        request: Optional[RequestDeadline]
+            The deadline of the request. Defaults to the deadline of the current request.
+
+        Raises
+        ------
+        DeadlineExceededError
+            If the deadline of the request passed before it got a slot.
+        '''
+        request = request or current_request() or RequestDeadline.create()
+        if request.remaining() <= 0:
+            raise self._drop(request)
+        if self._free > 0:
+            self._free -= 1
+            self._scheduled += 1
+            return request
+
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiting, (self._order(request), future, request))
+        try:
+            async with asyncio.timeout(request.remaining()):
+                await future
+        except BaseException as e:
+            if future.done() and not future.cancelled() and future.exception() is None:
+                # The slot was handed over while the request gave up, pass it on
+                self.release()
+            if isinstance(e, TimeoutError):
+                raise self._drop(request) from None
+            raise
+        self._scheduled += 1
+        return request
+
+    def release(self):
+        '''
+        Frees a slot, handing it over to the waiting request with the earliest deadline.
+        '''
+        while self._waiting:
+            _, future, request = heapq.heappop(self._waiting)
+            if future.done():
+                # Gave up while waiting
+                continue
+            if request.remaining() <= 0:
+                future.set_exception(self._drop(request))
+                continue
+            future.set_result(None)
+            return
+        self._free += 1
+
+    async def __aenter__(self) -> RequestDeadline:
+        return await self.acquire()
+
+    async def __aexit__(self, *exc_info):
+        self.release()
+
+    def stats(self) -> dict:
+        '''
+        Returns the number of slots, waiting, scheduled and dropped requests of the stage.
+        '''
+        return {
+            'policy': self.policy,
+            'slots': self.slots,
+            'running': self.slots - self._free,
+            'queue_depth': self.queue_depth,
+            'scheduled': self._scheduled,
+            'dropped': dict(self._dropped),
+        }
@@ -0,0 +1,317 @@
+'''
+Persistent store of traffic sign metadata (name, category, description and image).
+
+The store is built once, offline, by scraping the sign pages for every sign code in the
+category mapping file and is then loaded into memory at startup, so that no network I/O
+happens while serving predictions.
+
+Usage:
+    python -m src.models.SignMetadataStore [--refresh] [--fixtures-dir DIR] [--max-workers N]
+'''
+
+from src.config.settings import settings
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from typing import Callable, Dict, Iterable, List, Optional
+import threading
+import argparse
+import json
+import os
+import re
+
+SIGN_METADATA_STORE_VERSION = 1
+
+SignPageFetcher = Callable[[str], Optional[str]]
+
+
+def _filter_markdown(text: str) -> str:
+    '''
+    Removes markdown syntax like \\n, asterisks, and square brackets and etc.
+    '''
+    # Regex pattern to match markdown syntax like \\n, asterisks, and square brackets
+    pattern = r'[\[\]\*]'
+    return re.sub(pattern, '', text).replace('\\n', ' ').strip()
+
+
+def _filter_sign_code(text: str) -> str:
+    """
+    Removes sign codes (e.g., '5.1.2', '1.1') from the beginning of the text.
+
+    Parameters
+    ----------
+    text : str
+        Input text containing sign code and description.
+
+    Returns
+    -------
+    str
+        Text with the sign code removed.
+    """
+    # Regex pattern to match sign codes like '5.1.2' or '1.1'
+    text = _filter_markdown(text)
+    pattern = r'^\d+(\.\d+)*\s+'
+    return re.sub(pattern, '', text)
+
+
+def parse_sign_page(html: str, sign_image_url_template: str = settings.sign_image_url_template) -> Dict[str, Optional[str]]:
+    '''
+    Parses the description, image, category and name of a traffic sign from its page.
+
+    Parameters
+    ----------
+    html: str
+        The HTML of the sign page.
+    sign_image_url_template: str
+        The URL template used to build the absolute sign image URL.
+
+    Returns
+    -------
+    Dict[str, Optional[str]]
+        The parsed sign metadata.
+    '''
+    from bs4 import BeautifulSoup
+
+    soup = BeautifulSoup(html, 'html.parser')
+
+    # Fetch the description
+    try:
+        description = _filter_markdown(soup.find('div', class_='mark_markpage_block').find('p').text)
+    except AttributeError:
+        description = None
+
+    # Fetch the image source
+    try:
+        img_source = soup.find('div', class_='contain_mar').find('img')['src'][1:]
+    except (AttributeError, TypeError):
+        img_source = None
+
+    # Fetch the category
+    try:
+        category = _filter_markdown(soup.find('div', class_='title_pdr').find('h1').text)
+    except AttributeError:
+        category = None
+
+    # Fetch the sign name
+    try:
+        name = _filter_sign_code(soup.find('div', class_='mark-markpage').find('h2').text)
+    except AttributeError:
+        name = None
+
+    return {
+        'name': name,
+        'category': category,
+        'description': description,
+        'sign_image': sign_image_url_template.format(image_source=img_source) if img_source else None,
+    }
+
+
+def http_page_fetcher(sign_info_url_template: str = settings.sign_info_url_template, timeout: float = 10) -> SignPageFetcher:
+    '''
+    Creates a fetcher downloading the sign pages over HTTP.
+
+    Parameters
+    ----------
+    sign_info_url_template: str
+        The URL template of the sign pages.
+    timeout: float
+        The request timeout in seconds.
+
+    Returns
+    -------
+    SignPageFetcher
+        Callable returning the page HTML for a sign code, or None if there is no page for it (404).
+        Other HTTP errors raise `requests.HTTPError`.
+    '''
+    import requests as req
+
+    session = req.Session()
+
+    def fetch(sign_code: str) -> Optional[str]:
+        sign_category = sign_code.split('.')[0]
+        response = session.get(sign_info_url_template.format(category=sign_category, sign_code=sign_code), timeout=timeout)
+        if response.status_code == 404:
+            return None
+        response.raise_for_status()
+        return response.text
+
+    return fetch
+
+
+def fixture_page_fetcher(fixtures_dir: str) -> SignPageFetcher:
+    '''
+    Creates a fetcher reading the sign pages from a local directory of `<sign_code>.html` files.
+
+    Parameters
+    ----------
+    fixtures_dir: str
+        The directory containing the saved sign pages.
+
+    Returns
+    -------
+    SignPageFetcher
+        Callable returning the page HTML for a sign code, or None if there is no fixture for it.
+    '''
+    def fetch(sign_code: str) -> Optional[str]:
+        path = os.path.join(fixtures_dir, f'{sign_code}.html')
+        if not os.path.exists(path):
+            return None
+        with open(path, 'r', encoding='utf-8') as f:
+            return f.read()
+
+    return fetch
+
+
+class SignMetadataStore:
+    """
+    Class representing the on-disk store of traffic sign metadata, keyed by sign code.
+    """
+
+    def __init__(self, path: str = settings.sign_metadata_path):
+        """
+        Initializes the store.
+
+        Parameters
+        ----------
+        path: str
+            The path to the JSON file backing the store.
+        """
+        self.path = path
+        self.version: Optional[int] = None
+        self.built_at: Optional[str] = None
+        self.signs: Dict[str, Dict[str, Optional[str]]] = {}
+        # The sign codes whose page could not be fetched by the last build, e.g. because of a network error
+        self.failed_sign_codes: List[str] = []
+
+    def __contains__(self, sign_code: str) -> bool:
+        return sign_code in self.signs
+
+    def __len__(self) -> int:
+        return len(self.signs)
+
+    def get(self, sign_code: str) -> Optional[Dict[str, Optional[str]]]:
+        '''
+        Returns the metadata of the given sign code, or None if it is not in the store.
+        '''
+        return self.signs.get(sign_code)
+
+    def load(self) -> 'SignMetadataStore':
+        '''
+        Loads the store from disk. A missing store is treated as empty.
+
+        Raises
+        ------
+        ValueError
+            If the store on disk was built with an incompatible version.
+        '''
+        if not os.path.exists(self.path):
+            print(f"Sign metadata store not found at {self.path}, run `python -m src.models.SignMetadataStore` to build it")
+            return self
+
+        with open(self.path, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+
+        if data.get('version') != SIGN_METADATA_STORE_VERSION:
+            raise ValueError(f"Unsupported sign metadata store version {data.get('version')}, expected {SIGN_METADATA_STORE_VERSION}. Please rebuild the store")
+
+        self.version = data['version']
+        self.built_at = data.get('built_at')
+        self.signs = data['signs']
+        return self
+
+    def save(self) -> 'SignMetadataStore':
+        '''
+        Atomically writes the store to disk.
+        '''
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        tmp_path = f'{self.path}.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({'version': self.version, 'built_at': self.built_at, 'signs': self.signs},
+                      f, ensure_ascii=False, indent=1, sort_keys=True)
+        os.replace(tmp_path, self.path)
+        return self
+
+    def build(self, sign_codes: Iterable[str], fetch_page: SignPageFetcher, max_workers: int = 8) -> 'SignMetadataStore':
+        '''
+        Resolves the metadata of every given sign code, fetching at most `max_workers` pages concurrently.
+
+        Parameters
+        ----------
+        sign_codes: Iterable[str]
+            The sign codes to resolve.
+        fetch_page: SignPageFetcher
+            Callable returning the page HTML for a sign code.
+        max_workers: int
+            The maximum number of concurrent page fetches.
+        '''
+        import requests as req
+
+        sign_codes = sorted(set(sign_codes))
+
+        failed_sign_codes = []
+
+        def resolve(sign_code: str) -> Dict[str, Optional[str]]:
+            try:
+                html = fetch_page(sign_code)
+            except req.RequestException as e:
+                print(f"Failed to fetch sign {sign_code}: {e}")
+                failed_sign_codes.append(sign_code)
+                html = None
+            if html is None:
+                return {'name': None, 'category': None, 'description': None, 'sign_image': None}
+            return parse_sign_page(html)
+
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            signs = dict(zip(sign_codes, executor.map(resolve, sign_codes)))
+
+        self.version = SIGN_METADATA_STORE_VERSION
+        self.built_at = datetime.now(timezone.utc).isoformat()
+        self.signs = signs
+        self.failed_sign_codes = sorted(failed_sign_codes)
+        return self
+
+
+_store: Optional[SignMetadataStore] = None
+_store_lock = threading.Lock()
+
+
+def get_sign_metadata_store() -> SignMetadataStore:
+    '''
+    Returns the process-wide sign metadata store, loading it from disk on first use.
+    '''
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                _store = SignMetadataStore().load()
+    return _store
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Build the traffic sign metadata store')
+    parser.add_argument('--output', default=settings.sign_metadata_path, help='Path of the store file')
+    parser.add_argument('--refresh', action='store_true', help='Rebuild the store even if it already exists')
+    parser.add_argument('--fixtures-dir', default=None, help='Read sign pages from `<sign_code>.html` files instead of the network')
+    parser.add_argument('--max-workers', type=int, default=8, help='Maximum number of concurrent page fetches')
+    parser.add_argument('--allow-failures', action='store_true', help='Save the store even if some pages could not be fetched')
+    args = parser.parse_args()
+
+    if os.path.exists(args.output) and not args.refresh:
+        print(f"Sign metadata store already exists at {args.output}, use --refresh to rebuild it")
+        return
+
+    with open(settings.category_mapping_path, 'r') as f:
+        sign_codes = json.load(f).values()
+
+    fetch_page = fixture_page_fetcher(args.fixtures_dir) if args.fixtures_dir else http_page_fetcher()
+    store = SignMetadataStore(path=args.output).build(sign_codes, fetch_page, max_workers=args.max_workers)
+    if store.failed_sign_codes and not args.allow_failures:
+        # Not saved, so that the next run fetches every page again instead of keeping a partial store
+        raise SystemExit(f"Failed to fetch {len(store.failed_sign_codes)} sign pages: {store.failed_sign_codes}. "
+                         f"The store was not saved, retry or use --allow-failures")
+    store.save()
+    missing = [code for code, info in store.signs.items() if info['description'] is None]
+    print(f"Saved metadata of {len(store)} signs to {store.path}" + (f" ({len(missing)} without description: {missing})" if missing else ''))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,130 @@
+from typing import List, Tuple
+from src.models.types.YOLOPrediction import YOLOPrediction
+from src.config.settings import settings
+import itertools
+
+
+class SignTrack:
+    """
+    Class representing a traffic sign tracked across consecutive frames.
+
+    Parameters
+    ----------
+    track_id: int
+        The identifier of the track, unique within a tracker.
+    prediction: YOLOPrediction
+        The latest prediction matched to the track.
+    hits: int
+        The number of frames the sign was detected in.
+    missed: int
+        The number of consecutive frames the sign was not detected in.
+    """
+
+    def __init__(self, track_id: int, prediction: YOLOPrediction):
+        self.track_id = track_id
+        self.prediction = prediction
+        self.hits = 1
+        self.missed = 0
+
+    @property
+    def sign_code(self) -> str:
+        return self.prediction.traffic_sign.sign_code
+
+    def to_dict(self, min_hits: int) -> dict:
+        return {
+            'track_id': self.track_id,
+            'sign_code': self.sign_code,
+            'confidence': float(self.prediction.confidence),
+            'bbox': [float(v) for v in self.prediction.bbox],
+            'confirmed': self.hits >= min_hits,
+        }
+
+
+class SignTracker:
+    """
+    Class representing a tracker associating traffic sign detections across video frames.
+
+    Detections are matched to the existing tracks of the same sign code by greedy IoU matching of
+    their bounding boxes. A track is confirmed once its sign was detected in `min_hits` frames and
+    dropped after it was missed in more than `max_missed` consecutive frames.
+    """
+
+    def __init__(self, iou_threshold: float = settings.tracker_iou_threshold,
+                 min_hits: int = settings.tracker_min_hits,
+                 max_missed: int = settings.tracker_max_missed):
+        """
+        Initializes the tracker.
+
+        Parameters
+        ----------
+        iou_threshold: float
+            The minimum IoU between a detection and a track for them to be matched.
+        min_hits: int
+            The number of frames a sign has to be detected in before its track is confirmed.
+        max_missed: int
+            The number of consecutive frames a track survives without a matching detection.
+        """
+        self.iou_threshold = iou_threshold
+        self.min_hits = min_hits
+        self.max_missed = max_missed
+        self.tracks: List[SignTrack] = []
+        self._track_ids = itertools.count(1)
+
+    @property
+    def confirmed_tracks(self) -> List[SignTrack]:
+        return [track for track in self.tracks if track.hits >= self.min_hits]
+
+    @property
+    def confirmed_sign_codes(self) -> Tuple[str, ...]:
+        '''
+        The sorted, distinct sign codes of the confirmed tracks.
+        '''
+        return tuple(sorted({track.sign_code for track in self.confirmed_tracks}))
+
+    def update(self, predictions: List[YOLOPrediction]) -> bool:
+        '''
+        Updates the tracks with the detections of a new frame.
+
+        Parameters
+        ----------
+        predictions: List[YOLOPrediction]
+            The detections of the frame.
+
+        Returns
+        -------
+        bool
+            True if the set of confirmed sign codes changed.
+        '''
+        previous_sign_codes = self.confirmed_sign_codes
+
+        candidates = sorted(
+            ((track.prediction.bbox.iou(prediction.bbox), t, p)
+             for t, track in enumerate(self.tracks)
+             for p, prediction in enumerate(predictions)
+             if track.sign_code == prediction.traffic_sign.sign_code),
+            key=lambda candidate: candidate[0], reverse=True
+        )
+
+        matched_tracks, matched_predictions = set(), set()
+        for iou, t, p in candidates:
+            if iou < self.iou_threshold:
+                break
+            if t in matched_tracks or p in matched_predictions:
+                continue
+            track = self.tracks[t]
+            track.prediction = predictions[p]
+            track.hits += 1
+            track.missed = 0
+            matched_tracks.add(t)
+            matched_predictions.add(p)
+
+        for t, track in enumerate(self.tracks):
+            if t not in matched_tracks:
+                track.missed += 1
+        self.tracks = [track for track in self.tracks if track.missed <= self.max_missed]
+
+        for p, prediction in enumerate(predictions):
+            if p not in matched_predictions:
+                self.tracks.append(SignTrack(next(self._track_ids), prediction))
+
+        return self.confirmed_sign_codes != previous_sign_codes
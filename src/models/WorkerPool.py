@@ -0,0 +1,358 @@
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError
+from multiprocessing.connection import Connection, wait
+from multiprocessing.shared_memory import SharedMemory
+from typing import Dict, List, Optional, Tuple
+from src.models.YOLOModel import YOLOModel
+from src.models.RequestScheduler import DeadlineExceededError, current_request
+from src.models.metrics import REQUESTS_DROPPED
+from src.models.types.Detections import Detections
+from src.models.types.DetectionFilter import DetectionFilter
+from src.config.settings import settings
+from PIL import Image
+import multiprocessing as mp
+import numpy as np
+import threading
+import itertools
+import queue
+import time
+import gc
+import torch
+
+
+def _worker_main(yolo_model: Optional[YOLOModel], model_kwargs: dict, slots: List[SharedMemory], requests: mp.Queue,
+                 results: Connection, threads: int):
+    '''
+    Entry point of an inference process: runs detection on the frames written to the shared memory slots.
+    The model is inherited from the parent by the forked processes, and loaded from `model_kwargs` by the spawned ones.
+    '''
+    torch.set_num_threads(threads)
+    if yolo_model is None:
+        yolo_model = YOLOModel(**model_kwargs)
+    yolo_model.detect_traffic_signs(np.zeros((settings.image_height, settings.image_width, 3), dtype=np.uint8))
+
+    while True:
+        request = requests.get()
+        if request is None:
+            return
+        request_id, slot, height, width, confidence_threshold, detection_filter = request
+        # ultralytics expects NumPy frames in BGR channel order, which is how they are written to the slot
+        frame = np.ndarray((height, width, 3), dtype=np.uint8, buffer=slots[slot].buf)
+        try:
+            detections = yolo_model.detect_traffic_signs(frame, confidence_threshold=confidence_threshold,
+                                                         detection_filter=detection_filter)
+            results.send((request_id, (detections.class_ids, detections.confidences, detections.xywh), None))
+        except Exception as e:
+            results.send((request_id, None, f"{type(e).__name__}: {e}"))
+
+
+class DetectionWorkerPool:
+    """
+    Class representing a pool of inference processes, each running the object detection model.
+
+    The processes are forked from a parent that already loaded the model, so that the weights are
+    shared copy-on-write instead of being loaded again in each process. Decoded frames are handed
+    to the processes through preallocated shared memory slots instead of being pickled.
+
+    Every process has its own request queue and result pipe, so that the frames a process was handed
+    are known: if it dies (e.g. killed for running out of memory), they fail at once instead of never
+    being answered, and the process is replaced. A frame is also abandoned once the deadline of its
+    request or the timeout of the pool passes, so that a hung process does not block its caller forever,
+    and a process that answers none of its frames for `max_timeouts` timeouts in a row is killed and replaced.
+
+    The replacements are spawned rather than forked, since the server is multi-threaded by then and a
+    forked child could inherit a lock held by another thread: they load the weights on their own instead
+    of sharing them.
+    """
+
+    def __init__(self, yolo_model: YOLOModel,
+                 processes: int = settings.inference_processes,
+                 slot_bytes: int = settings.inference_slot_bytes,
+                 threads_per_process: int = settings.inference_process_threads,
+                 timeout: float = settings.inference_process_timeout,
+                 max_timeouts: int = settings.inference_process_max_timeouts):
+        """
+        Initializes the pool and forks the inference processes.
+        It must be created before the current process starts any other thread, as threads do not survive `fork`.
+
+        Parameters
+        ----------
+        yolo_model: YOLOModel
+            The loaded object detection model, shared by the processes.
+        processes: int
+            The number of inference processes.
+        slot_bytes: int
+            The size of a shared memory slot. Larger frames are downscaled to fit.
+        threads_per_process: int
+            The number of PyTorch threads of each inference process.
+        timeout: float
+            The number of seconds a frame may take, if the request has no earlier deadline.
+        max_timeouts: int
+            The number of timeouts in a row a process may spend on its frames without answering before it is killed.
+        """
+        self.processes = processes
+        self.slot_bytes = slot_bytes
+        self.timeout = timeout
+        self.max_timeouts = max_timeouts
+        self._yolo_model = yolo_model
+        self._model_kwargs = {'weights_path': yolo_model.weights_path, 'engine': yolo_model.engine,
+                              'parity_check': False, 'tiler': yolo_model.tiler}
+        self._threads_per_process = threads_per_process
+
+        # Two slots per process, so that a frame can be written while the previous one is processed
+        self._slots = [SharedMemory(create=True, size=slot_bytes) for _ in range(processes * 2)]
+        self._free_slots: 'queue.Queue[int]' = queue.Queue()
+        for slot in range(len(self._slots)):
+            self._free_slots.put(slot)
+
+        # Move the loaded model out of the garbage collector's reach, so that collections in the
+        # processes do not write to (and thereby copy) the shared pages
+        gc.freeze()
+        self._context = mp.get_context('fork')
+        self._restart_context = mp.get_context('spawn')
+        self._workers: List[mp.Process] = []
+        self._requests: List[mp.Queue] = []
+        self._results: List[Connection] = []
+        for worker in range(processes):
+            process, requests, results = self._start_worker(worker, self._context)
+            self._workers.append(process)
+            self._requests.append(requests)
+            self._results.append(results)
+
+        # The frames handed to every process by request ID, and the frames it has not answered yet,
+        # including the abandoned ones, since when it has been busy without answering and how many
+        # timeouts in a row it spent so
+        self._pending: List[Dict[int, Future]] = [{} for _ in range(processes)]
+        self._outstanding = [0] * processes
+        self._busy_since: List[Optional[float]] = [None] * processes
+        self._missed_timeouts = [0] * processes
+        self._pending_lock = threading.Lock()
+        self._request_ids = itertools.count()
+        self._restarts = 0
+        self._kills = 0
+        self._closed = False
+        self._wakeup_reader, self._wakeup_writer = self._context.Pipe(duplex=False)
+        self._dispatcher = threading.Thread(target=self._dispatch_results, name='inference-results', daemon=True)
+        self._dispatcher.start()
+
+    def _start_worker(self, worker: int, context) -> Tuple[mp.Process, mp.Queue, Connection]:
+        '''
+        Starts the inference process of the given index with a new request queue and result pipe.
+        A forked process shares the loaded model, a spawned one loads it again.
+
+        Returns
+        -------
+        Tuple[mp.Process, mp.Queue, Connection]
+            The process, its request queue and the reading end of its result pipe.
+        '''
+        results_reader, results_writer = context.Pipe(duplex=False)
+        requests = context.Queue()
+        yolo_model = self._yolo_model if context is self._context else None
+        process = context.Process(target=_worker_main, name=f'inference-{worker}', daemon=True,
+                                  args=(yolo_model, self._model_kwargs, self._slots, requests, results_writer,
+                                        self._threads_per_process))
+        process.start()
+        # Only the process writes to the pipe
+        results_writer.close()
+        return process, requests, results_reader
+
+    def _restart_worker(self, worker: int):
+        '''
+        Fails the frames handed to a dead inference process and replaces it with a spawned one.
+        '''
+        process = self._workers[worker]
+        new_process, new_requests, new_results = self._start_worker(worker, self._restart_context)
+        # Under the lock, so that no frame is handed to the dead process once its frames are failed
+        with self._pending_lock:
+            pending, self._pending[worker] = self._pending[worker], {}
+            requests, results = self._requests[worker], self._results[worker]
+            self._workers[worker], self._requests[worker], self._results[worker] = new_process, new_requests, new_results
+            self._outstanding[worker], self._busy_since[worker], self._missed_timeouts[worker] = 0, None, 0
+            self._restarts += 1
+        requests.cancel_join_thread()
+        requests.close()
+        results.close()
+
+        print(f"Inference process {process.name} died with exit code {process.exitcode}, "
+              f"failed its {len(pending)} pending frames and replaced it")
+        for future in pending.values():
+            future.set_exception(RuntimeError(f"Inference process {process.name} died with exit code {process.exitcode}"))
+
+    def _write_frame(self, image: Image, slot: int):
+        '''
+        Writes the frame to a slot in BGR channel order, downscaling it if it does not fit.
+
+        Returns
+        -------
+        Tuple[int, int, float, float]
+            The height and width of the written frame, and the horizontal and vertical scale back to the original frame.
+        '''
+        image = image.convert('RGB')
+        original_width, original_height = image.size
+        if original_width * original_height * 3 > self.slot_bytes:
+            scale = (self.slot_bytes / (original_width * original_height * 3)) ** 0.5
+            image = image.resize((max(1, int(original_width * scale)), max(1, int(original_height * scale))))
+
+        width, height = image.size
+        frame = np.ndarray((height, width, 3), dtype=np.uint8, buffer=self._slots[slot].buf)
+        np.copyto(frame, np.asarray(image)[..., ::-1])
+        return height, width, original_width / width, original_height / height
+
+    def _kill_hung_workers(self):
+        '''
+        Counts a timeout for every process that answered none of its frames during the last timeout,
+        and kills the processes that reached `max_timeouts` in a row, so that they are replaced.
+        '''
+        now = time.monotonic()
+        hung = []
+        with self._pending_lock:
+            for worker, busy_since in enumerate(self._busy_since):
+                if busy_since is None or now - busy_since < self.timeout:
+                    continue
+                self._missed_timeouts[worker] += 1
+                self._busy_since[worker] = now
+                if self._missed_timeouts[worker] >= self.max_timeouts:
+                    # Not counted again until the process is replaced
+                    self._busy_since[worker] = None
+                    self._kills += 1
+                    hung.append(worker)
+
+        for worker in hung:
+            print(f"Inference process {self._workers[worker].name} answered none of its frames for "
+                  f"{self.max_timeouts} timeouts of {self.timeout}s, killing it")
+            self._workers[worker].kill()
+
+    def _dispatch_results(self):
+        '''
+        Resolves the futures of the results sent by the inference processes, restarts the processes that died
+        and kills the ones that hung.
+        '''
+        while True:
+            results = {reader: worker for worker, reader in enumerate(self._results)}
+            sentinels = {process.sentinel: worker for worker, process in enumerate(self._workers)}
+            # Wakes up at least once per timeout to look for hung processes
+            ready = wait([self._wakeup_reader, *results, *sentinels], timeout=self.timeout)
+            if self._closed:
+                return
+
+            # The results sent right before a process died are delivered before its other frames fail
+            for reader in ready:
+                if reader not in results:
+                    continue
+                try:
+                    request_id, arrays, error = reader.recv()
+                except (EOFError, OSError):
+                    # The process died, it is restarted once its sentinel is ready
+                    continue
+                worker = results[reader]
+                with self._pending_lock:
+                    self._outstanding[worker] -= 1
+                    self._busy_since[worker] = time.monotonic() if self._outstanding[worker] else None
+                    self._missed_timeouts[worker] = 0
+                    # None if the request timed out meanwhile
+                    future = self._pending[worker].pop(request_id, None)
+                if future is None:
+                    continue
+                if error is not None:
+                    future.set_exception(RuntimeError(f"Inference process failed: {error}"))
+                else:
+                    future.set_result(arrays)
+
+            for sentinel in ready:
+                if sentinel in sentinels:
+                    self._workers[sentinels[sentinel]].join()
+                    self._restart_worker(sentinels[sentinel])
+
+            self._kill_hung_workers()
+
+    def _timeout(self) -> Tuple[float, bool]:
+        '''
+        Returns the number of seconds the current request may wait for its frame, and whether it is bounded by the deadline of the request.
+        '''
+        request = current_request()
+        if request is None or request.remaining() >= self.timeout:
+            return self.timeout, False
+        return max(0.0, request.remaining()), True
+
+    def detect_traffic_signs(self, image: Image, confidence_threshold: float = 0.5,
+                             detection_filter: Optional[DetectionFilter] = None) -> Detections:
+        '''
+        Predicts the traffic signs in the given image on one of the inference processes.
+        Blocks until a shared memory slot is free and the prediction is done.
+
+        Parameters
+        ----------
+        image: Image
+            The image to predict the traffic signs in.
+        confidence_threshold: float
+            The confidence threshold for the predictions.
+        detection_filter: Optional[DetectionFilter]
+            The NMS parameters and the classes to detect. Defaults to the filter configured by the settings.
+
+        Returns
+        -------
+        Detections
+            The predicted traffic signs, in the coordinates of the given image.
+
+        Raises
+        ------
+        DeadlineExceededError
+            If the deadline of the request passed before the prediction was done.
+        TimeoutError
+            If the prediction took more than the timeout of the pool.
+        RuntimeError
+            If the prediction failed or the inference process died.
+        '''
+        slot = self._free_slots.get()
+        try:
+            height, width, scale_x, scale_y = self._write_frame(image, slot)
+            request_id = next(self._request_ids)
+            future = Future()
+            with self._pending_lock:
+                # The process with the fewest frames in progress, counting the abandoned ones it is still working on
+                worker = min(range(self.processes), key=lambda worker: self._outstanding[worker])
+                self._pending[worker][request_id] = future
+                self._requests[worker].put((request_id, slot, height, width, confidence_threshold, detection_filter))
+                self._outstanding[worker] += 1
+                if self._busy_since[worker] is None:
+                    self._busy_since[worker] = time.monotonic()
+
+            timeout, deadline_bound = self._timeout()
+            try:
+                class_ids, confidences, xywh = future.result(timeout=timeout)
+            except FutureTimeoutError:
+                with self._pending_lock:
+                    self._pending[worker].pop(request_id, None)
+                if deadline_bound:
+                    request = current_request()
+                    REQUESTS_DROPPED.labels('detect', request.priority).inc()
+                    raise DeadlineExceededError('detect', request.priority, -request.remaining() * 1000)
+                raise TimeoutError(f"Inference process {self._workers[worker].name} did not answer within {timeout}s")
+        finally:
+            self._free_slots.put(slot)
+        return Detections(class_ids, confidences, xywh).scale(scale_x, scale_y)
+
+    def stats(self) -> dict:
+        '''
+        Returns the number of frames in progress in every inference process, and the number of replaced and of killed processes.
+        '''
+        with self._pending_lock:
+            return {'processes': self.processes, 'pending': [len(pending) for pending in self._pending],
+                    'outstanding': list(self._outstanding), 'restarts': self._restarts, 'killed': self._kills}
+
+    def close(self):
+        '''
+        Stops the inference processes and releases the shared memory.
+        '''
+        # The dispatcher stops before the processes, so that they are not restarted
+        self._closed = True
+        self._wakeup_writer.send(None)
+        self._dispatcher.join()
+        for requests in self._requests:
+            requests.put(None)
+        for worker in self._workers:
+            worker.join(timeout=5)
+            if worker.is_alive():
+                worker.kill()
+        for slot in self._slots:
+            slot.close()
+            slot.unlink()
@@ -1,9 +1,42 @@
 from ultralytics import YOLO
-from typing import List
+from typing import List, Literal, Optional, Tuple
+from src.models.types.Detections import Detections
 from src.models.types.YOLOPrediction import YOLOPrediction
+from src.models.types.DetectionFilter import DetectionFilter
+from src.models.FrameTiler import FrameTiler, crop, image_size
 from src.config.settings import settings
 from PIL import Image
+import numpy as np
+import threading
 import torch
+import os
+
+DetectorEngine = Literal['torch', 'onnx', 'openvino']
+
+
+class EngineParityError(Exception):
+    pass
+
+
+def engine_weights_path(weights_path: str, engine: DetectorEngine) -> str:
+    """
+    Returns the path of the weights exported for the given engine, following the ultralytics naming
+    (`<name>.onnx` for ONNX Runtime, `<name>_openvino_model/` for OpenVINO).
+    Weights that are not PyTorch weights are returned as is.
+
+    Parameters
+    ----------
+    weights_path: str
+        The path to the PyTorch weights.
+    engine: DetectorEngine
+        The inference engine.
+    """
+    stem, extension = os.path.splitext(weights_path)
+    if extension != '.pt' or engine == 'torch':
+        return weights_path
+    if engine == 'onnx':
+        return f'{stem}.onnx'
+    return f'{stem}_openvino_model'
 
 
 class YOLOModel:
@@ -12,18 +45,116 @@ class YOLOModel:
     """
 
     def __init__(self,
-                 weights_path: str = settings.obj_detect_weights_path):
+                 weights_path: str = settings.obj_detect_weights_path,
+                 engine: DetectorEngine = settings.detector_engine,
+                 parity_check: bool = settings.detector_parity_check,
+                 tiler: Optional[FrameTiler] = None):
         """
         Initializes the YOLO model.
+
+        Parameters
+        ----------
+        weights_path: str
+            The path to the PyTorch weights, or to weights exported for another engine.
+        engine: DetectorEngine
+            The inference engine running the model: torch, onnx (ONNX Runtime) or openvino.
+            The weights have to be exported first with `python -m src.models.export_detector`.
+        parity_check: bool
+            Flag indicating whether to check that the exported model gives the same detections as the PyTorch one.
+        tiler: Optional[FrameTiler]
+            Splits the frames into tiles detected as one batch. Defaults to a tiler configured by the settings
+            if DETECTOR_TILING is set, otherwise the whole frames are detected.
+
+        Raises
+        ------
+        FileNotFoundError
+            If the weights were not exported for the engine.
+        EngineParityError
+            If the parity check fails.
         """
+        self.engine = engine
+        self.weights_path = engine_weights_path(weights_path, engine)
+        if not os.path.exists(self.weights_path):
+            raise FileNotFoundError(f"Weights for the {engine} engine not found at {self.weights_path}, "
+                                    f"export them with `python -m src.models.export_detector --engine {engine}`")
+
         self.model = YOLO(
-            model=weights_path,
+            model=self.weights_path,
             task='detect'
         )
-        self.device = 'cuda' if torch.cuda.is_available() else 'cpu'
-        print(f"Using device: {self.device}")
+        self.imgsz = (settings.image_height, settings.image_width)
+        self.device = 'cuda' if torch.cuda.is_available() and engine == 'torch' else 'cpu'
+        self.default_filter = DetectionFilter.default()
+        self.tiler = tiler if tiler is not None else FrameTiler() if settings.detector_tiling else None
+        # ultralytics keeps the arguments of the last call on a single predictor, concurrent calls would run
+        # with each other's arguments, and its forward passes are serialized by its own lock anyway
+        self._predict_lock = threading.Lock()
+        print(f"Using device: {self.device} ({engine} engine)")
+
+        if parity_check and self.weights_path != weights_path:
+            self.check_parity(YOLOModel(weights_path, engine='torch', parity_check=False, tiler=self.tiler))
+
+    def check_parity(self, reference: 'YOLOModel', image_path: str = settings.detector_parity_image,
+                     min_iou: float = 0.9, max_confidence_delta: float = 0.05):
+        """
+        Checks that the model detects the same traffic signs as a reference model.
 
-    def detect_traffic_signs(self, image: Image, confidence_threshold: float = 0.5) -> List[YOLOPrediction]:
+        Parameters
+        ----------
+        reference: YOLOModel
+            The reference model, usually running the PyTorch weights.
+        image_path: str
+            The image to compare the detections on.
+        min_iou: float
+            The minimum IoU between matching bounding boxes.
+        max_confidence_delta: float
+            The maximum difference between matching confidence scores.
+
+        Raises
+        ------
+        EngineParityError
+            If the detections differ.
+        """
+        if not os.path.exists(image_path):
+            print(f"Skipping the parity check of the {self.engine} engine, image {image_path} not found")
+            return
+
+        image = Image.open(image_path).convert('RGB')
+        expected = reference.detect_traffic_signs(image, confidence_threshold=0.25)
+        actual = self.detect_traffic_signs(image, confidence_threshold=0.25)
+
+        expected = expected.select(np.argsort(expected.class_ids, kind='stable'))
+        actual = actual.select(np.argsort(actual.class_ids, kind='stable'))
+        if len(expected) != len(actual) or not np.array_equal(expected.class_ids, actual.class_ids):
+            raise EngineParityError(f"The {self.engine} engine detected {actual.sign_codes} instead of {expected.sign_codes}")
+
+        for expected_prediction, actual_prediction in self._match_boxes(expected, actual):
+            if abs(expected_prediction.confidence - actual_prediction.confidence) > max_confidence_delta \
+                    or expected_prediction.bbox.iou(actual_prediction.bbox) < min_iou:
+                raise EngineParityError(f"The {self.engine} engine detections differ from the torch engine ones: "
+                                        f"{actual.to_list()} instead of {expected.to_list()}")
+        print(f"Parity check of the {self.engine} engine passed ({len(actual)} detections)")
+
+    @staticmethod
+    def _match_boxes(expected: Detections, actual: Detections) -> List[Tuple[YOLOPrediction, YOLOPrediction]]:
+        '''
+        Pairs the boxes of the same class of two detections with the same class IDs, most overlapping first,
+        so that the pairs do not depend on the order each engine returned its boxes in.
+        '''
+        pairs = []
+        for class_id in np.unique(expected.class_ids):
+            expected_boxes = [expected[i] for i in np.flatnonzero(expected.class_ids == class_id)]
+            actual_boxes = [actual[i] for i in np.flatnonzero(actual.class_ids == class_id)]
+            ious = np.array([[e.bbox.iou(a.bbox) for a in actual_boxes] for e in expected_boxes])
+            for _ in range(len(expected_boxes)):
+                i, j = np.unravel_index(np.argmax(ious), ious.shape)
+                pairs.append((expected_boxes[i], actual_boxes[j]))
+                # Each box is paired once
+                ious[i, :] = ious[:, j] = -1
+        return pairs
+
+    def detect_traffic_signs(self, image: Image, confidence_threshold: float = 0.5,
+                             detection_filter: Optional[DetectionFilter] = None) -> Detections:
         """
         Predicts the traffic signs in the given image.
 
@@ -33,26 +164,80 @@ class YOLOModel:
             The image to predict the traffic signs in.
         confidence_threshold: float
             The confidence threshold for the predictions.
+        detection_filter: Optional[DetectionFilter]
+            The NMS parameters and the classes to detect. Defaults to the filter configured by the settings.
+
+        Returns
+        -------
+        Detections
+            The predicted traffic signs.
+        """
+        detection_filter = detection_filter or self.default_filter
+        if self.tiler is not None:
+            return self._detect_tiled([image], [confidence_threshold], detection_filter)[0]
+        # The thresholds and classes are applied by the NMS of the model, not to its output, under the predict lock
+        # since ultralytics keeps them on the predictor shared by the concurrent requests
+        predictions = self._predict(image, conf=confidence_threshold, **detection_filter.predict_kwargs())[0].boxes
+        return Detections.from_boxes(predictions)
+
+    def detect_traffic_signs_batch(self, images: List[Image], confidence_thresholds: List[float],
+                                   detection_filter: Optional[DetectionFilter] = None) -> List[Detections]:
+        """
+        Predicts the traffic signs in several images with a single batched forward pass.
+
+        Parameters
+        ----------
+        images: List[Image]
+            The images to predict the traffic signs in.
+        confidence_thresholds: List[float]
+            The confidence threshold for the predictions of each image.
+        detection_filter: Optional[DetectionFilter]
+            The NMS parameters and the classes to detect, shared by the whole batch.
+            Defaults to the filter configured by the settings.
 
         Returns
         -------
-        List[YOLOPrediction]
-            The list of predicted traffic signs.
-        """
-        predictions = self.model.predict(image, device=self.device)[0].boxes
-        yolo_predictions = []
-
-        for pred in predictions:
-            pred = pred.cpu().numpy()
-            for cls, conf, xywh in zip(pred.cls, pred.conf, pred.xywh):
-                if conf > confidence_threshold:
-                    yolo_prediction = YOLOPrediction(
-                        class_id=int(cls),
-                        confidence=conf,
-                        x=xywh[0],
-                        y=xywh[1],
-                        w=xywh[2],
-                        h=xywh[3],
-                    )
-                    yolo_predictions.append(yolo_prediction)
-        return yolo_predictions
+        List[Detections]
+            The predicted traffic signs of each image.
+        """
+        detection_filter = detection_filter or self.default_filter
+        if self.tiler is not None:
+            return self._detect_tiled(images, confidence_thresholds, detection_filter)
+        return self._predict_batch(images, confidence_thresholds, detection_filter)
+
+    def _predict_batch(self, images: List[Image], confidence_thresholds: List[float],
+                       detection_filter: DetectionFilter) -> List[Detections]:
+        # A list of in-memory images is processed by ultralytics as a single batch, with a single
+        # confidence threshold: the lowest one goes to NMS and the higher ones are applied afterwards
+        min_confidence_threshold = min(confidence_thresholds)
+        results = self._predict(images, conf=min_confidence_threshold, **detection_filter.predict_kwargs())
+        return [
+            Detections.from_boxes(result.boxes) if confidence_threshold == min_confidence_threshold
+            else Detections.from_boxes(result.boxes).filter_confidence(confidence_threshold)
+            for result, confidence_threshold in zip(results, confidence_thresholds)
+        ]
+
+    def _predict(self, source, **kwargs) -> list:
+        '''
+        Runs the ultralytics prediction, one call at a time.
+        '''
+        with self._predict_lock:
+            return self.model.predict(source, imgsz=self.imgsz, device=self.device, verbose=False, **kwargs)
+
+    def _detect_tiled(self, images: List[Image], confidence_thresholds: List[float],
+                      detection_filter: DetectionFilter) -> List[Detections]:
+        """
+        Predicts the traffic signs in the tiles of several images with a single batched forward pass,
+        then merges the detections of the tiles of each image in frame coordinates.
+        """
+        tiles = [self.tiler.tiles(*image_size(image)) for image in images]
+        crops = [crop(image, box) for image, boxes in zip(images, tiles) for box in boxes]
+        crop_thresholds = [threshold for threshold, boxes in zip(confidence_thresholds, tiles) for _ in boxes]
+        crop_detections = iter(self._predict_batch(crops, crop_thresholds, detection_filter))
+
+        results = []
+        for boxes in tiles:
+            detections = Detections.concatenate(next(crop_detections).translate(x0, y0) for x0, y0, _, _ in boxes)
+            detections = detections.nms(settings.tiling_merge_threshold, metric='ios')
+            results.append(detections.select(np.argsort(-detections.confidences)[:detection_filter.max_detections]))
+        return results
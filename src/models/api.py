@@ -1,15 +1,344 @@
 import uvicorn
-from fastapi import FastAPI, UploadFile, HTTPException, status
-from src.config.settings import settings
+from fastapi import FastAPI, Depends, Query, Request, UploadFile, HTTPException, WebSocket, WebSocketDisconnect, status
+from fastapi.responses import StreamingResponse, JSONResponse, PlainTextResponse
+from contextlib import asynccontextmanager
+from src.config.settings import settings, ensure_weights
 from src.models.DrivingAssistant import DrivingAssistant
+from src.models.YOLOModel import YOLOModel
 from src.models.LLM import ModelNotAvailableError
-from PIL import Image
+from src.models.FireworksLLM import aclose_http_clients
+from src.models.InferenceExecutor import QueueFullError
+from src.models.RequestScheduler import DeadlineExceededError, PriorityClass, RequestDeadline, safety_priority, start_request
+from src.models.SignTracker import SignTracker, SignTrack
+from src.models.SignMetadataStore import get_sign_metadata_store
+from src.models.HintLibrary import get_hint_library
+from src.models.FrameCache import FrameCache, dhash
+from src.models.types.TrafficSign import load_category_mapping
+from src.models.WorkerPool import DetectionWorkerPool
+from src.models.ImageIngest import DecodedFrame, PixelFormat, decode_image, decode_raw
+from src.models.batch_predict import BatchPredictor
+from src.models.types.Prediction import PredictionMode
+from src.models.types.DetectionFilter import DetectionFilter
+from src.models.prefork import serve_prefork
+from src.models import metrics
+from PIL import UnidentifiedImageError
+from typing import Awaitable, Callable, List, Optional, Tuple
+import argparse
+import torch
+import asyncio
 import json
+import time
 
+driving_assistant: Optional[DrivingAssistant] = None
 
-app = FastAPI()
+# Detector loaded before forking the workers in prefork mode, shared by all of them
+preloaded_yolo_model: Optional[YOLOModel] = None
 
-driving_assistant = DrivingAssistant(llm_model_name='llama-v3p1-405b-instruct')
+# Inference processes forked after the detector is loaded, when INFERENCE_PROCESSES > 0
+preloaded_worker_pool: Optional[DetectionWorkerPool] = None
+
+# Prediction results by frame content, None if FRAME_CACHE_SIZE is 0
+frame_cache: Optional[FrameCache] = FrameCache() if settings.frame_cache_size > 0 else None
+
+# Largest number of images of /api/predict_batch detected in a single forward pass
+MAX_BATCH_SIZE = 64
+
+# Lifecycle of the service: starting -> warming_up -> ready, or failed
+service_state = {'status': 'starting', 'started_at': time.time(), 'ready_at': None, 'error': None}
+
+# Time to first byte and to first token of the streamed predictions
+streaming_stats = {'requests': 0, 'ttfb_ms_total': 0.0, 'ttft_ms_total': 0.0}
+
+
+def preload_models(inference_processes: int = 0):
+    """
+    Loads the object detection model, the sign metadata and the hint library, before the server workers are forked in prefork mode.
+
+    Parameters
+    ----------
+    inference_processes: int
+        The number of inference processes to fork once the model is loaded.
+        Forking is only safe while the current process has a single thread, i.e. before the server starts.
+    """
+    global preloaded_yolo_model, preloaded_worker_pool
+    if inference_processes > 0:
+        # OpenMP thread pools do not survive fork, keep this process single-threaded while loading
+        torch.set_num_threads(1)
+    ensure_weights()
+    load_category_mapping()
+    get_sign_metadata_store()
+    if settings.hint_library:
+        get_hint_library()
+    preloaded_yolo_model = YOLOModel()
+    if inference_processes > 0:
+        preloaded_worker_pool = DetectionWorkerPool(preloaded_yolo_model, processes=inference_processes)
+
+
+def _frame_cache_hits() -> int:
+    stats = frame_cache.stats()
+    return stats['hits'] + stats['near_hits'] + stats['coalesced']
+
+
+def _frame_cache_misses() -> int:
+    stats = frame_cache.stats()
+    # The near hits were looked up after an exact miss, but answered from the cache
+    return stats['misses'] - stats['near_hits']
+
+
+async def start_service():
+    """
+    Loads the models and warms them up without blocking the event loop, so that the health endpoints answer meanwhile.
+    """
+    global driving_assistant
+    try:
+        if preloaded_yolo_model is None:
+            if settings.inference_processes > 0:
+                print("INFERENCE_PROCESSES is ignored, inference processes are only started by `python -m src.models.api`")
+            await asyncio.to_thread(preload_models)
+        assistant = DrivingAssistant(llm_model_name='llama-v3p1-405b-instruct', yolo_model=preloaded_yolo_model,
+                                     worker_pool=preloaded_worker_pool)
+
+        service_state['status'] = 'warming_up'
+        await asyncio.to_thread(assistant.warm_up)
+
+        metrics.HINT_CACHE_HITS.set_function(lambda: assistant.llm.hint_cache.stats()['hits'])
+        metrics.HINT_CACHE_MISSES.set_function(lambda: assistant.llm.hint_cache.stats()['misses'])
+        metrics.HINT_CACHE_SIZE.set_function(lambda: assistant.llm.hint_cache.stats()['size'])
+        metrics.INFERENCE_QUEUE_DEPTH.set_function(lambda: assistant.executor.queue_depth)
+        metrics.INFERENCE_REJECTED.set_function(lambda: assistant.executor.stats()['rejected'])
+        if frame_cache is not None:
+            metrics.FRAME_CACHE_HITS.set_function(_frame_cache_hits)
+            metrics.FRAME_CACHE_MISSES.set_function(_frame_cache_misses)
+
+        driving_assistant = assistant
+        service_state['status'] = 'ready'
+        service_state['ready_at'] = time.time()
+        print(f"Service ready in {service_state['ready_at'] - service_state['started_at']:.1f}s")
+    except Exception as e:
+        service_state['status'] = 'failed'
+        service_state['error'] = str(e)
+        print(f"Service failed to start: {e}")
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    startup = asyncio.create_task(start_service())
+    yield
+    startup.cancel()
+    if driving_assistant is not None:
+        driving_assistant.close()
+    await aclose_http_clients()
+
+
+app = FastAPI(lifespan=lifespan)
+
+
+@app.middleware("http")
+async def observe_request(request: Request, call_next):
+    """
+    Measures the duration of every request, and returns the durations of its stages in a `Server-Timing` header
+    when the request has an `X-Trace` header or TRACE_REQUESTS is set.
+    """
+
+    trace = metrics.start_trace() if settings.trace_requests or 'x-trace' in request.headers else None
+    start = time.perf_counter()
+    response = await call_next(request)
+    duration = time.perf_counter() - start
+
+    # The route template, not the path, so that the number of label values stays bounded
+    route = request.scope.get('route')
+    metrics.HTTP_REQUEST_DURATION.labels(request.method, route.path if route is not None else 'unmatched',
+                                         str(response.status_code)).observe(duration)
+    if trace is not None:
+        # Streamed responses only include the stages finished before their headers are sent
+        response.headers['Server-Timing'] = ', '.join(filter(None, [metrics.server_timing(trace), f'total;dur={duration * 1000:.2f}']))
+    return response
+
+
+def _get_driving_assistant() -> DrivingAssistant:
+    """
+    Returns the driving assistant once the service is ready.
+
+    Raises
+    ------
+        HTTPException: If the service is not ready yet (503, with a Retry-After header)
+    """
+
+    if driving_assistant is None:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail=f"Service is not ready ({service_state['status']})",
+            headers={'Retry-After': '1'}
+        )
+    return driving_assistant
+
+
+async def _decode_upload(image: UploadFile) -> DecodedFrame:
+    """
+    Reads the uploaded image and decodes it to the model input size.
+
+    Raises
+    ------
+        HTTPException: If the image is not provided, the image type is invalid or the image cannot be decoded
+    """
+
+    return await _decode(await _read_upload(image))
+
+
+async def _read_upload(image: UploadFile) -> bytes:
+    """
+    Reads the uploaded image.
+
+    Raises
+    ------
+        HTTPException: If the image is not provided or the image type is invalid
+    """
+
+    content_type = image.content_type
+
+    if content_type is None:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Image not provided"
+        )
+
+    if content_type.split("/")[0] != "image":
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Invalid image type"
+        )
+
+    return await image.read()
+
+
+async def _decode(data: bytes, width: Optional[int] = None, height: Optional[int] = None,
+                  pixel_format: Optional[PixelFormat] = None) -> DecodedFrame:
+    """
+    Decodes an encoded image, or a raw frame if a pixel format is given, off the event loop.
+
+    Raises
+    ------
+        HTTPException: If the image cannot be decoded or the raw frame does not match its dimensions
+    """
+
+    try:
+        if pixel_format is None:
+            frame = await asyncio.to_thread(decode_image, data)
+        elif width is None or height is None:
+            raise ValueError("Raw frames require a width and a height")
+        else:
+            frame = await asyncio.to_thread(decode_raw, data, width, height, pixel_format)
+    except (UnidentifiedImageError, ValueError) as e:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Invalid image: {e}"
+        )
+    metrics.observe_stage('decode', frame.decode_ms / 1000)
+    # Count the copy of the request body as well
+    frame.bytes_copied += len(data)
+    return frame
+
+
+def _build_detection_filter(iou_threshold: Optional[float], max_detections: Optional[int],
+                            sign_codes: Optional[List[str]], categories: Optional[List[str]]) -> Optional[DetectionFilter]:
+    """
+    Builds the detection filter of a request, or returns None to use the one configured by the settings.
+
+    Raises
+    ------
+        ValueError: If a parameter is out of range, or a sign code or a category is unknown
+    """
+
+    if iou_threshold is None and max_detections is None and not sign_codes and not categories:
+        return None
+    kwargs = {key: value for key, value in (('iou_threshold', iou_threshold), ('max_detections', max_detections))
+              if value is not None}
+    if not sign_codes and not categories:
+        categories = settings.detection_categories
+    return DetectionFilter.from_signs(sign_codes=sign_codes, categories=categories, **kwargs)
+
+
+def detection_filter_params(
+    iou_threshold: Optional[float] = None,
+    max_detections: Optional[int] = None,
+    sign_codes: Optional[List[str]] = Query(None),
+    categories: Optional[List[str]] = Query(None)
+) -> Optional[DetectionFilter]:
+    """
+    Query parameters of the detection filter, shared by the prediction endpoints.
+
+    Raises
+    ------
+        HTTPException: If a parameter is out of range, or a sign code or a category is unknown
+    """
+
+    try:
+        return _build_detection_filter(iou_threshold, max_detections, sign_codes, categories)
+    except ValueError as e:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=str(e)
+        )
+
+
+def request_deadline_params(
+    priority: Optional[PriorityClass] = None,
+    deadline_ms: Optional[float] = None
+) -> RequestDeadline:
+    """
+    Query parameters of the priority class and the deadline of a request, shared by the prediction endpoints.
+
+    Raises
+    ------
+        HTTPException: If the deadline is not positive
+    """
+
+    if deadline_ms is not None and deadline_ms <= 0:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="The deadline must be positive"
+        )
+    return RequestDeadline.create(priority, deadline_ms)
+
+
+def _deadline_exceeded(e: DeadlineExceededError) -> HTTPException:
+    return HTTPException(
+        status_code=status.HTTP_504_GATEWAY_TIMEOUT,
+        detail=str(e)
+    )
+
+
+@app.get("/api/health/live")
+def liveness():
+    """
+    Reports that the server process is alive.
+    """
+
+    return {"status": "alive"}
+
+
+@app.get("/api/health/ready")
+def readiness():
+    """
+    Reports whether the models are loaded and warmed up. Answers 503 until they are.
+    """
+
+    ready = service_state['status'] == 'ready'
+    content = {
+        "status": service_state['status'],
+        "startup_seconds": service_state['ready_at'] - service_state['started_at'] if ready else None,
+        "error": service_state['error'],
+    }
+    return JSONResponse(content, status_code=status.HTTP_200_OK if ready else status.HTTP_503_SERVICE_UNAVAILABLE)
+
+
+@app.get("/metrics", response_class=PlainTextResponse)
+def prometheus_metrics():
+    """
+    Exposes the metrics of this server process in the Prometheus text format.
+    """
+
+    return PlainTextResponse(metrics.render_metrics(), media_type=metrics.CONTENT_TYPE)
 
 
 @app.get("/api/available_models")
@@ -27,18 +356,138 @@ def available_classes():
     Get the available traffic sign classes.
     """
 
-    return {"classes": set([sign_code for sign_code in json.load(open(settings.category_mapping_path, 'r')).values()])}
+    return {"classes": set(load_category_mapping().values())}
+
+
+@app.get("/api/inference_stats")
+def inference_stats():
+    """
+    Get the queue depth and wait time statistics of the inference executor.
+    """
+
+    assistant = _get_driving_assistant()
+    stats = assistant.executor.stats()
+    if assistant.batch_scheduler is not None:
+        stats['batching'] = assistant.batch_scheduler.stats()
+    stats['scheduling'] = {
+        'detect': assistant.executor.scheduler.stats(),
+        'llm': assistant.llm.scheduler.stats() if assistant.llm.scheduler is not None else None,
+    }
+    stats['streaming'] = {
+        'requests': streaming_stats['requests'],
+        'ttfb_avg_ms': streaming_stats['ttfb_ms_total'] / streaming_stats['requests'] if streaming_stats['requests'] else 0.0,
+        'ttft_avg_ms': streaming_stats['ttft_ms_total'] / streaming_stats['requests'] if streaming_stats['requests'] else 0.0,
+    }
+    return stats
+
+
+@app.get("/api/frame_cache_stats")
+def frame_cache_stats():
+    """
+    Get the size and hit/miss statistics of the frame cache.
+    """
+
+    if frame_cache is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="The frame cache is disabled"
+        )
+    return frame_cache.stats()
+
+
+@app.get("/api/cache_stats")
+def cache_stats():
+    """
+    Get the size and hit/miss statistics of the hint cache.
+    """
+
+    return _get_driving_assistant().llm.hint_cache.stats()
+
+
+async def _predict(frame: DecodedFrame, llm_model_name: str, confidence_threshold: float, mode: PredictionMode,
+                   detection_filter: Optional[DetectionFilter]) -> Tuple[dict, bool]:
+    """
+    Predicts the traffic signs in a decoded frame and generates text based on the detected road signs.
+    Also returns whether the result may be cached, not if its hints are the fallback hints or not deterministic.
+
+    Raises
+    ------
+        HTTPException: If the model is not supported
+        HTTPException: If the inference queue is full (503, with a Retry-After header)
+        HTTPException: If the deadline of the request passed before a stage was scheduled (504)
+    """
+
+    assistant = _get_driving_assistant()
+
+    try:
+        prediction = await assistant.apredict(frame.image, confidence_threshold=confidence_threshold,
+                                              llm_model_name=llm_model_name, mode=mode, detection_filter=detection_filter)
+    except ModelNotAvailableError as e:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=str(e)
+        )
+    except QueueFullError as e:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail=str(e),
+            headers={'Retry-After': str(e.retry_after)}
+        )
+    except DeadlineExceededError as e:
+        raise _deadline_exceeded(e)
+
+    prediction.detections = frame.restore(prediction.detections)
+    return {**prediction.to_dict(), 'ingest': frame.stats()}, prediction.cacheable
+
+
+async def _cached_predict(data: bytes, decode: Callable[[], Awaitable[DecodedFrame]], llm_model_name: str,
+                          confidence_threshold: float, mode: PredictionMode, detection_filter: Optional[DetectionFilter],
+                          *frame_params) -> dict:
+    """
+    Predicts the traffic signs in a frame, or returns the result of an identical or near-identical frame from the frame cache.
+    Concurrent requests for the same frame wait for the first one instead of predicting again.
+
+    Raises
+    ------
+        HTTPException: If the frame cannot be decoded or the prediction fails, also in the coalesced requests
+    """
+
+    if frame_cache is None:
+        result, _ = await _predict(await decode(), llm_model_name, confidence_threshold, mode, detection_filter)
+        return result
+
+    key = FrameCache.key(data, llm_model_name, confidence_threshold, mode, detection_filter, *frame_params)
+
+    async def compute():
+        frame = await decode()
+        image_hash = None
+        if frame_cache.max_distance is not None:
+            image_hash = dhash(frame.image)
+            similar = frame_cache.get_similar(key, image_hash)
+            if similar is not None:
+                # Not cached again under this frame, the result expires with the similar frame
+                return similar, image_hash, False
+        result, cacheable = await _predict(frame, llm_model_name, confidence_threshold, mode, detection_filter)
+        return result, image_hash, cacheable
+
+    return await frame_cache.get_or_compute(key, compute)
 
 
 @app.post("/api/predict")
 async def predict(
     image: UploadFile,
     llm_model_name: str = "llama-v3p1-405b-instruct",
-    confidence_threshold: float = 0.5
+    confidence_threshold: float = 0.5,
+    mode: PredictionMode = "full",
+    detection_filter: Optional[DetectionFilter] = Depends(detection_filter_params),
+    request_deadline: RequestDeadline = Depends(request_deadline_params)
 ) -> dict:
     """
     Predicts the traffic signs in the given image and generates text based on the detected road signs.
 
+    Requests are scheduled earliest deadline first on the inference workers and the LLM, and dropped
+    if their deadline passes before a stage is scheduled.
+
     Parameters
     ----------
     image: UploadFile
@@ -47,38 +496,371 @@ async def predict(
         The name of the LLM model to use.
     confidence_threshold: float
         The confidence threshold for the predictions.
+    mode: PredictionMode
+        `detect` only returns the detections, `describe` also the metadata of the detected signs,
+        `full` also the hints generated by the LLM.
+    detection_filter: Optional[DetectionFilter]
+        The NMS parameters (`iou_threshold`, `max_detections`) and the classes to detect (`sign_codes`, `categories`).
+    request_deadline: RequestDeadline
+        The priority class (`priority`: `safety`, `interactive` or `batch`) and the deadline in milliseconds (`deadline_ms`).
+        Defaults to DEFAULT_PRIORITY, raised to `safety` for the LLM if a sign of SAFETY_SIGN_CATEGORIES is detected,
+        and to the deadline of the priority class in PRIORITY_DEADLINES_MS.
 
     Raises
     ------
         HTTPException: If the image is not provided or the image type is invalid
+        HTTPException: If the inference queue is full (503, with a Retry-After header)
+        HTTPException: If the deadline passed before a stage was scheduled (504)
     """
 
-    content_type = image.content_type
+    _get_driving_assistant()
+    start_request(request_deadline)
+    data = await _read_upload(image)
+    return await _cached_predict(data, lambda: _decode(data), llm_model_name, confidence_threshold, mode, detection_filter)
 
-    if content_type is None:
+
+@app.post("/api/predict_raw")
+async def predict_raw(
+    request: Request,
+    width: Optional[int] = None,
+    height: Optional[int] = None,
+    pixel_format: Optional[PixelFormat] = None,
+    llm_model_name: str = "llama-v3p1-405b-instruct",
+    confidence_threshold: float = 0.5,
+    mode: PredictionMode = "full",
+    detection_filter: Optional[DetectionFilter] = Depends(detection_filter_params),
+    request_deadline: RequestDeadline = Depends(request_deadline_params)
+) -> dict:
+    """
+    Predicts the traffic signs in the image sent as the request body, without multipart encoding.
+
+    The body is an encoded image (JPEG, PNG, ...), or a raw frame when `pixel_format` is given
+    along with its `width` and `height`.
+
+    Parameters
+    ----------
+    request: Request
+        The request, whose body is the image.
+    width: Optional[int]
+        The width of a raw frame.
+    height: Optional[int]
+        The height of a raw frame.
+    pixel_format: Optional[PixelFormat]
+        The pixel format of a raw frame, `rgb` or `nv12`.
+    llm_model_name: str
+        The name of the LLM model to use.
+    confidence_threshold: float
+        The confidence threshold for the predictions.
+    mode: PredictionMode
+        `detect` only returns the detections, `describe` also the metadata of the detected signs,
+        `full` also the hints generated by the LLM.
+    detection_filter: Optional[DetectionFilter]
+        The NMS parameters (`iou_threshold`, `max_detections`) and the classes to detect (`sign_codes`, `categories`).
+    request_deadline: RequestDeadline
+        The priority class (`priority`) and the deadline in milliseconds (`deadline_ms`), as for `/api/predict`.
+
+    Raises
+    ------
+        HTTPException: If the image cannot be decoded or the raw frame does not match its dimensions
+        HTTPException: If the inference queue is full (503, with a Retry-After header)
+        HTTPException: If the deadline passed before a stage was scheduled (504)
+    """
+
+    _get_driving_assistant()
+    start_request(request_deadline)
+    data = await request.body()
+    return await _cached_predict(data, lambda: _decode(data, width=width, height=height, pixel_format=pixel_format),
+                                 llm_model_name, confidence_threshold, mode, detection_filter, width, height, pixel_format)
+
+
+def _server_sent_event(event: str, data: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+@app.post("/api/predict_stream")
+async def predict_stream(
+    image: UploadFile,
+    llm_model_name: str = "llama-v3p1-405b-instruct",
+    confidence_threshold: float = 0.5,
+    detection_filter: Optional[DetectionFilter] = Depends(detection_filter_params),
+    request_deadline: RequestDeadline = Depends(request_deadline_params)
+) -> StreamingResponse:
+    """
+    Predicts the traffic signs in the given image and streams the generated hints as server-sent events.
+
+    A `detections` event is sent as soon as object detection finishes, followed by a `token` event
+    for every generated token and a final `done` event with the time to first byte and to first token.
+
+    Parameters
+    ----------
+    image: UploadFile
+        The image to predict the traffic signs in.
+    llm_model_name: str
+        The name of the LLM model to use.
+    confidence_threshold: float
+        The confidence threshold for the predictions.
+    detection_filter: Optional[DetectionFilter]
+        The NMS parameters (`iou_threshold`, `max_detections`) and the classes to detect (`sign_codes`, `categories`).
+    request_deadline: RequestDeadline
+        The priority class (`priority`) and the deadline in milliseconds (`deadline_ms`), as for `/api/predict`.
+
+    Raises
+    ------
+        HTTPException: If the image is not provided, the image type is invalid or the model is not supported
+        HTTPException: If the inference queue is full (503, with a Retry-After header)
+        HTTPException: If the deadline passed before object detection was scheduled (504)
+    """
+
+    started_at = time.perf_counter()
+    assistant = _get_driving_assistant()
+    start_request(request_deadline)
+    frame = await _decode_upload(image)
+
+    if llm_model_name not in assistant.llm.available_llms:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
-            detail="Image not provided"
+            detail=f"Provided model name {llm_model_name} is not supported. Please choose from {assistant.llm.available_llms}"
         )
 
-    if content_type.split("/")[0] != "image":
+    try:
+        road_signs = frame.restore(await assistant.adetect(frame.image, confidence_threshold=confidence_threshold,
+                                                           detection_filter=detection_filter))
+    except QueueFullError as e:
         raise HTTPException(
-            status_code=status.HTTP_400_BAD_REQUEST,
-            detail="Invalid image type"
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail=str(e),
+            headers={'Retry-After': str(e.retry_after)}
         )
+    except DeadlineExceededError as e:
+        raise _deadline_exceeded(e)
 
-    image = Image.open(image.file)
+    async def events():
+        ttfb = time.perf_counter() - started_at
+        yield _server_sent_event('detections', {'detections': road_signs.to_list(), 'ingest': frame.stats()})
 
-    try:
-        response = driving_assistant.predict(image, confidence_threshold=confidence_threshold, llm_model_name=llm_model_name)
-    except ModelNotAvailableError as e:
+        ttft = None
+        try:
+            async for token in assistant.llm.astream_driving_hints(road_signs, llm_model_name=llm_model_name):
+                if ttft is None:
+                    ttft = time.perf_counter() - started_at
+                yield _server_sent_event('token', {'token': token})
+        except Exception as e:
+            yield _server_sent_event('error', {'detail': f"Failed to generate hints: {e}"})
+            return
+
+        ttft = ttft if ttft is not None else time.perf_counter() - started_at
+        streaming_stats['requests'] += 1
+        streaming_stats['ttfb_ms_total'] += ttfb * 1000
+        streaming_stats['ttft_ms_total'] += ttft * 1000
+        yield _server_sent_event('done', {'ttfb_ms': ttfb * 1000, 'ttft_ms': ttft * 1000,
+                                          'total_ms': (time.perf_counter() - started_at) * 1000})
+
+    return StreamingResponse(events(), media_type='text/event-stream', headers={'Cache-Control': 'no-cache'})
+
+
+@app.post("/api/predict_batch")
+async def predict_batch(
+    images: List[UploadFile],
+    llm_model_name: str = "llama-v3p1-405b-instruct",
+    confidence_threshold: float = 0.5,
+    batch_size: int = Query(16, ge=1, le=MAX_BATCH_SIZE),
+    detection_filter: Optional[DetectionFilter] = Depends(detection_filter_params)
+) -> StreamingResponse:
+    """
+    Predicts the traffic signs and generates the hints of many images, streaming a JSON line per image.
+
+    The images are detected in batches of `batch_size`, and the LLM is called once per distinct set of
+    signs across all the images. A last line reports the number of images, LLM calls and the throughput.
+    Every batch is scheduled in the `batch` priority class, behind the interactive requests.
+
+    Parameters
+    ----------
+    images: List[UploadFile]
+        The images to predict the traffic signs in.
+    llm_model_name: str
+        The name of the LLM model to use.
+    confidence_threshold: float
+        The confidence threshold for the predictions.
+    batch_size: int
+        The number of images detected in a single forward pass, from 1 to MAX_BATCH_SIZE.
+    detection_filter: Optional[DetectionFilter]
+        The NMS parameters (`iou_threshold`, `max_detections`) and the classes to detect (`sign_codes`, `categories`).
+
+    Raises
+    ------
+        HTTPException: If the model is not supported
+        HTTPException: If the batch size is not between 1 and MAX_BATCH_SIZE (422)
+    """
+
+    started_at = time.perf_counter()
+    assistant = _get_driving_assistant()
+
+    if llm_model_name not in assistant.llm.available_llms:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
-            detail=str(e)
+            detail=f"Provided model name {llm_model_name} is not supported. Please choose from {assistant.llm.available_llms}"
         )
 
-    return {'hints': response}
+    predictor = BatchPredictor(assistant, llm_model_name=llm_model_name, confidence_threshold=confidence_threshold,
+                               detection_filter=detection_filter)
+
+    async def results():
+        processed = 0
+        for start in range(0, len(images), batch_size):
+            items = [(image.filename or str(start + i), await image.read())
+                     for i, image in enumerate(images[start:start + batch_size])]
+            try:
+                start_request(RequestDeadline.create('batch'))
+                records = await predictor.apredict_batch(items)
+            except QueueFullError as e:
+                yield json.dumps({'error': str(e), 'retry_after': e.retry_after}) + '\n'
+                return
+            except DeadlineExceededError as e:
+                yield json.dumps({'error': str(e)}) + '\n'
+                return
+            for record in records:
+                yield json.dumps(record, ensure_ascii=False) + '\n'
+            processed += len(records)
+
+        elapsed = time.perf_counter() - started_at
+        yield json.dumps({'summary': {'processed': processed, 'llm_calls': predictor.llm_calls, 'elapsed_s': elapsed,
+                                      'images_per_sec': processed / elapsed if elapsed else 0.0}}) + '\n'
+
+    return StreamingResponse(results(), media_type='application/x-ndjson')
+
+
+@app.websocket("/api/stream")
+async def stream(
+    websocket: WebSocket,
+    llm_model_name: str = "llama-v3p1-405b-instruct",
+    confidence_threshold: float = 0.5,
+    iou_threshold: Optional[float] = None,
+    max_detections: Optional[int] = None,
+    sign_codes: Optional[List[str]] = Query(None),
+    categories: Optional[List[str]] = Query(None)
+):
+    """
+    Streams driving hints for a sequence of video frames.
+
+    Every binary message received is an encoded frame (JPEG, PNG, ...). The traffic signs detected in
+    each frame are tracked across frames and a `detections` message with the tracks is sent back.
+    Whenever the set of confirmed signs changes, the LLM is called and a `hints` message follows
+    once it answers. A text message `end` finishes the stream after the pending hints were sent.
+    While a sign of SAFETY_SIGN_CATEGORIES is tracked, the frames are scheduled in the safety class.
+
+    Parameters
+    ----------
+    websocket: WebSocket
+        The WebSocket connection.
+    llm_model_name: str
+        The name of the LLM model to use.
+    confidence_threshold: float
+        The confidence threshold for the predictions.
+    iou_threshold, max_detections, sign_codes, categories:
+        The NMS parameters and the classes to detect, as for `/api/predict`.
+    """
+
+    assistant = driving_assistant
+    if assistant is None:
+        await websocket.close(code=status.WS_1013_TRY_AGAIN_LATER,
+                              reason=f"Service is not ready ({service_state['status']})")
+        return
+
+    if llm_model_name not in settings.available_llms:
+        await websocket.close(code=status.WS_1008_POLICY_VIOLATION,
+                              reason=f"Provided model name {llm_model_name} is not supported")
+        return
+
+    try:
+        detection_filter = _build_detection_filter(iou_threshold, max_detections, sign_codes, categories)
+    except ValueError as e:
+        await websocket.close(code=status.WS_1008_POLICY_VIOLATION, reason=str(e))
+        return
+
+    await websocket.accept()
+
+    tracker = SignTracker()
+    send_lock = asyncio.Lock()
+    hints_task: Optional[asyncio.Task] = None
+
+    async def send(message: dict):
+        async with send_lock:
+            await websocket.send_json(message)
+
+    async def send_hints(frame: int, tracks: List[SignTrack]):
+        sign_codes = sorted({track.sign_code for track in tracks})
+        try:
+            hints = await assistant.llm.aget_driving_hints([track.prediction for track in tracks], llm_model_name=llm_model_name)
+        except Exception as e:
+            await send({'type': 'error', 'frame': frame, 'detail': f"Failed to generate hints: {e}"})
+            return
+        await send({'type': 'hints', 'frame': frame, 'sign_codes': sign_codes, 'hints': hints})
+
+    frame = 0
+    try:
+        while True:
+            message = await websocket.receive()
+            if message['type'] == 'websocket.disconnect':
+                raise WebSocketDisconnect(message.get('code', 1000))
+            if message.get('text') == 'end':
+                break
+            if message.get('bytes') is None:
+                await send({'type': 'error', 'frame': frame, 'detail': "Frames must be sent as binary messages"})
+                continue
+
+            try:
+                # The tracked signs are a free pre-pass: a stop sign in the last frames is likely in this one too
+                safety = safety_priority(track.sign_code for track in tracker.tracks)
+                start_request(RequestDeadline.create('safety' if safety else None))
+                decoded = await asyncio.to_thread(decode_image, message['bytes'])
+                metrics.observe_stage('decode', decoded.decode_ms / 1000)
+                predictions = decoded.restore(await assistant.adetect(decoded.image, confidence_threshold=confidence_threshold,
+                                                                      detection_filter=detection_filter))
+            except UnidentifiedImageError:
+                await send({'type': 'error', 'frame': frame, 'detail': "Invalid image"})
+                frame += 1
+                continue
+            except (QueueFullError, DeadlineExceededError) as e:
+                # The frame is dropped, the next one will catch up with the tracked signs
+                await send({'type': 'error', 'frame': frame, 'detail': str(e)})
+                frame += 1
+                continue
+
+            changed = tracker.update(predictions)
+            await send({'type': 'detections', 'frame': frame, 'ingest': decoded.stats(),
+                        'tracks': [track.to_dict(tracker.min_hits) for track in tracker.tracks]})
+
+            if changed:
+                # Hints for an outdated set of signs are useless, only the latest ones are generated
+                if hints_task is not None:
+                    hints_task.cancel()
+                hints_task = asyncio.create_task(send_hints(frame, tracker.confirmed_tracks))
+            frame += 1
+
+        if hints_task is not None:
+            await hints_task
+        await websocket.close()
+    except WebSocketDisconnect:
+        if hints_task is not None:
+            hints_task.cancel()
 
 
 if __name__ == "__main__":
-    uvicorn.run("src.models.api:app", host=settings.host, port=settings.port)
+    parser = argparse.ArgumentParser(description='Run the Driving Assistant API')
+    parser.add_argument('--workers', type=int, default=settings.workers,
+                        help='Number of server processes, forked after the model weights are loaded')
+    parser.add_argument('--inference-processes', type=int, default=settings.inference_processes,
+                        help='Number of processes running object detection, forked after the model weights are loaded')
+    args = parser.parse_args()
+
+    if args.workers > 1 and args.inference_processes > 0:
+        parser.error("--workers and --inference-processes cannot be combined")
+
+    # The application object is passed rather than its import string, so that the server uses the
+    # models preloaded in this module instead of importing a fresh copy of it
+    if args.workers > 1:
+        serve_prefork(app, preload=preload_models, workers=args.workers)
+    else:
+        if args.inference_processes > 0:
+            preload_models(inference_processes=args.inference_processes)
+        uvicorn.run(app, host=settings.host, port=settings.port)
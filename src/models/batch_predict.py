@@ -0,0 +1,265 @@
+'''
+Offline prediction over a directory or a tar archive of images, e.g. the frames of a recorded trip.
+
+Images are decoded and detected in batches, and the LLM is called once per distinct set of
+sign codes instead of once per image. The results are appended as JSON lines to the output
+file, which also serves as the checkpoint: running the same command again skips the images
+already answered in it, so an interrupted run resumes where it stopped and the failed images are retried.
+
+Usage:
+    python -m src.models.batch_predict <DIR or TAR> --output results.jsonl [--batch-size 16] [--no-resume]
+'''
+
+from src.models.ImageIngest import DecodedFrame, decode_image
+from src.models.DrivingAssistant import DrivingAssistant
+from src.models.HintCache import SignSet, sign_set
+from src.models.types.Detections import Detections
+from src.models.types.DetectionFilter import DetectionFilter
+from src.config.settings import settings
+from typing import Dict, Iterable, Iterator, List, Optional, Set, Tuple
+from PIL import UnidentifiedImageError
+import itertools
+import asyncio
+import argparse
+import tarfile
+import json
+import time
+import os
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.bmp', '.webp')
+
+def iter_images(source: str) -> Iterator[Tuple[str, bytes]]:
+    '''
+    Yields the name and the encoded bytes of every image in a directory (recursively) or a tar archive, in name order.
+    Tar archives are read sequentially, so compressed archives are never extracted to disk.
+    '''
+    if os.path.isdir(source):
+        paths = sorted(os.path.join(root, name) for root, _, names in os.walk(source) for name in names
+                       if name.lower().endswith(IMAGE_EXTENSIONS))
+        for path in paths:
+            with open(path, 'rb') as f:
+                yield os.path.relpath(path, source), f.read()
+    elif tarfile.is_tarfile(source):
+        with tarfile.open(source, 'r|*') as archive:
+            for member in archive:
+                if member.isfile() and member.name.lower().endswith(IMAGE_EXTENSIONS):
+                    yield member.name, archive.extractfile(member).read()
+    else:
+        raise ValueError(f"{source} is neither a directory nor a tar archive")
+
+
+def load_checkpoint(output_path: str) -> Set[str]:
+    '''
+    Returns the names of the images already written to the output file, except the failed ones, which are retried.
+    A truncated last line, left by an interrupted run, is ignored and overwritten.
+    '''
+    if not os.path.exists(output_path):
+        return set()
+    done = set()
+    valid_size = 0
+    with open(output_path, 'rb') as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+                if 'error' not in record:
+                    done.add(record['image'])
+            except (ValueError, KeyError):
+                break
+            valid_size += len(line)
+    if valid_size != os.path.getsize(output_path):
+        with open(output_path, 'r+b') as f:
+            f.truncate(valid_size)
+    return done
+
+
+class BatchPredictor:
+    """
+    Class running detection in batches and generating the hints once per distinct set of signs.
+    """
+
+    def __init__(self, driving_assistant: DrivingAssistant, llm_model_name: str = 'llama-v3p1-405b-instruct',
+                 confidence_threshold: float = settings.confidence_threshold,
+                 detection_filter: Optional[DetectionFilter] = None):
+        """
+        Initializes the predictor.
+
+        Parameters
+        ----------
+        driving_assistant: DrivingAssistant
+            The driving assistant whose models are used.
+        llm_model_name: str
+            The name of the LLM generating the hints.
+        confidence_threshold: float
+            The confidence threshold for the predictions.
+        detection_filter: Optional[DetectionFilter]
+            The NMS parameters and the classes to detect. Defaults to the filter configured by the settings.
+        """
+        self.driving_assistant = driving_assistant
+        self.llm_model_name = llm_model_name
+        self.confidence_threshold = confidence_threshold
+        self.detection_filter = detection_filter
+        self.hints: Dict[SignSet, str] = {}
+        self.llm_calls = 0
+
+    def decode(self, items: Iterable[Tuple[str, bytes]]) -> Tuple[List[Tuple[str, DecodedFrame]], List[dict]]:
+        '''
+        Decodes the images, returning the decoded frames and an error record for every image that could not be decoded.
+        '''
+        frames, errors = [], []
+        for name, data in items:
+            try:
+                frames.append((name, decode_image(data)))
+            except (UnidentifiedImageError, ValueError, OSError) as e:
+                errors.append({'image': name, 'error': f"Invalid image: {e}"})
+        return frames, errors
+
+    def record(self, name: str, frame: DecodedFrame, detections: Detections) -> dict:
+        return {
+            'image': name,
+            'sign_codes': list(sign_set(detections.sign_codes)),
+            'detections': detections.to_list(),
+            'hints': self.hints[sign_set(detections.sign_codes)],
+            'image_size': list(frame.original_size),
+        }
+
+    def missing_sign_sets(self, detections: Iterable[Detections]) -> Dict[SignSet, Detections]:
+        '''
+        Returns one detections object for every set of signs whose hints were not generated yet.
+        '''
+        missing = {}
+        for image_detections in detections:
+            key = sign_set(image_detections.sign_codes)
+            if key not in self.hints and key not in missing:
+                missing[key] = image_detections
+        return missing
+
+    def predict_batch(self, items: List[Tuple[str, bytes]]) -> List[dict]:
+        '''
+        Predicts the traffic signs and the hints of a batch of encoded images.
+
+        Returns
+        -------
+        List[dict]
+            A record per image, with its sign codes, detections and hints, or the error that occurred.
+        '''
+        frames, errors = self.decode(items)
+        if not frames:
+            return errors
+
+        detections = self.driving_assistant.yolo_model.detect_traffic_signs_batch(
+            [frame.image for _, frame in frames], [self.confidence_threshold] * len(frames), self.detection_filter)
+        detections = [frame.restore(image_detections) for (_, frame), image_detections in zip(frames, detections)]
+
+        for key, image_detections in self.missing_sign_sets(detections).items():
+            self.hints[key] = self.driving_assistant.llm.get_driving_hints(image_detections, llm_model_name=self.llm_model_name)
+            # Images without signs are answered without calling the LLM
+            self.llm_calls += bool(key)
+
+        return errors + [self.record(name, frame, image_detections) for (name, frame), image_detections in zip(frames, detections)]
+
+    async def apredict_batch(self, items: List[Tuple[str, bytes]]) -> List[dict]:
+        '''
+        Asynchronously predicts the traffic signs and the hints of a batch of encoded images.
+        Detection runs through the driving assistant, on the inference processes or the batch scheduler when they
+        are enabled, and the hints of the distinct sign sets are generated concurrently.
+
+        Raises
+        ------
+        QueueFullError
+            If the inference queue is full.
+        DeadlineExceededError
+            If the deadline of the request passed before detection was scheduled.
+        '''
+        frames, errors = await asyncio.to_thread(self.decode, items)
+        if not frames:
+            return errors
+
+        detections = await self.driving_assistant.adetect_batch([frame.image for _, frame in frames], self.confidence_threshold,
+                                                                self.detection_filter)
+        detections = [frame.restore(image_detections) for (_, frame), image_detections in zip(frames, detections)]
+
+        missing = self.missing_sign_sets(detections)
+        hints = await asyncio.gather(*(self.driving_assistant.llm.aget_driving_hints(image_detections, llm_model_name=self.llm_model_name)
+                                       for image_detections in missing.values()))
+        self.hints.update(zip(missing, hints))
+        self.llm_calls += sum(1 for key in missing if key)
+
+        return errors + [self.record(name, frame, image_detections) for (name, frame), image_detections in zip(frames, detections)]
+
+    def run(self, source: str, output_path: str, batch_size: int = 16, resume: bool = True) -> dict:
+        '''
+        Predicts every image of a directory or a tar archive, appending the results to a JSONL file.
+
+        Parameters
+        ----------
+        source: str
+            The directory or the tar archive of images.
+        output_path: str
+            The JSONL output file, also used as the checkpoint when resuming.
+        batch_size: int
+            The number of images detected in a single forward pass.
+        resume: bool
+            Skip the images already in the output file, instead of overwriting it.
+
+        Returns
+        -------
+        dict
+            The number of processed, skipped and failed images, the number of LLM calls and the throughput.
+        '''
+        done = load_checkpoint(output_path) if resume else set()
+        pending = ((name, data) for name, data in iter_images(source) if name not in done)
+
+        processed = failed = 0
+        start = time.perf_counter()
+        with open(output_path, 'a' if resume else 'w', encoding='utf-8') as f:
+            while batch := list(itertools.islice(pending, batch_size)):
+                for record in self.predict_batch(batch):
+                    f.write(json.dumps(record, ensure_ascii=False) + '\n')
+                    failed += 'error' in record
+                    processed += 1
+                # Every written batch is a checkpoint
+                f.flush()
+                os.fsync(f.fileno())
+                print(f"{processed} images processed ({processed / (time.perf_counter() - start):.1f} images/s)", end='\r')
+
+        elapsed = time.perf_counter() - start
+        return {
+            'processed': processed,
+            'skipped': len(done),
+            'failed': failed,
+            'llm_calls': self.llm_calls,
+            'elapsed_s': elapsed,
+            'images_per_sec': processed / elapsed if elapsed else 0.0,
+        }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Predict the traffic signs and hints of a directory or a tar archive of images')
+    parser.add_argument('source', help='Directory or tar archive (optionally compressed) of images')
+    parser.add_argument('--output', required=True, help='JSONL file the results are appended to')
+    parser.add_argument('--llm-model-name', default='llama-v3p1-405b-instruct')
+    parser.add_argument('--confidence-threshold', type=float, default=settings.confidence_threshold)
+    parser.add_argument('--batch-size', type=int, default=16, help='Number of images detected in a single forward pass')
+    parser.add_argument('--iou-threshold', type=float, default=settings.iou_threshold, help='IoU above which overlapping detections are suppressed')
+    parser.add_argument('--max-detections', type=int, default=settings.max_detections, help='Maximum number of detections per image')
+    parser.add_argument('--sign-codes', nargs='+', help='Only detect these sign codes')
+    parser.add_argument('--categories', nargs='+', default=settings.detection_categories, help='Only detect these sign categories, e.g. 3 for the prohibitory signs')
+    parser.add_argument('--no-resume', action='store_true', help='Overwrite the output file instead of skipping the images already in it')
+    args = parser.parse_args()
+
+    detection_filter = DetectionFilter.from_signs(sign_codes=args.sign_codes, categories=args.categories,
+                                                  iou_threshold=args.iou_threshold, max_detections=args.max_detections)
+    assistant = DrivingAssistant(llm_model_name=args.llm_model_name)
+    predictor = BatchPredictor(assistant, llm_model_name=args.llm_model_name, confidence_threshold=args.confidence_threshold,
+                               detection_filter=detection_filter)
+    try:
+        stats = predictor.run(args.source, args.output, batch_size=args.batch_size, resume=not args.no_resume)
+    finally:
+        assistant.close()
+
+    print(f"\n{stats['processed']} images processed in {stats['elapsed_s']:.1f}s ({stats['images_per_sec']:.2f} images/s), "
+          f"{stats['skipped']} skipped from a previous run, {stats['failed']} failed, {stats['llm_calls']} LLM calls")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,64 @@
+'''
+Exports the object detection weights for the ONNX Runtime or OpenVINO inference engines.
+
+Usage:
+    python -m src.models.export_detector --engine onnx|openvino [--weights PATH]
+
+The exported model is written next to the PyTorch weights, where `YOLOModel` looks for it when
+`DETECTOR_ENGINE` is set to the same engine.
+'''
+
+from ultralytics import YOLO
+from src.models.YOLOModel import YOLOModel, engine_weights_path
+from src.config.settings import settings
+import argparse
+
+
+def export_detector(weights_path: str, engine: str, half: bool = False, int8: bool = False, data: str = None) -> str:
+    '''
+    Exports the weights for the given engine at the configured image size.
+
+    Parameters
+    ----------
+    weights_path: str
+        The path to the PyTorch weights.
+    engine: str
+        The inference engine, onnx or openvino.
+    half: bool
+        Flag indicating whether to export FP16 weights.
+    int8: bool
+        Flag indicating whether to quantize the weights to INT8 (OpenVINO only, calibrated on `data`).
+    data: str
+        The dataset YAML file used for INT8 calibration.
+
+    Returns
+    -------
+    str
+        The path of the exported model.
+    '''
+    model = YOLO(model=weights_path, task='detect')
+    # Dynamic input shapes keep batched inference possible with the exported model
+    return model.export(format=engine, imgsz=(settings.image_height, settings.image_width),
+                        dynamic=engine == 'onnx', half=half, int8=int8, data=data, device='cpu')
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Export the object detection weights for another inference engine')
+    parser.add_argument('--engine', choices=['onnx', 'openvino'], required=True)
+    parser.add_argument('--weights', default=settings.obj_detect_weights_path, help='Path to the PyTorch weights')
+    parser.add_argument('--skip-parity-check', action='store_true', help='Do not compare the exported model with the PyTorch one')
+    args = parser.parse_args()
+
+    exported_path = export_detector(args.weights, args.engine)
+    print(f"Exported {args.weights} to {exported_path}")
+
+    expected_path = engine_weights_path(args.weights, args.engine)
+    if str(exported_path).rstrip('/') != expected_path:
+        print(f"Warning: the exported model is expected at {expected_path} by DETECTOR_ENGINE={args.engine}")
+
+    if not args.skip_parity_check:
+        YOLOModel(args.weights, engine=args.engine, parity_check=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,147 @@
+'''
+Prometheus metrics of the prediction pipeline, rendered in the Prometheus text exposition format by `/metrics`.
+
+The metrics are in-process `prometheus_client` metrics, cheap enough to stay enabled in
+production. With several server processes (`--workers`), every process exposes its own metrics.
+
+The duration of each stage of a prediction is measured with `stage(name)`, which also records it
+in the trace of the current request when one was started with `start_trace()`, so that the stage
+breakdown of a request can be returned in its `Server-Timing` header.
+'''
+
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Callable, Dict, List, Literal, Optional, Sequence, Tuple
+from prometheus_client import CONTENT_TYPE_LATEST, CollectorRegistry, Counter, Gauge, Histogram, disable_created_metrics, generate_latest
+from prometheus_client.core import CounterMetricFamily, GaugeMetricFamily
+from prometheus_client.registry import Collector
+import time
+
+# Only the counters themselves, not the time they were created at
+disable_created_metrics()
+
+# The metrics of the pipeline, without the default process and runtime metrics of `prometheus_client`
+REGISTRY = CollectorRegistry()
+
+CONTENT_TYPE = CONTENT_TYPE_LATEST
+
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+class CallbackMetric(Collector):
+    """
+    Class representing an unlabelled counter or gauge whose value is read from a function when the metrics are collected,
+    for the statistics that are already kept elsewhere, e.g. by the caches.
+    """
+
+    def __init__(self, name: str, documentation: str, kind: Literal['counter', 'gauge']):
+        self.name = name
+        self.documentation = documentation
+        self.kind = kind
+        self._function: Optional[Callable[[], float]] = None
+        REGISTRY.register(self)
+
+    def set_function(self, function: Callable[[], float]):
+        self._function = function
+
+    def _family(self, value: Optional[float] = None):
+        family = CounterMetricFamily if self.kind == 'counter' else GaugeMetricFamily
+        return family(self.name, self.documentation, value=value)
+
+    def describe(self):
+        yield self._family()
+
+    def collect(self):
+        if self._function is not None:
+            yield self._family(self._function())
+
+
+def render_metrics() -> bytes:
+    '''
+    Renders all the metrics in the Prometheus text exposition format.
+    '''
+    return generate_latest(REGISTRY)
+
+
+HTTP_REQUEST_DURATION = Histogram('driving_assistant_http_request_duration_seconds',
+                                  'Duration of the HTTP requests until the response headers are sent',
+                                  ('method', 'route', 'status'), registry=REGISTRY, buckets=DEFAULT_BUCKETS)
+STAGE_DURATION = Histogram('driving_assistant_stage_duration_seconds',
+                           'Duration of the stages of a prediction: decode, queue_wait, detect, sign_metadata, prompt and llm',
+                           ('stage',), registry=REGISTRY, buckets=DEFAULT_BUCKETS)
+DETECTIONS = Counter('driving_assistant_detections_total', 'Number of detected traffic signs', ('sign_code',), registry=REGISTRY)
+LLM_TOKENS = Counter('driving_assistant_llm_tokens_total', 'Number of LLM tokens', ('model', 'kind'), registry=REGISTRY)
+PROMPT_TOKENS = Histogram('driving_assistant_prompt_tokens', 'Estimated number of tokens of the road signs section of the prompts',
+                          registry=REGISTRY, buckets=(25, 50, 100, 200, 400, 800, 1600))
+LLM_RETRIES = Counter('driving_assistant_llm_retries_total', 'Number of retried LLM calls', ('model',), registry=REGISTRY)
+LLM_HEDGES = Counter('driving_assistant_llm_hedges_total', 'Number of prompts also sent to the hedge model because the requested one was slow or failed', ('model',), registry=REGISTRY)
+LLM_FALLBACKS = Counter('driving_assistant_llm_fallbacks_total', 'Number of hints generated from the sign descriptions because the LLM failed', ('model',), registry=REGISTRY)
+HINT_LIBRARY_HITS = Counter('driving_assistant_hint_library_hits_total', 'Number of hints read from the pregenerated hint library', registry=REGISTRY)
+HINT_CACHE_HITS = CallbackMetric('driving_assistant_hint_cache_hits_total', 'Number of hint cache hits', 'counter')
+HINT_CACHE_MISSES = CallbackMetric('driving_assistant_hint_cache_misses_total', 'Number of hint cache misses', 'counter')
+HINT_CACHE_SIZE = CallbackMetric('driving_assistant_hint_cache_size', 'Number of cached hints', 'gauge')
+FRAME_CACHE_HITS = CallbackMetric('driving_assistant_frame_cache_hits_total', 'Number of predictions answered from the frame cache, by identical or similar frame or by coalescing', 'counter')
+FRAME_CACHE_MISSES = CallbackMetric('driving_assistant_frame_cache_misses_total', 'Number of predictions computed because the frame was not in the frame cache', 'counter')
+INFERENCE_QUEUE_DEPTH = CallbackMetric('driving_assistant_inference_queue_depth', 'Number of detection jobs waiting for a free inference worker', 'gauge')
+INFERENCE_REJECTED = CallbackMetric('driving_assistant_inference_rejected_total', 'Number of detection jobs rejected because the queue was full', 'counter')
+REQUESTS_DROPPED = Counter('driving_assistant_requests_dropped_total', 'Number of requests dropped because their deadline passed before a stage', ('stage', 'priority'), registry=REGISTRY)
+
+_trace: ContextVar[Optional[List[Tuple[str, float]]]] = ContextVar('trace', default=None)
+
+
+def start_trace() -> List[Tuple[str, float]]:
+    '''
+    Starts recording the stage durations of the current request (or task), and returns the list they are appended to.
+    '''
+    trace = []
+    _trace.set(trace)
+    return trace
+
+
+def observe_stage(name: str, seconds: float):
+    '''
+    Records the duration of a stage measured elsewhere.
+    '''
+    STAGE_DURATION.labels(name).observe(seconds)
+    trace = _trace.get()
+    if trace is not None:
+        trace.append((name, seconds))
+
+
+@contextmanager
+def stage(name: str):
+    '''
+    Measures the duration of a stage of the prediction pipeline.
+    '''
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe_stage(name, time.perf_counter() - start)
+
+
+def count_detections(sign_codes: Sequence[str]):
+    '''
+    Counts the detected traffic signs by sign code.
+    '''
+    for sign_code in sign_codes:
+        DETECTIONS.labels(sign_code).inc()
+
+
+def count_llm_tokens(model: str, completion_tokens: int, prompt_tokens: Optional[int] = None):
+    '''
+    Counts the tokens of an LLM call. The prompt tokens are only known when the API reports them.
+    '''
+    LLM_TOKENS.labels(model, 'completion').inc(completion_tokens)
+    if prompt_tokens is not None:
+        LLM_TOKENS.labels(model, 'prompt').inc(prompt_tokens)
+
+
+def server_timing(trace: List[Tuple[str, float]]) -> str:
+    '''
+    Formats the stage durations of a trace as a `Server-Timing` header value, summing repeated stages.
+    '''
+    durations: Dict[str, float] = {}
+    for name, seconds in trace:
+        durations[name] = durations.get(name, 0.0) + seconds
+    return ', '.join(f'{name};dur={seconds * 1000:.2f}' for name, seconds in durations.items())
@@ -0,0 +1,73 @@
+'''
+Prefork server running several uvicorn workers that share the model weights copy-on-write.
+
+The parent process loads the weights, then forks the workers, which all accept connections on
+the same listening socket. Since the weights are loaded before `fork`, their memory pages are
+shared by all the workers instead of being duplicated in each of them.
+'''
+
+from typing import Callable, List, Union
+from src.config.settings import settings
+import uvicorn
+import signal
+import socket
+import torch
+import gc
+import os
+
+
+def serve_prefork(app: Union[str, Callable], preload: Callable[[], None], workers: int,
+                  host: str = settings.host, port: int = settings.port):
+    '''
+    Loads the models in the current process, then forks and runs `workers` uvicorn servers.
+
+    Parameters
+    ----------
+    app: Union[str, Callable]
+        The ASGI application or its import string.
+    preload: Callable[[], None]
+        Function loading the shared models before forking.
+    workers: int
+        The number of worker processes.
+    host: str
+        The host to listen on.
+    port: int
+        The port to listen on.
+    '''
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((host, port))
+    sock.listen(2048)
+    sock.set_inheritable(True)
+
+    # OpenMP thread pools do not survive fork, keep the parent single-threaded while loading
+    torch.set_num_threads(1)
+    preload()
+    # Move the loaded objects out of the garbage collector's reach, so that collections in the
+    # workers do not write to (and thereby copy) the shared pages
+    gc.freeze()
+
+    print(f"Starting {workers} workers on http://{host}:{port}")
+    pids: List[int] = []
+    for _ in range(workers):
+        pid = os.fork()
+        if pid == 0:
+            torch.set_num_threads(max(1, (os.cpu_count() or 1) // workers))
+            server = uvicorn.Server(uvicorn.Config(app, host=host, port=port))
+            server.run(sockets=[sock])
+            os._exit(0)
+        pids.append(pid)
+
+    def stop(signum, frame):
+        for pid in pids:
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+
+    for pid in pids:
+        os.waitpid(pid, 0)
+    sock.close()
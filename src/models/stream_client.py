@@ -0,0 +1,92 @@
+'''
+Client streaming a video or a sequence of images to the `/api/stream` endpoint and printing the responses.
+
+Usage:
+    python -m src.models.stream_client <video.mp4 | image.jpg | directory> [--repeat N] [--fps FPS]
+
+A single image is sent `--repeat` times, which is handy to test the endpoint with `examples/example-1.jpg`.
+'''
+
+from websockets.sync.client import connect
+from websockets.exceptions import ConnectionClosed
+from typing import Iterator
+from src.config.settings import settings
+import threading
+import argparse
+import time
+import cv2
+import os
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.bmp', '.webp')
+
+
+def read_frames(source: str, repeat: int = 1) -> Iterator[bytes]:
+    '''
+    Yields the JPEG encoded frames of a video, an image or a directory of images.
+
+    Parameters
+    ----------
+    source: str
+        Path to a video file, an image or a directory of images.
+    repeat: int
+        The number of times a single image is sent.
+    '''
+    if os.path.isdir(source):
+        for name in sorted(os.listdir(source)):
+            if name.lower().endswith(IMAGE_EXTENSIONS):
+                with open(os.path.join(source, name), 'rb') as f:
+                    yield f.read()
+        return
+
+    if source.lower().endswith(IMAGE_EXTENSIONS):
+        with open(source, 'rb') as f:
+            frame = f.read()
+        for _ in range(repeat):
+            yield frame
+        return
+
+    capture = cv2.VideoCapture(source)
+    try:
+        while True:
+            ok, frame = capture.read()
+            if not ok:
+                return
+            ok, encoded = cv2.imencode('.jpg', frame)
+            if ok:
+                yield encoded.tobytes()
+    finally:
+        capture.release()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Stream frames to the driving assistant')
+    parser.add_argument('source', help='Path to a video file, an image or a directory of images')
+    parser.add_argument('--url', default=f'ws://127.0.0.1:{settings.port}/api/stream', help='URL of the streaming endpoint')
+    parser.add_argument('--llm-model-name', default='llama-v3p1-405b-instruct')
+    parser.add_argument('--confidence-threshold', type=float, default=0.5)
+    parser.add_argument('--repeat', type=int, default=10, help='Number of times a single image is sent')
+    parser.add_argument('--fps', type=float, default=0, help='Maximum number of frames sent per second (0 for unlimited)')
+    args = parser.parse_args()
+
+    url = f'{args.url}?llm_model_name={args.llm_model_name}&confidence_threshold={args.confidence_threshold}'
+    with connect(url, max_size=None) as websocket:
+        def receive():
+            try:
+                for message in websocket:
+                    print(message)
+            except ConnectionClosed:
+                pass
+
+        receiver = threading.Thread(target=receive)
+        receiver.start()
+
+        for frame in read_frames(args.source, repeat=args.repeat):
+            websocket.send(frame)
+            if args.fps:
+                time.sleep(1 / args.fps)
+        websocket.send('end')
+        receiver.join()
+
+
+if __name__ == '__main__':
+    main()
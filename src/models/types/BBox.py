@@ -127,3 +127,25 @@ class BBox(BaseModel):
         self.w = self.w * width
         self.h = self.h * height
         return self
+
+    def iou(self, other: 'BBox') -> float:
+        '''
+        Computes the intersection over union with another bounding box in the same coordinate space.
+
+        Parameters
+        ----------
+        other: BBox
+            The other bounding box.
+
+        Returns
+        -------
+        float
+            The intersection over union, between 0 and 1.
+        '''
+        inter_w = min(self.x + self.w / 2, other.x + other.w / 2) - max(self.x - self.w / 2, other.x - other.w / 2)
+        inter_h = min(self.y + self.h / 2, other.y + other.h / 2) - max(self.y - self.h / 2, other.y - other.h / 2)
+        if inter_w <= 0 or inter_h <= 0:
+            return 0.0
+        intersection = inter_w * inter_h
+        union = self.w * self.h + other.w * other.h - intersection
+        return intersection / union if union > 0 else 0.0
@@ -0,0 +1,71 @@
+from src.models.types.TrafficSign import load_category_mapping
+from src.config.settings import settings
+from pydantic import BaseModel, ConfigDict, Field
+from typing import Iterable, Optional, Tuple
+
+
+class DetectionFilter(BaseModel):
+    """
+    Class representing the non-maximum suppression parameters and the classes the detector keeps.
+
+    They are passed down to the model inference, so that NMS never runs over the boxes of the
+    excluded classes. ultralytics keeps them on the predictor shared by all the calls to a model,
+    so `YOLOModel` runs its calls one at a time and every call passes all of them. The filter is
+    immutable and hashable, so that requests with the same filter can be batched together.
+
+    Parameters
+    ----------
+    iou_threshold: float
+        The IoU above which overlapping boxes are suppressed by NMS.
+    max_detections: int
+        The maximum number of detections per image.
+    classes: Optional[Tuple[int, ...]]
+        The class IDs to detect, or None to detect all of them.
+    """
+
+    model_config = ConfigDict(frozen=True)
+
+    iou_threshold: float = Field(settings.iou_threshold, gt=0, le=1)
+    max_detections: int = Field(settings.max_detections, gt=0)
+    classes: Optional[Tuple[int, ...]] = Field(None)
+
+    @classmethod
+    def from_signs(cls, sign_codes: Optional[Iterable[str]] = None, categories: Optional[Iterable[str]] = None,
+                   category_mapping_path: str = settings.category_mapping_path, **kwargs) -> 'DetectionFilter':
+        '''
+        Creates a filter keeping the classes of the given sign codes (e.g. `3.21`) and sign categories
+        (the first part of the sign code, e.g. `3` for the prohibitory signs).
+        Without sign codes nor categories, all the classes are kept.
+
+        Raises
+        ------
+        ValueError
+            If a sign code or a category is not in the category mapping.
+        '''
+        if not sign_codes and not categories:
+            return cls(**kwargs)
+
+        category_mapping = load_category_mapping(category_mapping_path)
+        sign_codes, categories = set(sign_codes or ()), set(categories or ())
+        unknown = (sign_codes - set(category_mapping.values())) | (categories - {code.split('.')[0] for code in category_mapping.values()})
+        if unknown:
+            raise ValueError(f"Unknown sign codes or categories: {sorted(unknown)}")
+
+        classes = tuple(sorted(class_id for class_id, sign_code in category_mapping.items()
+                               if sign_code in sign_codes or sign_code.split('.')[0] in categories))
+        return cls(classes=classes, **kwargs)
+
+    @classmethod
+    def default(cls) -> 'DetectionFilter':
+        '''
+        Returns the filter configured by the settings.
+        '''
+        return cls.from_signs(categories=settings.detection_categories)
+
+    def predict_kwargs(self) -> dict:
+        '''
+        Returns the keyword arguments of the ultralytics `predict` applying the filter.
+        All of them are always set, so that no argument of a previous call is left on the predictor.
+        '''
+        return {'iou': self.iou_threshold, 'max_det': self.max_detections,
+                'classes': list(self.classes) if self.classes is not None else None}
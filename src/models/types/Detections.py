@@ -0,0 +1,225 @@
+from src.models.types.YOLOPrediction import YOLOPrediction
+from src.models.types.TrafficSign import load_category_mapping
+from src.models.SignMetadataStore import get_sign_metadata_store
+from src.models.metrics import stage
+from src.config.settings import settings
+from typing import Iterable, Iterator, List, Literal, Optional, Union
+from functools import lru_cache
+import numpy as np
+
+
+@lru_cache(maxsize=None)
+def _sign_code_lookup(category_mapping_path: str) -> np.ndarray:
+    '''
+    Returns an array mapping class IDs to sign codes, for vectorized lookups.
+    '''
+    category_mapping = load_category_mapping(category_mapping_path)
+    lookup = np.full(max(category_mapping) + 1, None, dtype=object)
+    for class_id, sign_code in category_mapping.items():
+        lookup[class_id] = sign_code
+    return lookup
+
+
+class Detections:
+    """
+    Class representing the traffic signs detected in an image, backed by NumPy arrays.
+
+    Filtering, normalization and denormalization are vectorized over all the boxes. The
+    `YOLOPrediction` of a box, with its `TrafficSign` and `BBox`, is only created when it is
+    accessed, so that a `Detections` can be used wherever a list of predictions is expected.
+    Slicing it returns a `Detections` of the selected boxes.
+
+    Parameters
+    ----------
+    class_ids: np.ndarray
+        Class IDs of the detected objects, shape (N,).
+    confidences: np.ndarray
+        Confidence scores of the detections, shape (N,).
+    xywh: np.ndarray
+        Bounding boxes in YOLO format (x_center, y_center, width, height), shape (N, 4).
+    normalized_bbox: bool
+        Flag indicating whether the bounding box coordinates are normalized.
+    """
+
+    def __init__(self, class_ids: np.ndarray, confidences: np.ndarray, xywh: np.ndarray,
+                 normalized_bbox: bool = False):
+        self.class_ids = np.asarray(class_ids, dtype=np.int64).reshape(-1)
+        self.confidences = np.asarray(confidences, dtype=np.float32).reshape(-1)
+        self.xywh = np.asarray(xywh, dtype=np.float32).reshape(-1, 4)
+        self.normalized_bbox = normalized_bbox
+        self._predictions: List[Optional[YOLOPrediction]] = [None] * len(self.class_ids)
+
+    @classmethod
+    def from_boxes(cls, boxes) -> 'Detections':
+        '''
+        Creates the detections from the `Boxes` of an ultralytics result, moving all the tensors to the CPU at once.
+        '''
+        return cls(boxes.cls.cpu().numpy(), boxes.conf.cpu().numpy(), boxes.xywh.cpu().numpy())
+
+    @classmethod
+    def empty(cls) -> 'Detections':
+        return cls(np.empty(0), np.empty(0), np.empty((0, 4)))
+
+    @classmethod
+    def concatenate(cls, detections: Iterable['Detections']) -> 'Detections':
+        '''
+        Concatenates the detections of several images or tiles, which must share the same coordinate space.
+        '''
+        detections = list(detections)
+        if not detections:
+            return cls.empty()
+        return cls(np.concatenate([d.class_ids for d in detections]), np.concatenate([d.confidences for d in detections]),
+                   np.concatenate([d.xywh for d in detections]), normalized_bbox=detections[0].normalized_bbox)
+
+    def __len__(self) -> int:
+        return len(self.class_ids)
+
+    def __bool__(self) -> bool:
+        return len(self) > 0
+
+    def __iter__(self) -> Iterator[YOLOPrediction]:
+        return (self[i] for i in range(len(self)))
+
+    def __getitem__(self, index: Union[int, slice, np.ndarray, List[int]]) -> Union[YOLOPrediction, 'Detections']:
+        '''
+        Returns the prediction at an index, or the detections selected by a slice, a boolean mask or an array of indices.
+
+        Raises
+        ------
+        TypeError
+            If the index is of another type.
+        '''
+        if isinstance(index, (slice, np.ndarray, list)):
+            return self.select(index)
+        if not isinstance(index, (int, np.integer)):
+            raise TypeError(f"Detections indices must be integers, slices or arrays, not {type(index).__name__}")
+        prediction = self._predictions[index]
+        if prediction is None:
+            x, y, w, h = self.xywh[index].tolist()
+            prediction = YOLOPrediction(class_id=int(self.class_ids[index]), confidence=float(self.confidences[index]),
+                                        x=x, y=y, w=w, h=h, is_normalized_bbox=self.normalized_bbox)
+            self._predictions[index] = prediction
+        return prediction
+
+    def __repr__(self) -> str:
+        return f"{self.__class__.__name__}(sign_codes={self.sign_codes}, confidences={self.confidences.tolist()})"
+
+    @property
+    def sign_codes(self) -> List[str]:
+        '''
+        The sign codes of the detections.
+        '''
+        return _sign_code_lookup(settings.category_mapping_path)[self.class_ids].tolist()
+
+    def select(self, mask: Union[np.ndarray, List[int]]) -> 'Detections':
+        '''
+        Returns the detections selected by a boolean mask or an array of indices.
+        '''
+        return Detections(self.class_ids[mask], self.confidences[mask], self.xywh[mask], normalized_bbox=self.normalized_bbox)
+
+    def filter_confidence(self, confidence_threshold: float) -> 'Detections':
+        '''
+        Returns the detections with a confidence above the threshold.
+        '''
+        return self.select(self.confidences > confidence_threshold)
+
+    def normalize(self, width: int, height: int) -> 'Detections':
+        '''
+        Returns the detections with the bounding boxes normalized by the given image width and height.
+
+        Raises
+        ------
+        ValueError
+            If the provided width and height do not match the bounding box coordinates.
+        '''
+        xywh = self.xywh / np.array([width, height, width, height], dtype=np.float32)
+        if np.any(xywh > 1):
+            raise ValueError("Provided width and height do not match the bounding box coordinates")
+        return Detections(self.class_ids, self.confidences, xywh, normalized_bbox=True)
+
+    def denormalize(self, width: int, height: int) -> 'Detections':
+        '''
+        Returns the detections with the bounding boxes scaled to the given image width and height.
+        '''
+        xywh = self.xywh * np.array([width, height, width, height], dtype=np.float32)
+        return Detections(self.class_ids, self.confidences, xywh, normalized_bbox=False)
+
+    def scale(self, scale_x: float, scale_y: float) -> 'Detections':
+        '''
+        Returns the detections with the bounding boxes scaled by the given horizontal and vertical factors.
+        '''
+        if scale_x == 1 and scale_y == 1:
+            return self
+        xywh = self.xywh * np.array([scale_x, scale_y, scale_x, scale_y], dtype=np.float32)
+        return Detections(self.class_ids, self.confidences, xywh, normalized_bbox=self.normalized_bbox)
+
+    def translate(self, dx: float, dy: float) -> 'Detections':
+        '''
+        Returns the detections with the bounding boxes moved by the given offsets, e.g. from tile to frame coordinates.
+        '''
+        if dx == 0 and dy == 0:
+            return self
+        xywh = self.xywh + np.array([dx, dy, 0, 0], dtype=np.float32)
+        return Detections(self.class_ids, self.confidences, xywh, normalized_bbox=self.normalized_bbox)
+
+    def nms(self, threshold: float, metric: Literal['iou', 'ios'] = 'iou', class_aware: bool = True) -> 'Detections':
+        '''
+        Returns the detections left by greedy non-maximum suppression, keeping the most confident of overlapping boxes.
+
+        Parameters
+        ----------
+        threshold: float
+            The overlap above which the less confident box is suppressed.
+        metric: Literal['iou', 'ios']
+            The overlap measure: intersection over union, or intersection over the smaller box,
+            which also merges a box cut by a tile border with the whole box from another tile.
+        class_aware: bool
+            Only suppress boxes of the same class.
+        '''
+        if len(self) < 2:
+            return self
+
+        half_wh = self.xywh[:, 2:] / 2
+        top_left, bottom_right = self.xywh[:, :2] - half_wh, self.xywh[:, :2] + half_wh
+        areas = self.xywh[:, 2] * self.xywh[:, 3]
+
+        suppressed = np.zeros(len(self), dtype=bool)
+        keep = []
+        for i in np.argsort(-self.confidences, kind='stable'):
+            if suppressed[i]:
+                continue
+            keep.append(i)
+            intersection_wh = np.clip(np.minimum(bottom_right[i], bottom_right) - np.maximum(top_left[i], top_left), 0, None)
+            intersection = intersection_wh[:, 0] * intersection_wh[:, 1]
+            if metric == 'iou':
+                overlap = intersection / np.maximum(areas[i] + areas - intersection, 1e-9)
+            else:
+                overlap = intersection / np.maximum(np.minimum(areas[i], areas), 1e-9)
+            suppress = overlap > threshold
+            if class_aware:
+                suppress &= self.class_ids == self.class_ids[i]
+            suppressed |= suppress
+        return self.select(np.array(keep, dtype=np.int64))
+
+    def to_list(self, describe: bool = False) -> List[dict]:
+        '''
+        Returns the class ID, sign code, confidence and bounding box of every detection as JSON-serializable values,
+        without creating the per-box objects.
+
+        Parameters
+        ----------
+        describe: bool
+            Also include the name, category, description and image of each sign from the sign metadata store.
+        '''
+        detections = [
+            {'class_id': class_id, 'sign_code': sign_code, 'confidence': confidence, 'bbox': bbox}
+            for class_id, sign_code, confidence, bbox in zip(self.class_ids.tolist(), self.sign_codes,
+                                                             self.confidences.tolist(), self.xywh.tolist())
+        ]
+        if describe:
+            with stage('sign_metadata'):
+                store = get_sign_metadata_store()
+                for detection in detections:
+                    metadata = store.get(detection['sign_code']) or {}
+                    detection.update({field: metadata.get(field) for field in ('name', 'category', 'description', 'sign_image')})
+        return detections
@@ -0,0 +1,38 @@
+from src.models.types.Detections import Detections
+from typing import Literal, Optional
+
+PredictionMode = Literal['detect', 'describe', 'full']
+
+
+class Prediction:
+    """
+    Class representing the result of the Driving Assistant for an image.
+
+    Parameters
+    ----------
+    mode: PredictionMode
+        What was predicted: `detect` only runs object detection, `describe` also looks up the
+        metadata of the detected signs, and `full` also generates the hints with the LLM.
+    detections: Detections
+        The detected traffic signs.
+    hints: Optional[str]
+        The hints generated by the LLM, only in `full` mode.
+    cacheable: bool
+        Whether the prediction may be reused for the same frame, False if the hints are the fallback hints
+        or were generated with a non-zero temperature.
+    """
+
+    def __init__(self, mode: PredictionMode, detections: Detections, hints: Optional[str] = None, cacheable: bool = True):
+        self.mode = mode
+        self.detections = detections
+        self.hints = hints
+        self.cacheable = cacheable
+
+    def to_dict(self) -> dict:
+        '''
+        Returns the detections, described unless in `detect` mode, and the hints as JSON-serializable values.
+        '''
+        prediction = {'mode': self.mode, 'detections': self.detections.to_list(describe=self.mode != 'detect')}
+        if self.mode == 'full':
+            prediction['hints'] = self.hints
+        return prediction
@@ -1,10 +1,18 @@
 from src.config.settings import settings
-from pydantic import BaseModel, model_validator, Field
-from typing import Optional
-import requests as req
+from src.models.SignMetadataStore import SignMetadataStore, get_sign_metadata_store
+from pydantic import BaseModel, model_validator, Field, PrivateAttr
+from typing import Dict, Optional
+from functools import lru_cache
 import json
-from bs4 import BeautifulSoup
-import re
+
+
+@lru_cache(maxsize=None)
+def load_category_mapping(path: str = settings.category_mapping_path) -> Dict[int, str]:
+    '''
+    Loads the mapping of class IDs to sign codes, parsing the file only once per path.
+    '''
+    with open(path, 'r') as f:
+        return {int(k): v for k, v in json.load(f).items()}
 
 
 class TrafficSign(BaseModel):
@@ -34,17 +42,17 @@ class TrafficSign(BaseModel):
     sign_code: Optional[str] = Field(None)
     class_id: Optional[int] = Field(None)
     category_mapping: dict = Field(None)
-    sign_info_url_template: str = Field(None)
-    sign_image_url_template: str = Field(None)
+
+    _sign_metadata: SignMetadataStore = PrivateAttr(None)
 
     @model_validator(mode='before')
     def validate_sign(cls, values):
         class_id = values.get('class_id')
         sign_code = values.get('sign_code')
-        if not class_id and not sign_code:
+        if class_id is None and not sign_code:
             raise ValueError("Either 'class_id' or 'sign_code' must be provided.")
 
-        if class_id and class_id not in values['category_mapping'].keys():
+        if class_id is not None and class_id not in values['category_mapping'].keys():
             raise ValueError(f'Invalid class ID: {class_id}')
         if sign_code and sign_code not in values['category_mapping'].values():
             raise ValueError(f'Invalid sign code: {sign_code}')
@@ -52,9 +60,8 @@ class TrafficSign(BaseModel):
         return values
 
     def __init__(self, class_id: Optional[int] = None, sign_code: Optional[str] = None,
-                 category_mapping=json.load(open(settings.category_mapping_path, 'r')),
-                 sign_info_url_template=settings.sign_info_url_template,
-                 sign_image_url_template=settings.sign_image_url_template):
+                 category_mapping: Optional[Dict[int, str]] = None,
+                 sign_metadata: Optional[SignMetadataStore] = None):
         """
         Initializes the traffic sign with either `class_id` or `sign_code`.
 
@@ -64,6 +71,10 @@ class TrafficSign(BaseModel):
             The class ID of the traffic sign (optional).
         sign_code: Optional[str]
             The sign code of the traffic sign (optional).
+        category_mapping: Optional[Dict[int, str]]
+            The mapping of class IDs to sign codes. Defaults to the mapping loaded from the settings.
+        sign_metadata: Optional[SignMetadataStore]
+            The store to read the sign metadata from. Defaults to the process-wide store.
 
         Raises
         ------
@@ -71,86 +82,32 @@ class TrafficSign(BaseModel):
             If neither `class_id` nor `sign_code` is provided.
         """
 
-        category_mapping = {int(k): v for k, v in category_mapping.items()}
-        super().__init__(class_id=class_id, sign_code=sign_code,
-                         category_mapping=category_mapping,
-                         sign_info_url_template=sign_info_url_template,
-                         sign_image_url_template=sign_image_url_template)
-
         # Convert the keys of the category mapping to integers
+        category_mapping = load_category_mapping() if category_mapping is None else {int(k): v for k, v in category_mapping.items()}
+        super().__init__(class_id=class_id, sign_code=sign_code,
+                         category_mapping=category_mapping)
+        self._sign_metadata = sign_metadata
 
-        if class_id:
+        if class_id is not None:
             self.sign_code = category_mapping[class_id]
         if sign_code:
             self.class_id = [k for k, v in category_mapping.items() if v == sign_code][0]
 
         self.load_sign_info()
 
-    def _filter_markdown(self, text):
-        '''
-        Removes markdown syntax like \\n, asterisks, and square brackets and etc.
-        '''
-        # Regex pattern to match markdown syntax like \\n, asterisks, and square brackets
-        pattern = r'[\[\]\*]'
-        return re.sub(pattern, '', text).replace('\\n', ' ').strip()
-
-    def _filter_sign_code(self, text):
-        """
-        Removes sign codes (e.g., '5.1.2', '1.1') from the beginning of the text.
-
-        Parameters
-        ----------
-        text : str
-            Input text containing sign code and description.
-
-        Returns
-        -------
-        str
-            Text with the sign code removed.
-        """
-        # Regex pattern to match sign codes like '5.1.2' or '1.1'
-        text = self._filter_markdown(text)
-        pattern = r'^\d+(\.\d+)*\s+'
-        return re.sub(pattern, '', text)
+    @property
+    def sign_metadata(self) -> SignMetadataStore:
+        return self._sign_metadata if self._sign_metadata is not None else get_sign_metadata_store()
 
     def load_sign_info(self):
         '''
-        Fetches the description and image of the traffic sign.
+        Fills the description, image, category and name of the traffic sign from the sign metadata store.
         '''
-        sign_category = self.sign_code.split('.')[0]
-        sign_info_url = self.sign_info_url_template.format(category=sign_category, sign_code=self.sign_code)
-        response = req.get(sign_info_url)
-
-        if response.status_code != 200:
+        sign_info = self.sign_metadata.get(self.sign_code)
+        if sign_info is None:
             return None
 
-        soup = BeautifulSoup(response.text, 'html.parser')
-
-        # Fetch the description
-        try:
-            description = self._filter_markdown(soup.find('div', class_='mark_markpage_block').find('p').text)
-        except AttributeError:
-            description = None
-
-        # Fetch the image source
-        try:
-            img_source = soup.find('div', class_='contain_mar').find('img')['src'][1:]
-        except AttributeError:
-            img_source = None
-
-        # Fetch the category
-        try:
-            category = self._filter_markdown(soup.find('div', class_='title_pdr').find('h1').text)
-        except AttributeError:
-            category = None
-
-        # Fetch the sign name
-        try:
-            name = self._filter_sign_code(soup.find('div', class_='mark-markpage').find('h2').text)
-        except AttributeError:
-            name = None
-
-        self.name = name
-        self.sign_image = self.sign_image_url_template.format(image_source=img_source)
-        self.description = description
-        self.category = category
+        self.name = sign_info['name']
+        self.sign_image = sign_info['sign_image']
+        self.description = sign_info['description']
+        self.category = sign_info['category']
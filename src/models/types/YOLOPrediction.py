@@ -71,6 +71,17 @@ class YOLOPrediction(BaseModel):
         self.traffic_sign = TrafficSign(class_id=class_id)
         self.bbox = BBox(x=x, y=y, w=w, h=h, is_normalized_bbox=is_normalized_bbox)
 
+    def to_dict(self) -> dict:
+        '''
+        Returns the sign code, confidence and bounding box of the prediction as JSON-serializable values.
+        '''
+        return {
+            'class_id': self.traffic_sign.class_id,
+            'sign_code': self.traffic_sign.sign_code,
+            'confidence': float(self.confidence),
+            'bbox': [float(v) for v in self.bbox],
+        }
+
     def __getattr__(self, name):
         # Forward property access to the nested objects if they exist
         if hasattr(self.traffic_sign, name):
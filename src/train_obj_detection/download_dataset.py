@@ -0,0 +1,42 @@
+'''
+Downloads the traffic signs dataset from Roboflow in the YOLO format.
+
+The Roboflow API key is read from the ROBOFLOW_API_KEY environment variable, or from the
+`src/train_obj_detection/.env` file (see `example.env`).
+
+Usage:
+    python -m src.train_obj_detection.download_dataset [--output-dir src/train_obj_detection/datasets]
+
+Requires `pip install roboflow python-dotenv`.
+'''
+
+import argparse
+import os
+
+WORKSPACE = 'radu-oprea-r4xnm'
+PROJECT = 'traffic-signs-detection-europe'
+VERSION = 14
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Download the traffic signs dataset from Roboflow')
+    parser.add_argument('--output-dir', default='src/train_obj_detection/datasets')
+    parser.add_argument('--version', type=int, default=VERSION, help='Version of the Roboflow dataset')
+    args = parser.parse_args()
+
+    from roboflow import Roboflow
+    from dotenv import load_dotenv
+
+    load_dotenv(os.path.join(os.path.dirname(__file__), '.env'))
+    api_key = os.getenv('ROBOFLOW_API_KEY')
+    if not api_key:
+        raise SystemExit('ROBOFLOW_API_KEY is not set, see src/train_obj_detection/example.env')
+
+    project = Roboflow(api_key=api_key).workspace(WORKSPACE).project(PROJECT)
+    location = os.path.join(args.output_dir, f'Traffic-Signs-Detection-Europe-{args.version}')
+    dataset = project.version(args.version).download('yolov9', location=location)
+    print(f"Dataset downloaded to {dataset.location}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,174 @@
+'''
+Evaluates object detection weights and writes a single report combining the accuracy per sign class
+with the inference latency of the served model.
+
+The mAP is computed by the ultralytics validator on a split of the dataset, per class and overall.
+The latency is measured through `YOLOModel.detect_traffic_signs`, like the API serves it, on frames of
+IMAGE_WIDTH x IMAGE_HEIGHT. The report is written as JSON, and the per-class rows also as CSV.
+
+Usage:
+    python -m src.train_obj_detection.evaluate [--weights PATH] [--data DATA_YAML] [--split val] [--output-dir runs/eval]
+'''
+
+from ultralytics import YOLO
+from src.models.YOLOModel import YOLOModel
+from src.models.types.TrafficSign import load_category_mapping
+from src.config.settings import settings
+from typing import Dict, List, Optional
+from datetime import datetime, timezone
+from PIL import Image
+import numpy as np
+import argparse
+import time
+import json
+import csv
+import os
+
+DEFAULT_DATA = 'src/train_obj_detection/datasets/Traffic-Signs-Detection-Europe-14/data.yaml'
+
+
+def evaluate_accuracy(weights_path: str, data: str, split: str = 'val', batch: int = 16, workers: int = 8,
+                      device: Optional[str] = None) -> dict:
+    '''
+    Computes the mAP of the weights on a split of the dataset, overall and per class.
+
+    Returns
+    -------
+    dict
+        The overall metrics, the validator speed per image and a row per class with labels in the split.
+    '''
+    category_mapping = load_category_mapping()
+    model = YOLO(model=weights_path, task='detect')
+    metrics = model.val(data=os.path.abspath(data), split=split, imgsz=max(settings.image_width, settings.image_height),
+                        batch=batch, workers=workers, device=device, plots=False, verbose=False)
+
+    classes = []
+    for i, class_id in enumerate(metrics.box.ap_class_index):
+        precision, recall, map50, map50_95 = metrics.box.class_result(i)
+        classes.append({
+            'class_id': int(class_id),
+            'sign_code': category_mapping.get(int(class_id), metrics.names[int(class_id)]),
+            'precision': float(precision),
+            'recall': float(recall),
+            'map50': float(map50),
+            'map50_95': float(map50_95),
+        })
+
+    return {
+        'precision': float(metrics.box.mp),
+        'recall': float(metrics.box.mr),
+        'map50': float(metrics.box.map50),
+        'map50_95': float(metrics.box.map),
+        'val_speed_ms': {stage: float(ms) for stage, ms in metrics.speed.items()},
+        'classes': classes,
+    }
+
+
+def measure_latency(weights_path: str, runs: int = 50, warmup: int = 3) -> Dict[str, float]:
+    '''
+    Measures the latency of `YOLOModel.detect_traffic_signs` on IMAGE_WIDTH x IMAGE_HEIGHT frames.
+    '''
+    yolo_model = YOLOModel(weights_path=weights_path, engine='torch', parity_check=False)
+    rng = np.random.default_rng(0)
+    frame = Image.fromarray(rng.integers(0, 256, (settings.image_height, settings.image_width, 3), dtype=np.uint8))
+
+    for _ in range(warmup):
+        yolo_model.detect_traffic_signs(frame)
+    latencies_ms = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        yolo_model.detect_traffic_signs(frame)
+        latencies_ms.append((time.perf_counter() - start) * 1000)
+
+    return {
+        'device': yolo_model.device,
+        'runs': runs,
+        'mean_ms': float(np.mean(latencies_ms)),
+        'p50_ms': float(np.percentile(latencies_ms, 50)),
+        'p99_ms': float(np.percentile(latencies_ms, 99)),
+    }
+
+
+def evaluate(weights_path: str, data: str, split: str = 'val', latency_runs: int = 50, batch: int = 16,
+             workers: int = 8, device: Optional[str] = None) -> dict:
+    '''
+    Evaluates the accuracy and the latency of the weights.
+
+    Parameters
+    ----------
+    weights_path: str
+        The path to the PyTorch weights.
+    data: str
+        The dataset YAML file.
+    split: str
+        The split of the dataset the mAP is computed on.
+    latency_runs: int
+        The number of frames the latency is measured on.
+    batch: int
+        The batch size of the validation.
+    workers: int
+        The number of dataloader workers of the validation.
+    device: Optional[str]
+        The device of the validation, e.g. `cpu`. Defaults to the first GPU if there is one.
+
+    Returns
+    -------
+    dict
+        The report.
+    '''
+    return {
+        'created_at': datetime.now(timezone.utc).isoformat(),
+        'weights_path': weights_path,
+        'data': data,
+        'split': split,
+        'image_size': [settings.image_width, settings.image_height],
+        **evaluate_accuracy(weights_path, data, split, batch=batch, workers=workers, device=device),
+        'latency': measure_latency(weights_path, runs=latency_runs),
+    }
+
+
+def write_report(report: dict, output_dir: str):
+    '''
+    Writes the report as `report.json`, and its per-class rows as `classes.csv`.
+    '''
+    os.makedirs(output_dir, exist_ok=True)
+    with open(os.path.join(output_dir, 'report.json'), 'w') as f:
+        json.dump(report, f, indent=2)
+
+    rows: List[dict] = report['classes']
+    with open(os.path.join(output_dir, 'classes.csv'), 'w', newline='') as f:
+        writer = csv.DictWriter(f, fieldnames=['class_id', 'sign_code', 'precision', 'recall', 'map50', 'map50_95'])
+        writer.writeheader()
+        writer.writerows(rows)
+
+
+def print_report(report: dict):
+    for row in sorted(report['classes'], key=lambda row: row['map50_95']):
+        print(f"{row['class_id']:>4}  {row['sign_code']:>8}  P {row['precision']:.3f}  R {row['recall']:.3f}  "
+              f"mAP50 {row['map50']:.3f}  mAP50-95 {row['map50_95']:.3f}")
+    latency = report['latency']
+    print(f"mAP50 {report['map50']:.4f}  mAP50-95 {report['map50_95']:.4f}  over {len(report['classes'])} classes")
+    print(f"Latency at {report['image_size'][0]}x{report['image_size'][1]} on {latency['device']}: "
+          f"p50 {latency['p50_ms']:.1f} ms, p99 {latency['p99_ms']:.1f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Evaluate the mAP per sign class and the inference latency of object detection weights')
+    parser.add_argument('--weights', default=settings.obj_detect_weights_path, help='Path to the PyTorch weights')
+    parser.add_argument('--data', default=DEFAULT_DATA, help='Dataset YAML file')
+    parser.add_argument('--split', default='val', help='Dataset split the mAP is computed on')
+    parser.add_argument('--latency-runs', type=int, default=50, help='Number of frames the latency is measured on')
+    parser.add_argument('--batch', type=int, default=16)
+    parser.add_argument('--workers', type=int, default=min(8, os.cpu_count() or 1), help='Number of dataloader workers')
+    parser.add_argument('--device', default=None, help='Device of the validation, e.g. cpu or 0')
+    parser.add_argument('--output-dir', default='runs/eval', help='Directory of the JSON and CSV reports')
+    args = parser.parse_args()
+
+    report = evaluate(args.weights, args.data, args.split, args.latency_runs, args.batch, args.workers, args.device)
+    write_report(report, args.output_dir)
+    print_report(report)
+    print(f"Report written to {args.output_dir}/report.json and classes.csv")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,126 @@
+'''
+Builds FP16 and INT8 variants of the object detection weights and reports their accuracy and CPU latency.
+
+Variants:
+    torch-fp32       the PyTorch weights, as the baseline
+    onnx-fp32        exported for ONNX Runtime
+    onnx-int8        ONNX weights with dynamic INT8 quantization
+    openvino-fp16    exported for OpenVINO with FP16 weights
+    openvino-int8    exported for OpenVINO with static INT8 quantization, calibrated on the dataset
+
+Every variant is written next to the PyTorch weights and can be served by setting
+OBJ_DETECT_WEIGHTS_PATH to its path. The mAP of each variant is evaluated on the dataset
+downloaded by `download_dataset.py`, and the report is written as JSON and CSV.
+
+Usage:
+    python -m src.train_obj_detection.quantize [--data DATA_YAML] [--variants onnx-int8 openvino-int8]
+
+Requires `pip install onnx onnxruntime openvino nncf`. Runs on a CPU-only machine.
+'''
+
+from ultralytics import YOLO
+from src.models.export_detector import export_detector
+from src.config.settings import settings
+from typing import Callable, Dict
+import argparse
+import shutil
+import json
+import csv
+import os
+
+DEFAULT_DATA = 'src/train_obj_detection/datasets/Traffic-Signs-Detection-Europe-14/data.yaml'
+
+
+def _export_renamed(weights_path: str, engine: str, suffix: str, **kwargs) -> str:
+    '''
+    Exports the weights for an engine and renames the result so that several variants can coexist.
+    '''
+    exported_path = str(export_detector(weights_path, engine, **kwargs)).rstrip('/')
+    stem = os.path.splitext(weights_path)[0]
+    target_path = f'{stem}_{suffix}.onnx' if engine == 'onnx' else f'{stem}_{suffix}_openvino_model'
+    if os.path.isdir(target_path):
+        shutil.rmtree(target_path)
+    shutil.move(exported_path, target_path)
+    return target_path
+
+
+def build_onnx_int8(weights_path: str, data: str) -> str:
+    from onnxruntime.quantization import quantize_dynamic, QuantType
+
+    onnx_path = f'{os.path.splitext(weights_path)[0]}_fp32.onnx'
+    if not os.path.exists(onnx_path):
+        onnx_path = _export_renamed(weights_path, 'onnx', 'fp32')
+    int8_path = f'{os.path.splitext(weights_path)[0]}_int8.onnx'
+    quantize_dynamic(onnx_path, int8_path, weight_type=QuantType.QUInt8)
+    return int8_path
+
+
+VARIANTS: Dict[str, Callable[[str, str], str]] = {
+    'torch-fp32': lambda weights_path, data: weights_path,
+    'onnx-fp32': lambda weights_path, data: _export_renamed(weights_path, 'onnx', 'fp32'),
+    'onnx-int8': build_onnx_int8,
+    'openvino-fp16': lambda weights_path, data: _export_renamed(weights_path, 'openvino', 'fp16', half=True),
+    'openvino-int8': lambda weights_path, data: _export_renamed(weights_path, 'openvino', 'int8', int8=True, data=data),
+}
+
+
+def _size_mb(path: str) -> float:
+    if os.path.isdir(path):
+        return sum(os.path.getsize(os.path.join(root, name)) for root, _, names in os.walk(path) for name in names) / 2 ** 20
+    return os.path.getsize(path) / 2 ** 20
+
+
+def evaluate_variant(weights_path: str, data: str, split: str) -> Dict[str, float]:
+    '''
+    Evaluates the mAP and the per-frame CPU latency of a variant at the configured image size.
+    '''
+    model = YOLO(model=weights_path, task='detect')
+    metrics = model.val(data=data, split=split, imgsz=max(settings.image_width, settings.image_height),
+                        batch=1, device='cpu', plots=False, verbose=False)
+    return {
+        'map50': float(metrics.box.map50),
+        'map50_95': float(metrics.box.map),
+        'preprocess_ms': float(metrics.speed['preprocess']),
+        'inference_ms': float(metrics.speed['inference']),
+        'postprocess_ms': float(metrics.speed['postprocess']),
+        'frame_ms': float(sum(metrics.speed[stage] for stage in ('preprocess', 'inference', 'postprocess'))),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Quantize the object detection weights and report accuracy against speed')
+    parser.add_argument('--weights', default=settings.obj_detect_weights_path, help='Path to the PyTorch weights')
+    parser.add_argument('--data', default=DEFAULT_DATA, help='Dataset YAML file used for calibration and evaluation')
+    parser.add_argument('--split', default='val', help='Dataset split used for evaluation')
+    parser.add_argument('--variants', nargs='+', choices=list(VARIANTS), default=list(VARIANTS))
+    parser.add_argument('--output-dir', default='runs/quantize', help='Directory of the JSON and CSV reports')
+    args = parser.parse_args()
+
+    rows = []
+    for variant in args.variants:
+        print(f"Building {variant}")
+        weights_path = VARIANTS[variant](args.weights, args.data)
+        rows.append({'variant': variant, 'weights_path': weights_path, 'size_mb': _size_mb(weights_path),
+                     **evaluate_variant(weights_path, args.data, args.split)})
+
+    baseline = next((row for row in rows if row['variant'] == 'torch-fp32'), None)
+    for row in rows:
+        row['speedup'] = baseline['frame_ms'] / row['frame_ms'] if baseline and row['frame_ms'] else None
+        row['map50_95_delta'] = row['map50_95'] - baseline['map50_95'] if baseline else None
+
+    os.makedirs(args.output_dir, exist_ok=True)
+    with open(os.path.join(args.output_dir, 'report.json'), 'w') as f:
+        json.dump(rows, f, indent=2)
+    with open(os.path.join(args.output_dir, 'report.csv'), 'w', newline='') as f:
+        writer = csv.DictWriter(f, fieldnames=list(rows[0]))
+        writer.writeheader()
+        writer.writerows(rows)
+
+    for row in rows:
+        print(f"{row['variant']:>14}  mAP50-95 {row['map50_95']:.4f}  {row['frame_ms']:.1f} ms/frame  "
+              f"{row['size_mb']:.1f} MB  {row['weights_path']}")
+    print(f"Report written to {args.output_dir}/report.json and report.csv")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,156 @@
+'''
+Generates a tiny synthetic traffic sign dataset in the YOLO format, to run the training and evaluation
+pipeline end to end without downloading the Roboflow dataset.
+
+Every image is a noisy background with a few drawn signs, whose shape and colours follow their
+category (red triangles for the warning signs, red rings for the prohibitory signs, blue discs for
+the mandatory signs, ...) and whose sign code is written in the middle. The class IDs are those of
+the category mapping, so that the trained weights can be served as is.
+
+Usage:
+    python -m src.train_obj_detection.synthetic_dataset [--output-dir runs/synthetic_dataset] [--train-images 48] [--val-images 16]
+'''
+
+from src.models.types.TrafficSign import load_category_mapping
+from PIL import Image, ImageDraw, ImageFont
+from typing import List, Sequence, Tuple
+import argparse
+import random
+import json
+import math
+import os
+
+# Give way, stop, no entry, a speed limit, go straight, a warning sign
+DEFAULT_CLASS_IDS = (38, 40, 0, 9, 36, 41)
+
+
+def _polygon(cx: float, cy: float, radius: float, sides: int, rotation: float) -> List[Tuple[float, float]]:
+    return [(cx + radius * math.cos(rotation + 2 * math.pi * i / sides), cy + radius * math.sin(rotation + 2 * math.pi * i / sides))
+            for i in range(sides)]
+
+
+def draw_sign(draw: ImageDraw.ImageDraw, sign_code: str, box: Tuple[int, int, int, int]):
+    '''
+    Draws a sign of the given code in the box (left, top, right, bottom), with the shape and colours of its category.
+    '''
+    left, top, right, bottom = box
+    cx, cy, radius = (left + right) / 2, (top + bottom) / 2, (right - left) / 2
+    border = max(2, int(radius / 5))
+    category = sign_code.split('.')[0]
+
+    if sign_code == '2.2':
+        draw.polygon(_polygon(cx, cy, radius, 8, math.pi / 8), fill=(200, 20, 20))
+        text_fill = (255, 255, 255)
+    elif sign_code == '2.1':
+        draw.polygon(_polygon(cx, cy, radius, 3, math.pi / 2), fill=(200, 20, 20))
+        draw.polygon(_polygon(cx, cy, radius - 2 * border, 3, math.pi / 2), fill=(250, 250, 250))
+        text_fill = (0, 0, 0)
+    elif category == '1':
+        draw.polygon(_polygon(cx, cy, radius, 3, -math.pi / 2), fill=(200, 20, 20))
+        draw.polygon(_polygon(cx, cy, radius - 2 * border, 3, -math.pi / 2), fill=(250, 250, 250))
+        text_fill = (0, 0, 0)
+    elif category == '2':
+        draw.polygon(_polygon(cx, cy, radius, 4, 0), fill=(250, 250, 250))
+        draw.polygon(_polygon(cx, cy, radius - border, 4, 0), fill=(240, 200, 0))
+        text_fill = (0, 0, 0)
+    elif category == '3':
+        draw.ellipse(box, fill=(200, 20, 20))
+        draw.ellipse((left + border, top + border, right - border, bottom - border), fill=(250, 250, 250))
+        text_fill = (0, 0, 0)
+    elif category == '4':
+        draw.ellipse(box, fill=(20, 70, 200))
+        text_fill = (255, 255, 255)
+    else:
+        draw.rectangle(box, fill=(20, 70, 200) if category == '5' else (250, 250, 250))
+        text_fill = (255, 255, 255) if category == '5' else (0, 0, 0)
+
+    # Centered by hand, anchors are not supported by the bitmap fonts of older Pillow versions
+    font = ImageFont.load_default()
+    text_left, text_top, text_right, text_bottom = draw.textbbox((0, 0), sign_code, font=font)
+    draw.text((cx - (text_right - text_left) / 2, cy - (text_bottom - text_top) / 2), sign_code, fill=text_fill, font=font)
+
+
+def generate_image(rng: random.Random, size: int, sign_codes: Sequence[Tuple[int, str]],
+                   max_signs: int) -> Tuple[Image.Image, List[Tuple[int, float, float, float, float]]]:
+    '''
+    Generates an image and its YOLO labels: the class ID and the normalized center and size of every sign.
+    '''
+    base = tuple(rng.randint(60, 160) for _ in range(3))
+    image = Image.effect_noise((size, size), rng.uniform(10, 40)).convert('RGB')
+    image = Image.blend(image, Image.new('RGB', (size, size), base), 0.6)
+    draw = ImageDraw.Draw(image)
+
+    labels = []
+    for _ in range(rng.randint(1, max_signs)):
+        class_id, sign_code = rng.choice(sign_codes)
+        sign_size = rng.randint(size // 10, size // 3)
+        left, top = rng.randint(0, size - sign_size), rng.randint(0, size - sign_size)
+        draw_sign(draw, sign_code, (left, top, left + sign_size, top + sign_size))
+        labels.append((class_id, (left + sign_size / 2) / size, (top + sign_size / 2) / size, sign_size / size, sign_size / size))
+    return image, labels
+
+
+def generate_dataset(output_dir: str, train_images: int = 48, val_images: int = 16, image_size: int = 320,
+                     class_ids: Sequence[int] = DEFAULT_CLASS_IDS, max_signs: int = 3, seed: int = 0) -> str:
+    '''
+    Generates the train and val splits of a synthetic dataset and its `data.yaml`.
+
+    Parameters
+    ----------
+    output_dir: str
+        The directory of the dataset.
+    train_images, val_images: int
+        The number of images of each split.
+    image_size: int
+        The width and height of the images.
+    class_ids: Sequence[int]
+        The classes of the category mapping drawn in the images.
+    max_signs: int
+        The maximum number of signs per image.
+    seed: int
+        The seed of the random generator, the same seed generates the same dataset.
+
+    Returns
+    -------
+    str
+        The path of the `data.yaml` file.
+    '''
+    category_mapping = load_category_mapping()
+    sign_codes = [(class_id, category_mapping[class_id]) for class_id in class_ids]
+    rng = random.Random(seed)
+
+    for split, count in (('train', train_images), ('val', val_images)):
+        os.makedirs(os.path.join(output_dir, 'images', split), exist_ok=True)
+        os.makedirs(os.path.join(output_dir, 'labels', split), exist_ok=True)
+        for i in range(count):
+            image, labels = generate_image(rng, image_size, sign_codes, max_signs)
+            image.save(os.path.join(output_dir, 'images', split, f'{i:05d}.jpg'), quality=90)
+            with open(os.path.join(output_dir, 'labels', split, f'{i:05d}.txt'), 'w') as f:
+                f.writelines(f'{class_id} {x:.6f} {y:.6f} {w:.6f} {h:.6f}\n' for class_id, x, y, w, h in labels)
+
+    # Every class of the mapping is declared, so that the class IDs match those of the served weights
+    names = [category_mapping[class_id] for class_id in range(max(category_mapping) + 1)]
+    data_path = os.path.join(output_dir, 'data.yaml')
+    with open(data_path, 'w') as f:
+        # JSON values are valid YAML
+        f.write(f'path: {json.dumps(os.path.abspath(output_dir))}\ntrain: images/train\nval: images/val\n'
+                f'nc: {len(names)}\nnames: {json.dumps(names)}\n')
+    return data_path
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Generate a tiny synthetic traffic sign dataset in the YOLO format')
+    parser.add_argument('--output-dir', default='runs/synthetic_dataset')
+    parser.add_argument('--train-images', type=int, default=48)
+    parser.add_argument('--val-images', type=int, default=16)
+    parser.add_argument('--image-size', type=int, default=320)
+    parser.add_argument('--class-ids', type=int, nargs='+', default=list(DEFAULT_CLASS_IDS), help='Classes of the category mapping drawn in the images')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    data_path = generate_dataset(args.output_dir, args.train_images, args.val_images, args.image_size, args.class_ids, seed=args.seed)
+    print(f"Synthetic dataset written to {data_path}")
+
+
+if __name__ == '__main__':
+    main()
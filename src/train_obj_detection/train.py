@@ -0,0 +1,120 @@
+'''
+Trains the object detection model and evaluates the best weights.
+
+Decoded and resized images are cached by the dataloader (`--cache disk` writes them next to the
+images as `.npy` files, which are memory-mapped on the next epochs and runs, `--cache ram` keeps them
+in memory), so that the JPEGs are decoded and resized only once, and the batches are prepared by
+`--workers` CPU dataloader processes. After training, the best weights are evaluated with
+`evaluate.py`, and the report combining the mAP per sign class and the inference latency is written
+next to them.
+
+`--synthetic` trains on a tiny synthetic dataset generated by `synthetic_dataset.py`, from the
+architecture definition rather than pretrained weights and without the mixed precision check (which
+downloads reference weights on GPUs), to run the pipeline end to end without Roboflow access nor
+downloads. No API key is needed, FIREWORKS_API_KEY is only required to serve the fireworks LLM backend.
+
+Usage:
+    python -m src.train_obj_detection.train [--data DATA_YAML] [--model yolov10x.pt] [--epochs 100] [--save src/weights/traffic_signs_detection.pt]
+    python -m src.train_obj_detection.train --synthetic --epochs 3 --imgsz 320 --device cpu
+'''
+
+from ultralytics import YOLO
+from src.train_obj_detection.evaluate import DEFAULT_DATA, evaluate, write_report, print_report
+from src.train_obj_detection.synthetic_dataset import generate_dataset
+from src.config.settings import settings
+from typing import Optional
+import argparse
+import shutil
+import os
+
+
+def train(data: str, model: str = 'yolov10x.pt', epochs: int = 100, imgsz: int = 640, batch: int = 3,
+          workers: int = 8, cache: str = 'disk', device: Optional[str] = None, project: str = 'runs/train',
+          name: str = 'traffic_signs', plots: bool = False, amp: bool = True) -> str:
+    '''
+    Trains the model on the dataset.
+
+    Parameters
+    ----------
+    data: str
+        The dataset YAML file.
+    model: str
+        The pretrained weights (e.g. `yolov10x.pt`) or the architecture definition (e.g. `yolov8n.yaml`) to start from.
+    epochs: int
+        The number of epochs.
+    imgsz: int
+        The training image size.
+    batch: int
+        The batch size.
+    workers: int
+        The number of dataloader workers.
+    cache: str
+        Where decoded and resized images are cached: `disk`, `ram` or `none`.
+    device: Optional[str]
+        The device, e.g. `cpu` or `0`. Defaults to the first GPU if there is one.
+    project, name: str
+        The directory of the run is `project/name`.
+    plots: bool
+        Whether to save the training plots.
+    amp: bool
+        Whether to train with mixed precision on GPUs, checked first against reference weights downloaded by ultralytics.
+
+    Returns
+    -------
+    str
+        The path to the best weights.
+    '''
+    yolo_model = YOLO(model)
+    # An absolute path resolves the dataset regardless of the `datasets_dir` ultralytics setting
+    yolo_model.train(data=os.path.abspath(data), epochs=epochs, imgsz=imgsz, batch=batch, workers=workers,
+                     cache=False if cache == 'none' else cache, device=device, project=os.path.abspath(project),
+                     name=name, exist_ok=True, plots=plots, amp=amp, verbose=True)
+    return os.path.join(str(yolo_model.trainer.save_dir), 'weights', 'best.pt')
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Train the object detection model and evaluate the best weights')
+    parser.add_argument('--data', default=DEFAULT_DATA, help='Dataset YAML file, as downloaded by download_dataset.py')
+    parser.add_argument('--synthetic', action='store_true', help='Train on a generated synthetic dataset instead of --data')
+    parser.add_argument('--synthetic-dir', default='runs/synthetic_dataset', help='Directory of the synthetic dataset')
+    parser.add_argument('--model', default=None, help='Weights or architecture to start from (yolov10x.pt by default, yolov8n.yaml with --synthetic)')
+    parser.add_argument('--epochs', type=int, default=100)
+    parser.add_argument('--imgsz', type=int, default=640)
+    parser.add_argument('--batch', type=int, default=3)
+    parser.add_argument('--workers', type=int, default=min(8, os.cpu_count() or 1), help='Number of dataloader workers')
+    parser.add_argument('--cache', default='disk', choices=['disk', 'ram', 'none'], help='Cache of decoded and resized images')
+    parser.add_argument('--device', default=None, help='Device, e.g. cpu or 0')
+    parser.add_argument('--project', default='runs/train')
+    parser.add_argument('--name', default='traffic_signs')
+    parser.add_argument('--plots', action='store_true', help='Save the training plots')
+    parser.add_argument('--no-amp', action='store_true', help='Train without mixed precision, implied by --synthetic')
+    parser.add_argument('--save', default=None, help='Copy the best weights to this path, e.g. src/weights/traffic_signs_detection.pt')
+    parser.add_argument('--no-eval', action='store_true', help='Skip the evaluation of the best weights')
+    parser.add_argument('--latency-runs', type=int, default=50, help='Number of frames the latency is measured on')
+    args = parser.parse_args()
+
+    data = args.data
+    if args.synthetic:
+        data = generate_dataset(args.synthetic_dir, image_size=args.imgsz)
+        print(f"Synthetic dataset written to {data}")
+    model = args.model or ('yolov8n.yaml' if args.synthetic else 'yolov10x.pt')
+
+    weights_path = train(data, model, args.epochs, args.imgsz, args.batch, args.workers, args.cache,
+                         args.device, args.project, args.name, args.plots, amp=not (args.no_amp or args.synthetic))
+    print(f"Best weights: {weights_path}")
+    if args.save:
+        os.makedirs(os.path.dirname(os.path.abspath(args.save)), exist_ok=True)
+        shutil.copyfile(weights_path, args.save)
+        print(f"Copied to {args.save}, serve them by setting OBJ_DETECT_WEIGHTS_PATH={args.save}")
+
+    if not args.no_eval:
+        report = evaluate(weights_path, data, latency_runs=args.latency_runs, batch=args.batch,
+                          workers=args.workers, device=args.device)
+        output_dir = os.path.dirname(os.path.dirname(weights_path))
+        write_report(report, output_dir)
+        print_report(report)
+        print(f"Evaluation at {settings.image_width}x{settings.image_height} written to {output_dir}/report.json and classes.csv")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,10 @@
+import os
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+@pytest.fixture(autouse=True)
+def repo_root(monkeypatch):
+    # The settings point to files relative to the repository root, such as the category mapping
+    monkeypatch.chdir(ROOT)
@@ -0,0 +1,100 @@
+from src.models.HintCache import HintCache
+import sqlite3
+import pytest
+import time
+
+
+class Clock:
+    def __init__(self, now: float = 1000.0):
+        self.now = now
+
+    def __call__(self) -> float:
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(time, 'time', clock)
+    return clock
+
+
+def key(*sign_codes):
+    return HintCache.key(sign_codes, 'model', 0.5, 100)
+
+
+def disk_keys(path):
+    with sqlite3.connect(path) as db:
+        return [row[0] for row in db.execute('SELECT key FROM hints ORDER BY created_at')]
+
+
+def test_key_is_canonical():
+    assert HintCache.key(['3.21', '2.1', '3.21'], 'model', 0.5, 100) == HintCache.key(('2.1', '3.21'), 'model', 0.5, 100)
+    assert HintCache.key(['2.1'], 'model', 0.5, 100) != HintCache.key(['2.1'], 'model', 0.7, 100)
+
+
+def test_lru_eviction(clock):
+    cache = HintCache(max_size=2, ttl=None, path=None)
+    cache.set(key('1.1'), 'a')
+    cache.set(key('2.1'), 'b')
+    # Reading the first entry makes the second one the least recently used
+    assert cache.get(key('1.1')) == 'a'
+    cache.set(key('3.21'), 'c')
+
+    assert cache.get(key('2.1')) is None
+    assert cache.get(key('1.1')) == 'a'
+    assert cache.get(key('3.21')) == 'c'
+    stats = cache.stats()
+    assert (stats['size'], stats['hits'], stats['misses']) == (2, 3, 1)
+
+
+def test_ttl_expiry(clock):
+    cache = HintCache(max_size=10, ttl=60, path=None)
+    cache.set(key('1.1'), 'a')
+    clock.now += 30
+    cache.set(key('2.1'), 'b')
+
+    clock.now += 31
+    assert cache.get(key('1.1')) is None
+    assert cache.get(key('2.1')) == 'b'
+    assert cache.stats()['size'] == 1
+
+    clock.now += 30
+    assert cache.get(key('2.1')) is None
+    assert cache.stats()['size'] == 0
+
+
+def test_entries_survive_restarts(tmp_path, clock):
+    path = str(tmp_path / 'hints.sqlite')
+    HintCache(max_size=10, ttl=60, path=path).set(key('1.1', '2.1'), 'a')
+
+    cache = HintCache(max_size=10, ttl=60, path=path)
+    assert cache.get(key('2.1', '1.1')) == 'a'
+    clock.now += 61
+    assert HintCache(max_size=10, ttl=60, path=path).get(key('1.1', '2.1')) is None
+
+
+def test_disk_eviction(tmp_path, clock):
+    path = str(tmp_path / 'hints.sqlite')
+    # Below 100 entries the database is trimmed on every insert
+    cache = HintCache(max_size=1, ttl=None, path=path, max_disk_size=3)
+    for i in range(5):
+        clock.now += 1
+        cache.set(key(f'1.{i}'), str(i))
+
+    assert len(disk_keys(path)) == 3
+    # The oldest entries were deleted, the newest ones are read back from the database
+    assert cache.get(key('1.0')) is None
+    assert cache.get(key('1.1')) is None
+    assert [cache.get(key(f'1.{i}')) for i in range(2, 5)] == ['2', '3', '4']
+
+
+def test_disk_eviction_deletes_expired_entries(tmp_path, clock):
+    path = str(tmp_path / 'hints.sqlite')
+    cache = HintCache(max_size=10, ttl=60, path=path, max_disk_size=10)
+    cache.set(key('1.1'), 'a')
+    clock.now += 61
+    cache.set(key('2.1'), 'b')
+
+    assert len(disk_keys(path)) == 1
+    assert cache.get(key('2.1')) == 'b'
@@ -0,0 +1,68 @@
+from src.models.HintLibrary import HINT_LIBRARY_VERSION, HintLibrary, count_sign_sets, prompt_hash
+from src.config.settings import settings
+import json
+import pytest
+
+
+def build(path, llm_backend='fake'):
+    return HintLibrary(str(path)).build([('3.21',), ('2.1', '3.21')], lambda key: ' and '.join(key), 'model', llm_backend)
+
+
+def test_save_load_round_trip(tmp_path):
+    path = tmp_path / 'hint_library.json'
+    build(path).save()
+
+    library = HintLibrary(str(path)).load(llm_backend='fake')
+    assert len(library) == 2
+    assert library.version == HINT_LIBRARY_VERSION
+    assert library.prompt_hash == prompt_hash()
+    # The sign sets are canonical, whatever the order and repetitions of the sign codes
+    assert library.get(['3.21', '2.1', '3.21'], 'model') == '2.1 and 3.21'
+    assert library.get(['3.21'], 'model', generation_hash=prompt_hash()) == '3.21'
+    assert library.get(['2.1'], 'model') is None
+
+
+def test_get_checks_model_and_generation(tmp_path):
+    library = build(tmp_path / 'hint_library.json')
+    assert library.get(['3.21'], 'other model') is None
+    assert library.get(['3.21'], 'model', generation_hash='other prompt') is None
+
+
+def test_generation_hash_covers_settings():
+    assert prompt_hash() == prompt_hash(temperature=settings.temperature)
+    assert prompt_hash() != prompt_hash(prompt_template='Another prompt {road_signs}')
+    assert prompt_hash() != prompt_hash(temperature=settings.temperature + 0.1)
+    assert prompt_hash() != prompt_hash(prompt_max_tokens=settings.prompt_max_tokens + 1)
+    assert prompt_hash() != prompt_hash(prompt_category_priority=list(reversed(settings.prompt_category_priority)))
+
+
+def test_load_ignores_incompatible_libraries(tmp_path):
+    path = tmp_path / 'hint_library.json'
+    assert len(HintLibrary(str(path)).load(llm_backend='fake')) == 0
+
+    build(path).save()
+    assert len(HintLibrary(str(path)).load(llm_backend='fireworks')) == 0
+
+    with open(path) as f:
+        data = json.load(f)
+    data['prompt_hash'] = 'other prompt'
+    with open(path, 'w') as f:
+        json.dump(data, f)
+    assert len(HintLibrary(str(path)).load(llm_backend='fake')) == 0
+
+    data['version'] = HINT_LIBRARY_VERSION + 1
+    with open(path, 'w') as f:
+        json.dump(data, f)
+    with pytest.raises(ValueError):
+        HintLibrary(str(path)).load(llm_backend='fake')
+
+
+def test_count_sign_sets(tmp_path):
+    path = tmp_path / 'results.jsonl'
+    with open(path, 'w') as f:
+        for sign_codes in (['3.21', '2.1'], ['2.1', '3.21', '3.21'], ['4.3'], ['1.33', '2.1', '3.21']):
+            f.write(json.dumps({'sign_codes': sign_codes}) + '\n')
+
+    counts = count_sign_sets([str(path)], sizes=(2,))
+    assert counts[('2.1', '3.21')] == 2
+    assert ('4.3',) not in counts
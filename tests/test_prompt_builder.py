@@ -0,0 +1,84 @@
+from src.models.PromptBuilder import FULL, SHORT, NAME, PromptBuilder, estimate_tokens
+from src.models.SignMetadataStore import SignMetadataStore
+from src.models.types.Detections import Detections
+import numpy as np
+import pytest
+
+# A sign of each category: give way, no entry, go straight and a warning sign
+CLASS_IDS = {'2.1': 38, '3.21': 0, '4.3': 28, '1.33': 41}
+DESCRIPTION = 'Short first sentence. Then a much longer second sentence detailing what the driver has to do at this sign.'
+
+
+@pytest.fixture
+def sign_metadata(tmp_path):
+    store = SignMetadataStore(str(tmp_path / 'sign_metadata.json'))
+    store.signs = {sign_code: {'name': f'Sign {sign_code}', 'category': f'Category {sign_code.split(".")[0]}',
+                               'description': DESCRIPTION, 'sign_image': None}
+                   for sign_code in CLASS_IDS}
+    return store
+
+
+def detections(*signs):
+    '''
+    Builds the detections of the given (sign code, confidence) pairs.
+    '''
+    return Detections(np.array([CLASS_IDS[sign_code] for sign_code, _ in signs]),
+                      np.array([confidence for _, confidence in signs]),
+                      np.array([[10, 10, 20, 20]] * len(signs)))
+
+
+def test_rank_by_category_then_confidence(sign_metadata):
+    builder = PromptBuilder(max_tokens=1000, sign_metadata=sign_metadata)
+    road_signs = detections(('1.33', 0.9), ('3.21', 0.5), ('2.1', 0.4), ('3.21', 0.8), ('4.3', 0.95))
+    assert builder.rank(road_signs) == ['2.1', '3.21', '4.3', '1.33']
+
+    builder = PromptBuilder(max_tokens=1000, category_priority=['4', '1'], sign_metadata=sign_metadata)
+    assert builder.rank(road_signs) == ['4.3', '1.33', '3.21', '2.1']
+
+
+def test_within_budget(sign_metadata):
+    builder = PromptBuilder(max_tokens=1000, sign_metadata=sign_metadata)
+    text, tokens = builder.build(detections(('3.21', 0.5), ('2.1', 0.4), ('3.21', 0.8)))
+
+    lines = text.split('\n')
+    assert lines == [builder.fragment('2.1')[0], builder.fragment('3.21')[0]]
+    assert lines[0] == f'2.1 Sign 2.1 (Category 2): {DESCRIPTION}'
+    assert tokens == sum(estimate_tokens(line) + 1 for line in lines)
+
+
+def test_shortens_least_important_signs_first(sign_metadata):
+    builder = PromptBuilder(max_tokens=1000, sign_metadata=sign_metadata)
+    full = builder.fragment('2.1')[1]
+    short = builder.fragment('3.21', SHORT)[1]
+    assert builder.fragment('3.21', SHORT)[0] == '3.21 Sign 3.21 (Category 3): Short first sentence.'
+    assert builder.fragment('3.21', NAME)[0] == '3.21 Sign 3.21 (Category 3)'
+
+    # Room for a full fragment and a short one
+    builder.max_tokens = full + short
+    text, tokens = builder.build(detections(('3.21', 0.9), ('2.1', 0.9)))
+    assert text.split('\n') == [builder.fragment('2.1', FULL)[0], builder.fragment('3.21', SHORT)[0]]
+    assert tokens == full + short
+
+
+def test_drops_least_important_signs_last(sign_metadata):
+    builder = PromptBuilder(max_tokens=1000, sign_metadata=sign_metadata)
+    names = [builder.fragment(sign_code, NAME)[1] for sign_code in ('2.1', '3.21', '4.3', '1.33')]
+
+    # Room for the names of the first three signs only
+    builder.max_tokens = sum(names[:3])
+    text, tokens = builder.build(detections(('1.33', 0.9), ('4.3', 0.9), ('3.21', 0.9), ('2.1', 0.9)))
+    assert text.split('\n') == [builder.fragment(sign_code, NAME)[0] for sign_code in ('2.1', '3.21', '4.3')]
+    assert tokens == sum(names[:3]) <= builder.max_tokens
+
+
+def test_keeps_most_important_sign(sign_metadata):
+    builder = PromptBuilder(max_tokens=1, sign_metadata=sign_metadata)
+    text, tokens = builder.build(detections(('3.21', 0.9), ('2.1', 0.9)))
+    assert text == builder.fragment('2.1', NAME)[0]
+    assert tokens == builder.fragment('2.1', NAME)[1]
+
+
+def test_unknown_sign(sign_metadata):
+    builder = PromptBuilder(max_tokens=1000, sign_metadata=sign_metadata)
+    sign_metadata.signs.pop('4.3')
+    assert builder.fragment('4.3')[0] == '4.3 Unknown sign (Unknown category)'
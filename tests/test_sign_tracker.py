@@ -0,0 +1,85 @@
+from src.models.types.YOLOPrediction import YOLOPrediction
+from src.models.SignTracker import SignTracker
+
+# Class IDs of the signs 3.21 and 3.23 in the category mapping
+SIGN_3_21, SIGN_3_23 = 0, 1
+
+
+def prediction(class_id, x, y, size=40):
+    return YOLOPrediction(class_id, 0.9, x, y, size, size, is_normalized_bbox=False)
+
+
+def track_ids(tracker):
+    return {(track.sign_code, track.track_id) for track in tracker.tracks}
+
+
+def test_track_is_confirmed_after_min_hits():
+    tracker = SignTracker(iou_threshold=0.3, min_hits=3, max_missed=1)
+
+    assert not tracker.update([prediction(SIGN_3_21, 100, 100)])
+    assert not tracker.update([prediction(SIGN_3_21, 104, 102)])
+    assert tracker.update([prediction(SIGN_3_21, 108, 104)])
+    assert tracker.confirmed_sign_codes == ('3.21',)
+    assert len(tracker.tracks) == 1
+    assert (tracker.tracks[0].track_id, tracker.tracks[0].hits) == (1, 3)
+    # The track follows the last matched detection
+    assert tracker.tracks[0].prediction.bbox.x == 108
+
+    assert not tracker.update([prediction(SIGN_3_21, 112, 106)])
+
+
+def test_detections_are_matched_by_iou():
+    tracker = SignTracker(iou_threshold=0.3, min_hits=1, max_missed=1)
+    tracker.update([prediction(SIGN_3_21, 100, 100), prediction(SIGN_3_21, 300, 100)])
+    left, right = tracker.tracks
+
+    # The detections come in another order, each one stays with the track it overlaps
+    tracker.update([prediction(SIGN_3_21, 305, 100), prediction(SIGN_3_21, 95, 100)])
+    assert tracker.tracks == [left, right]
+    assert (left.prediction.bbox.x, right.prediction.bbox.x) == (95, 305)
+    assert (left.hits, right.hits) == (2, 2)
+
+
+def test_other_sign_code_starts_a_track():
+    tracker = SignTracker(iou_threshold=0.3, min_hits=1, max_missed=1)
+    tracker.update([prediction(SIGN_3_21, 100, 100)])
+
+    # Same box, another sign
+    assert tracker.update([prediction(SIGN_3_23, 100, 100)])
+    assert track_ids(tracker) == {('3.21', 1), ('3.23', 2)}
+    assert tracker.confirmed_sign_codes == ('3.21', '3.23')
+
+
+def test_low_iou_starts_a_track():
+    tracker = SignTracker(iou_threshold=0.3, min_hits=2, max_missed=1)
+    tracker.update([prediction(SIGN_3_21, 100, 100)])
+    tracker.update([prediction(SIGN_3_21, 130, 100)])
+
+    assert track_ids(tracker) == {('3.21', 1), ('3.21', 2)}
+    assert tracker.confirmed_sign_codes == ()
+
+
+def test_track_is_dropped_after_max_missed():
+    tracker = SignTracker(iou_threshold=0.3, min_hits=1, max_missed=2)
+    tracker.update([prediction(SIGN_3_21, 100, 100)])
+
+    assert not tracker.update([])
+    assert not tracker.update([])
+    assert tracker.tracks[0].missed == 2
+    assert tracker.update([])
+    assert tracker.tracks == []
+
+    # A new detection starts a new track
+    tracker.update([prediction(SIGN_3_21, 100, 100)])
+    assert track_ids(tracker) == {('3.21', 2)}
+
+
+def test_missed_frames_are_reset_by_a_match():
+    tracker = SignTracker(iou_threshold=0.3, min_hits=1, max_missed=1)
+    tracker.update([prediction(SIGN_3_21, 100, 100)])
+    tracker.update([])
+    tracker.update([prediction(SIGN_3_21, 100, 100)])
+    tracker.update([])
+
+    assert track_ids(tracker) == {('3.21', 1)}
+    assert tracker.tracks[0].missed == 1
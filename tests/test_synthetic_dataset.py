@@ -0,0 +1,59 @@
+from src.train_obj_detection.synthetic_dataset import DEFAULT_CLASS_IDS, generate_dataset
+from src.models.types.TrafficSign import load_category_mapping
+from PIL import Image
+import json
+import os
+
+
+def read_labels(path):
+    with open(path) as f:
+        return [line.split() for line in f.read().splitlines()]
+
+
+def test_labels_are_valid(tmp_path):
+    generate_dataset(str(tmp_path), train_images=4, val_images=2, image_size=64, seed=0)
+
+    for split, count in (('train', 4), ('val', 2)):
+        names = sorted(os.listdir(tmp_path / 'images' / split))
+        assert names == [f'{i:05d}.jpg' for i in range(count)]
+        assert sorted(os.listdir(tmp_path / 'labels' / split)) == [f'{i:05d}.txt' for i in range(count)]
+
+        for name in names:
+            with Image.open(tmp_path / 'images' / split / name) as image:
+                assert image.size == (64, 64)
+
+            labels = read_labels(tmp_path / 'labels' / split / name.replace('.jpg', '.txt'))
+            assert 1 <= len(labels) <= 3
+            for label in labels:
+                assert len(label) == 5
+                class_id, (x, y, w, h) = int(label[0]), map(float, label[1:])
+                assert class_id in DEFAULT_CLASS_IDS
+                assert 0 < w <= 1 and 0 < h <= 1
+                # The box lies within the image, up to the rounding of the label
+                assert x - w / 2 >= -1e-6 and x + w / 2 <= 1 + 1e-6
+                assert y - h / 2 >= -1e-6 and y + h / 2 <= 1 + 1e-6
+
+
+def test_data_yaml_declares_every_class(tmp_path):
+    data_path = generate_dataset(str(tmp_path), train_images=1, val_images=1, image_size=64, seed=0)
+    category_mapping = load_category_mapping()
+
+    with open(data_path) as f:
+        data = dict(line.split(': ', 1) for line in f.read().splitlines())
+    names = json.loads(data['names'])
+    assert json.loads(data['path']) == os.path.abspath(tmp_path)
+    assert (data['train'], data['val']) == ('images/train', 'images/val')
+    assert int(data['nc']) == len(names) == max(category_mapping) + 1
+    for class_id in DEFAULT_CLASS_IDS:
+        assert names[class_id] == category_mapping[class_id]
+
+
+def test_same_seed_same_dataset(tmp_path):
+    generate_dataset(str(tmp_path / 'a'), train_images=3, val_images=1, image_size=64, class_ids=(0, 1), seed=7)
+    generate_dataset(str(tmp_path / 'b'), train_images=3, val_images=1, image_size=64, class_ids=(0, 1), seed=7)
+
+    for split, count in (('train', 3), ('val', 1)):
+        for i in range(count):
+            labels = read_labels(tmp_path / 'a' / 'labels' / split / f'{i:05d}.txt')
+            assert labels == read_labels(tmp_path / 'b' / 'labels' / split / f'{i:05d}.txt')
+            assert {int(label[0]) for label in labels} <= {0, 1}